@@ -1,11 +1,31 @@
+from components.startup import preload, profile, start_warm_up  # first: times the imports below
 import dash
 from dash import html, dcc, page_container
-from components.logger import setup_logging
+from components.logger import logger, setup_logging
+from components.fetch_pollutant import station_catalogue
+from components.http_cache import client_cache_stats, http_get
+from components.metrics import REGISTRY, gauges, instrument
+from components.province_geometry import GEOJSON_ROUTE, geojson_view, warm_cache
+from components.export_service import EXPORT_ROUTE, export_view, exports
 from dash import Input, Output, State, callback, no_update
 setup_logging()
+profile.mark("imports")
 
+# The pages load no data at import: their layouts are functions reading the caches the warm-up fills
 app = dash.Dash(__name__, use_pages=True, suppress_callback_exceptions=True)
 server = app.server
+profile.mark("pages")
+
+# Prometheus metrics at /metrics: latency per page route and per callback, API client cache
+instrument(server, "dash")
+REGISTRY.collector(lambda: gauges("geoair_http_client_cache", "API responses cached by the pages", client_cache_stats()))
+REGISTRY.collector(lambda: gauges("geoair_exports", "Map exports", exports.stats()))
+REGISTRY.collector(profile.metrics)
+
+# Simplified province shapes of the map page, one file per zoom level (cached by the browser)
+server.add_url_rule(GEOJSON_ROUTE, "province_geojson", geojson_view)
+# Map exports built in the background (components/export_service.py)
+server.add_url_rule(EXPORT_ROUTE, "export_download", export_view)
 
 
 app.layout = html.Div([
@@ -155,6 +175,21 @@ def update_logout_button_visibility(session_data):
         }
     return {"display": "none"}
 
+# Warm-up (components/startup.py, GEOAIR_WARMUP): what the first visits and callbacks would wait for
+def warm_catalogue():
+    station_catalogue.refresh()   # direct: first-use loads are throttled to one attempt every 10 s
+    return station_catalogue.ready()
+
+WARMUP_STEPS = [
+    ("station catalogue", warm_catalogue),
+    ("province list", lambda: http_get("http://localhost:5001/api/provinces").ok),
+    ("province geometry", warm_cache),
+    ("modules", lambda: preload("plotly.express", "geopandas", "pyarrow")),
+]
+profile.mark("layout")
+logger.info(profile.report())
+start_warm_up(WARMUP_STEPS)
+
 if __name__ == "__main__":
     print("🚀 GeoAir in esecuzione su http://127.0.0.1:8000")
     app.run(debug=True, port=8000)
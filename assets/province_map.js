@@ -0,0 +1,48 @@
+/* assets/province_map.js
+   Functions of the province GeoJSON layer of the map page (dash-leaflet resolves
+   {"variable": "geoair.<name>"} props to them). The shapes are loaded once and keyed by
+   province abbreviation (feature id); callbacks only change the layer's `hideout`:
+       {values: {sigla: mean}, breaks: [b0, ..., bn], colors: [c0, ..., cn-1]}
+   and the provinces are coloured and labelled here. */
+window.geoair = Object.assign(window.geoair || {}, {
+    MISSING_COLOR: "#cccccc",
+
+    // colour of the first class whose upper bound is >= `value` (above the scale: last colour)
+    provinceColor: function (value, hideout) {
+        const breaks = hideout.breaks || [];
+        const colors = hideout.colors || [];
+        if (value === undefined || value === null || !colors.length) {
+            return window.geoair.MISSING_COLOR;
+        }
+        for (let i = 0; i < colors.length; i++) {
+            if (value <= breaks[i + 1]) {
+                return colors[i];
+            }
+        }
+        return colors[colors.length - 1];
+    },
+
+    // no values: provinces hidden
+    provinceStyle: function (feature, context) {
+        const hideout = context.hideout || {};
+        if (!hideout.values) {
+            return {opacity: 0, fillOpacity: 0};
+        }
+        return {
+            fillColor: window.geoair.provinceColor(hideout.values[feature.id], hideout),
+            fillOpacity: 0.7,
+            color: "black",
+            weight: 1,
+            opacity: 1
+        };
+    },
+
+    provinceTooltip: function (feature, layer, context) {
+        const values = (context.hideout || {}).values;
+        if (values) {
+            const value = values[feature.id];
+            const text = (value === undefined || value === null) ? "No data" : value.toFixed(2);
+            layer.bindTooltip(feature.properties.name + ": " + text, {sticky: true});
+        }
+    }
+});
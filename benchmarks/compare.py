@@ -0,0 +1,85 @@
+"""
+Compare two benchmark runs of benchmarks/run.py and flag the regressions.
+A benchmark regresses when a compared statistic (p50 and p95 by default) grew by more than
+`--threshold` (relative) and by more than `--min-ms` (absolute, so sub-millisecond noise is ignored).
+Exits with status 1 when something regressed, so it can gate a CI job.
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+    python -m benchmarks.compare before.json after.json --threshold 0.2 --metric p50_ms --only api.
+"""
+
+import argparse
+import sys
+
+from benchmarks.harness import load_results
+
+
+def compare(baseline, current, metrics=("p50_ms", "p95_ms"), threshold=0.10, min_ms=0.5, prefix=None):
+    """
+    Rows (name, metric, before, after, relative change, status) for the benchmarks of both runs;
+    status is 'regression', 'improvement', 'ok', 'new' or 'missing'.
+    """
+    before, after = baseline["results"], current["results"]
+    names = [n for n in before if n in after] + [n for n in after if n not in before] + \
+            [n for n in before if n not in after]
+    rows = []
+    for name in names:
+        if prefix and not name.startswith(prefix):
+            continue
+        if name not in before or name not in after:
+            rows.append((name, None, None, None, None, "new" if name in after else "missing"))
+            continue
+        for metric in metrics:
+            old, new = before[name].get(metric), after[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            status = "ok"
+            if abs(new - old) > min_ms:
+                if change > threshold:
+                    status = "regression"
+                elif change < -threshold:
+                    status = "improvement"
+            rows.append((name, metric, old, new, change, status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("baseline", help="results of the reference run")
+    parser.add_argument("current", help="results of the run to check")
+    parser.add_argument("--metric", action="append", default=None, help="statistic to compare (repeatable; default p50_ms and p95_ms)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative growth flagged as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore changes smaller than this (ms)")
+    parser.add_argument("--only", default=None, help="compare the benchmarks starting with this prefix")
+    parser.add_argument("--all", action="store_true", help="also list the unchanged benchmarks")
+    args = parser.parse_args(argv)
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    rows = compare(baseline, current, tuple(args.metric or ("p50_ms", "p95_ms")), args.threshold,
+                   args.min_ms, args.only)
+
+    revisions = [run["environment"].get("git_revision") or "?" for run in (baseline, current)]
+    print(f"{args.baseline} ({revisions[0]}) -> {args.current} ({revisions[1]})")
+    for name, metric, old, new, change, status in rows:
+        if status == "ok" and not args.all:
+            continue
+        if metric is None:
+            print(f"{status.upper():<12} {name}")
+        else:
+            print(f"{status.upper():<12} {name:<50} {metric:<8} {old:>10.3f} -> {new:>10.3f} ms ({change:+.1%})")
+
+    regressions = sorted({row[0] for row in rows if row[5] == "regression"})
+    compared = len({row[0] for row in rows if row[1] is not None})
+    print(f"{compared} benchmarks compared, {len(regressions)} regressed")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+"""
+# Example of usage:
+rows = compare(load_results("before.json"), load_results("after.json"), threshold=0.2)
+[row for row in rows if row[5] == "regression"]
+"""
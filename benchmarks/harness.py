@@ -0,0 +1,154 @@
+"""
+Timing helpers shared by the benchmarks:
+    measure()          run a callable repeatedly and summarise its latencies (percentiles, throughput)
+    FlaskTransport     a requests transport adapter answering from a Flask app in process, so the
+                       Dash pages (components/http_cache.py) read the seeded API without a server
+    save_results()     write a run as JSON, with the environment it ran in
+"""
+
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+def summarize(samples, elapsed=None):
+    """Statistics of latencies in seconds: count, mean, percentiles and max in ms, throughput per second."""
+    ms = np.asarray(samples, dtype=float) * 1000
+    if not len(ms):
+        return {"n": 0}
+    elapsed = elapsed if elapsed is not None else ms.sum() / 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "n": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(ms.max()), 4),
+        "throughput_per_s": round(len(ms) / elapsed, 2) if elapsed else None,
+    }
+
+
+def measure(fn, repeat=50, warmup=3, setup=None, check=None):
+    """
+    Call `fn()` `warmup` times untimed, then `repeat` times timed; returns summarize() of the calls.
+    `setup()` runs before every call outside the timing (e.g. to clear a cache);
+    `check(result)` validates each timed result and raises to abort the benchmark.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+        if check:
+            check(result)
+    elapsed = time.perf_counter() - started
+    # throughput over the timed calls only, setup excluded
+    return summarize(samples, min(elapsed, sum(samples)))
+
+
+class FlaskTransport(BaseAdapter):
+    """
+    Answers requests from a Flask app's test client instead of the network:
+        session.mount("http://localhost:5001/", FlaskTransport(server.app))
+    Responses go through the app's full request handling (after_request, compression, 304s).
+    """
+
+    def __init__(self, app):
+        super().__init__()
+        self.client = app.test_client()
+        self.calls = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = requests.utils.urlparse(request.url)
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        result = self.client.open(url.path, method=request.method, query_string=url.query,
+                                  headers=dict(request.headers), data=body)
+        self.calls += 1
+
+        response = requests.Response()
+        response.status_code = result.status_code
+        response.reason = result.status.split(" ", 1)[-1]
+        response.headers = CaseInsensitiveDict(result.headers)
+        # a urllib3 raw body, so requests decodes gzip/brotli as it would from a socket
+        response.raw = HTTPResponse(body=io.BytesIO(result.get_data()), headers=dict(result.headers),
+                                    status=result.status_code, preload_content=False, decode_content=True)
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.connection = self
+        result.close()
+        return response
+
+    def close(self):
+        pass
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "git_revision": git_revision(),
+    }
+
+
+def save_results(results, parameters, path=None):
+    """Write {created_at, environment, parameters, results} to `path` (default benchmarks/results/<time>.json)."""
+    created_at = datetime.now()
+    if path is None:
+        path = os.path.join(RESULTS_DIR, f"{created_at:%Y%m%d-%H%M%S}.json")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    run = {
+        "created_at": created_at.isoformat(timespec="seconds"),
+        "environment": environment(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    return path
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+"""
+# Example of usage:
+stats = measure(lambda: client.get("/api/provinces"), repeat=100, setup=result_cache.clear)
+http_cache._session.mount("http://localhost:5001/", FlaskTransport(server.app))
+save_results({"api.provinces.cold": stats}, {"repeat": 100})
+"""
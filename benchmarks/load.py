@@ -0,0 +1,414 @@
+"""
+Load generator of the Dash callbacks.
+Simulated sessions (one thread and HTTP session each) post realistic payloads to
+/_dash-update-component for the callbacks users wait on:
+    home    home_page.update_dashboard          pollutant group and province filters
+    map     map_page.update_all                 pollutant and date range of the province map
+    graph   graph_page.update_chart_and_summary station trend or multi-pollutant series
+with exponential think times between interactions. Input values are drawn from the stations
+and dates the API serves; `--payloads` replays recorded request bodies instead (one JSON per line,
+e.g. copied from the browser's network tab).
+The Dash app runs in process on a threaded server, so the API calls each callback makes
+(through components/http_cache.py) are counted; the API runs alongside it, either a
+`python server.py` already listening on localhost:5001 or, with `--serve-api`, in process on a
+seeded embedded database (as in benchmarks/run.py).
+Reports per callback: latency percentiles and histogram, error rate, API calls per call.
+    python -m benchmarks.load --serve-api --sessions 20 --duration 60
+    python -m benchmarks.load --sessions 50 --think 1 --weights map=2,graph=1,home=1
+    python -m benchmarks.load --target http://dash-host:8000 --payloads recorded.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.harness import RESULTS_DIR, save_results, summarize
+from components.logger import logger, setup_logging
+
+
+API_URL = "http://localhost:5001/"
+UPDATE_PATH = "/_dash-update-component"
+API_CALLS_HEADER = "X-Api-Calls"
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+HISTOGRAM_BOUNDS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Callback name -> an output of the callback, to find it in /_dash-dependencies
+CALLBACKS = {
+    "home": "sensor-map.children",
+    "map": "histogram.figure",
+    "graph": "trend-chart.figure",
+}
+
+POLLUTANT_GROUPS = ["All", "Particulate Matter", "Nitrogen Compounds", "Sulfur and Carbon Compounds",
+                    "Heavy Metals", "Others"]
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTP adapter counting the requests sent by the current thread (one Dash request per server thread)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local = threading.local()
+
+    def reset(self):
+        self.local.calls = 0
+
+    @property
+    def calls(self):
+        return getattr(self.local, "calls", 0)
+
+    def send(self, request, **kwargs):
+        self.local.calls = self.calls + 1
+        return super().send(request, **kwargs)
+
+
+def serve(wsgi_app, port):
+    """Serve a WSGI app on a background thread; returns the server (server_port, shutdown())."""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", port, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name=f"serve-{server.server_port}", daemon=True).start()
+    return server
+
+
+def start_dash(port=0):
+    """Import app.py, count its API calls per request (X-Api-Calls header) and serve it; returns the base URL."""
+    from components import http_cache
+
+    adapter = CountingAdapter(pool_maxsize=32)
+    http_cache._session.mount(API_URL, adapter)
+    import app
+
+    @app.server.before_request
+    def reset_api_calls():
+        adapter.reset()
+
+    @app.server.after_request
+    def report_api_calls(response):
+        response.headers[API_CALLS_HEADER] = str(adapter.calls)
+        return response
+
+    server = serve(app.server, port)
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_api(path, sensors, start, end):
+    """Serve server.py on localhost:5001 on the embedded database at `path` (seeded if missing)."""
+    from benchmarks.run import seed_database, use_embedded
+
+    use_embedded(path)
+    if not os.path.exists(path):
+        seed_database(path, sensors, start, end)
+    import server
+    return serve(server.app, 5001)
+
+
+class Catalogue:
+    """Values the simulated users pick from: pollutants, stations, provinces and the dates with data."""
+
+    def __init__(self, api_url=API_URL):
+        stations = requests.get(api_url + "api/stations", timeout=60)
+        stations.raise_for_status()
+        rows = stations.json()
+        self.stations = {}
+        for row in rows:
+            self.stations.setdefault(row["nometiposensore"], set()).add(row["nomestazione"])
+        self.stations = {p: sorted(s) for p, s in self.stations.items()}
+        self.pollutants = sorted(self.stations)
+        self.provinces = sorted({row["provincia"] for row in rows if row.get("provincia")})
+
+        top = max(self.pollutants, key=lambda p: len(self.stations[p]))
+        series = requests.get(api_url + "api/measurements_filters", params={"pollutant": top}, timeout=120)
+        series.raise_for_status()
+        dates = [row["data"] for row in series.json()]
+        if not dates:
+            raise RuntimeError("The API has no measurements to query")
+        self.first = _to_datetime(min(dates))
+        self.last = _to_datetime(max(dates))
+
+    def window(self, rng):
+        """A 7, 30 or 90-day range inside the data, or no range (the pages' default)."""
+        days = rng.choice([None, 7, 30, 90])
+        if days is None:
+            return None, None
+        latest_start = max(self.first, self.last - timedelta(days=days))
+        span = (latest_start - self.first).days
+        start = self.first + timedelta(days=rng.randint(0, span) if span > 0 else 0)
+        end = min(start + timedelta(days=days), self.last)
+        return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def _to_datetime(value):
+    # JSON records carry dates as RFC 1123 strings (Flask) or ISO strings
+    for parse in (lambda v: datetime.strptime(v, "%a, %d %b %Y %H:%M:%S %Z"), datetime.fromisoformat):
+        try:
+            return parse(value).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            continue
+    raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def callback_inputs(name, catalogue, rng):
+    """{"component.property": value} a user could send to callback `name`, and the property that changed."""
+    session = {"logged_in": True, "username": "load"}
+    if name == "home":
+        values = {
+            "pollutant-group-dropdown.value": rng.choice(POLLUTANT_GROUPS),
+            "province-dropdown.value": rng.choice(["All"] + catalogue.provinces),
+        }
+    elif name == "map":
+        start, end = catalogue.window(rng)
+        values = {
+            "pollutant-selector.value": rng.choice(catalogue.pollutants),
+            "date-picker-range.start_date": start,
+            "date-picker-range.end_date": end,
+            "session.data": session,
+        }
+    else:
+        pollutant = rng.choice(catalogue.pollutants)
+        start, end = catalogue.window(rng)
+        values = {
+            "analysis-mode.value": rng.choice(["general", "nox"]),
+            "trend-pollutant-selector.value": pollutant,
+            "trend-station-selector.value": rng.choice(catalogue.stations[pollutant]),
+            "specialized-province-selector.value": rng.choice(["All"] + catalogue.provinces),
+            "specialized-pollutant-selector.value": rng.sample(catalogue.pollutants,
+                                                               min(len(catalogue.pollutants), rng.randint(1, 3))),
+            "nox-date-range.start_date": start,
+            "nox-date-range.end_date": end,
+            "specialized-smoothing.value": rng.choice(["raw", "smoothed_7", "smoothed_14"]),
+            "session.data": session,
+        }
+    changed = rng.choice([key for key in values if not key.startswith("session.")])
+    return values, changed
+
+
+def find_callbacks(dependencies):
+    """{name: dependency entry} of the CALLBACKS in the app's /_dash-dependencies."""
+    found = {}
+    for name, output in CALLBACKS.items():
+        matches = [d for d in dependencies if output in d["output"].strip(".").split("...")]
+        if not matches:
+            raise RuntimeError(f"Callback with output {output} not found in the Dash app")
+        found[name] = matches[0]
+    return found
+
+
+def build_payload(dependency, values, changed):
+    """Body of /_dash-update-component for a dependency entry and the input values."""
+    outputs = []
+    for output in dependency["output"].strip(".").split("..."):
+        component, prop = output.rsplit(".", 1)
+        outputs.append({"id": component, "property": prop})
+    inputs = [{**i, "value": values.get(f"{i['id']}.{i['property']}")} for i in dependency["inputs"]]
+    state = [{**s, "value": values.get(f"{s['id']}.{s['property']}")} for s in dependency["state"]]
+    return {
+        "output": dependency["output"],
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": inputs,
+        "changedPropIds": [changed],
+        "state": state,
+    }
+
+
+def recorded_payloads(path, callbacks):
+    """[(callback name, body)] of a JSON-lines file of recorded request bodies."""
+    names = {dependency["output"]: name for name, dependency in callbacks.items()}
+    payloads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                body = json.loads(line)
+                body = body.get("body", body)
+                payloads.append((names.get(body["output"], body["output"]), body))
+    return payloads
+
+
+class Recorder:
+    """Thread-safe samples per callback: (latency s, ok, API calls or None)."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, latency, ok, api_calls):
+        with self._lock:
+            self.samples.setdefault(name, []).append((latency, ok, api_calls))
+
+
+def run_session(index, base_url, next_payload, recorder, deadline, think, timeout, seed):
+    rng = random.Random(seed * 100003 + index)
+    with requests.Session() as http:
+        while time.monotonic() < deadline:
+            name, body = next_payload(rng)
+            started = time.perf_counter()
+            try:
+                response = http.post(base_url + UPDATE_PATH, json=body, timeout=timeout)
+                latency = time.perf_counter() - started
+                # 204: the callback raised PreventUpdate
+                ok = response.status_code in (200, 204)
+                calls = response.headers.get(API_CALLS_HEADER)
+                recorder.add(name, latency, ok, int(calls) if calls is not None else None)
+            except requests.RequestException as e:
+                logger.debug(f"session {index}: {name} failed: {e}")
+                recorder.add(name, time.perf_counter() - started, False, None)
+            if think:
+                time.sleep(rng.expovariate(1 / think))
+
+
+def histogram(latencies):
+    """{"<=5ms": n, ..., ">10000ms": n} of latencies in seconds."""
+    ms = np.asarray(latencies, dtype=float) * 1000
+    counts = np.histogram(ms, bins=[0] + HISTOGRAM_BOUNDS + [np.inf])[0]
+    labels = [f"<={b}ms" for b in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]}ms"]
+    return dict(zip(labels, (int(c) for c in counts)))
+
+
+def report(recorder, elapsed):
+    """{"load.<callback>": statistics} of a run."""
+    results = {}
+    for name, samples in sorted(recorder.samples.items()):
+        ok = [latency for latency, success, _ in samples if success]
+        calls = [c for _, _, c in samples if c is not None]
+        stats = summarize(ok, elapsed)
+        stats.update({
+            "requests": len(samples),
+            "errors": len(samples) - len(ok),
+            "error_rate": round((len(samples) - len(ok)) / len(samples), 4),
+            "api_calls_total": sum(calls) if calls else None,
+            "api_calls_per_call": round(sum(calls) / len(calls), 2) if calls else None,
+            "histogram": histogram(ok),
+        })
+        results[f"load.{name}"] = stats
+    return results
+
+
+def print_report(results):
+    for name, stats in results.items():
+        print(f"\n{name}: {stats['requests']} requests, {stats['error_rate']:.1%} errors, "
+              f"{stats.get('throughput_per_s') or 0:.1f}/s, API calls per callback: {stats['api_calls_per_call']}")
+        if not stats["n"]:
+            continue
+        print(f"  p50 {stats['p50_ms']:.1f} ms  p95 {stats['p95_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms  "
+              f"max {stats['max_ms']:.1f} ms")
+        largest = max(stats["histogram"].values())
+        for label, count in stats["histogram"].items():
+            print(f"  {label:>10} {count:>7} {'#' * round(40 * count / largest) if largest else ''}")
+
+
+def parse_weights(text):
+    weights = {name: 1.0 for name in CALLBACKS}
+    for item in filter(None, (text or "").split(",")):
+        name, _, weight = item.partition("=")
+        if name not in CALLBACKS:
+            raise ValueError(f"Unknown callback {name!r} (choose from {', '.join(CALLBACKS)})")
+        weights[name] = float(weight)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Dash callbacks with concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the sessions start")
+    parser.add_argument("--think", type=float, default=0.5, help="mean think time between interactions (s)")
+    parser.add_argument("--weights", default=None, help="callback mix, e.g. map=2,graph=1,home=1")
+    parser.add_argument("--payloads", default=None, help="JSON lines of recorded request bodies to replay")
+    parser.add_argument("--timeout", type=float, default=60, help="request timeout (s)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the simulated users")
+    parser.add_argument("--target", default=None, help="drive an external Dash app (no API call counts)")
+    parser.add_argument("--api-url", default=API_URL, help="API the input values are drawn from")
+    parser.add_argument("--port", type=int, default=0, help="port of the in-process Dash app (0: any free port)")
+    parser.add_argument("--serve-api", action="store_true", help="run the API in process on an embedded database")
+    parser.add_argument("--path", default=None, help="DuckDB file of --serve-api (seeded when missing)")
+    parser.add_argument("--sensors", type=int, default=60, help="sensors of the seeded dataset")
+    parser.add_argument("--start", default="2024-01-01", help="first day of the seeded dataset")
+    parser.add_argument("--end", default="2024-04-01", help="day after its last one")
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/load-<time>.json)")
+    args = parser.parse_args(argv)
+
+    weights = parse_weights(args.weights)
+    workdir = api = None
+    try:
+        if args.serve_api:
+            path = args.path
+            if path is None:
+                workdir = tempfile.mkdtemp(prefix="geoair-load-")
+                path = os.path.join(workdir, "load.duckdb")
+            api = start_api(path, args.sensors, args.start, args.end)
+        base_url = args.target.rstrip("/") if args.target else start_dash(args.port)
+        callbacks = find_callbacks(requests.get(base_url + "/_dash-dependencies", timeout=30).json())
+
+        if args.payloads:
+            recorded = recorded_payloads(args.payloads, callbacks)
+            next_payload = lambda rng: rng.choice(recorded)   # noqa: E731
+        else:
+            catalogue = Catalogue(args.api_url.rstrip("/") + "/")
+            names = [name for name in CALLBACKS if weights[name] > 0]
+            mix = [weights[name] for name in names]
+
+            def next_payload(rng):
+                name = rng.choices(names, mix)[0]
+                values, changed = callback_inputs(name, catalogue, rng)
+                return name, build_payload(callbacks[name], values, changed)
+
+        logger.info(f"{args.sessions} sessions on {base_url} for {args.duration:.0f}s")
+        # the pages and the servers log every request at INFO, and the station filters warn at every call
+        for name in ("", "werkzeug"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        warnings.filterwarnings("ignore", category=UserWarning, message="This pattern is interpreted as a regular expression")
+        recorder = Recorder()
+        started = time.monotonic()
+        deadline = started + args.ramp + args.duration
+        threads = []
+        for index in range(args.sessions):
+            thread = threading.Thread(target=run_session, name=f"session-{index}", daemon=True,
+                                      args=(index, base_url, next_payload, recorder, deadline,
+                                            args.think, args.timeout, args.seed))
+            thread.start()
+            threads.append(thread)
+            if args.sessions > 1:
+                time.sleep(args.ramp / args.sessions)
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if api is not None:
+            api.shutdown()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = report(recorder, elapsed)
+    print_report(results)
+    parameters = {key: getattr(args, key) for key in ("sessions", "duration", "ramp", "think", "payloads",
+                                                       "seed", "target", "serve_api")}
+    parameters["weights"] = weights
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    logger.info(f"Results saved to {save_results(results, parameters, output)}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+base_url = start_dash()
+callbacks = find_callbacks(requests.get(base_url + "/_dash-dependencies").json())
+values, changed = callback_inputs("map", Catalogue(), random.Random(1))
+requests.post(base_url + UPDATE_PATH, json=build_payload(callbacks["map"], values, changed))
+"""
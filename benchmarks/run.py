@@ -0,0 +1,269 @@
+"""
+Benchmark suite of the API and of the Dash hot paths, on a seeded dataset.
+A synthetic dataset (database/synthetic.py, deterministic for a seed) is loaded into an embedded
+DuckDB database and server.py is imported on it:
+    api     every endpoint through Flask's test client: latency percentiles, throughput and
+            response size, with the result cache cleared (cold) and filled (warm), and the
+            304 answer to a revalidation (not_modified)
+    pages   the pure functions the Dash callbacks spend their time in (province layer, station
+            layers and filters, smoothing), fed by the same API in process
+Results are saved as JSON (benchmarks/results/<time>.json); compare two runs with benchmarks/compare.py.
+    python -m benchmarks.run                              # temporary database, every benchmark
+    python -m benchmarks.run --only api --repeat 200
+    python -m benchmarks.run --path data/bench.duckdb     # seeded on first use, reused afterwards
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import warnings
+from datetime import timedelta
+
+import requests
+
+from benchmarks.harness import FlaskTransport, measure, save_results
+from components.logger import logger, setup_logging
+
+
+API_URL = "http://localhost:5001/"
+BENCH_USER = {"username": "bench", "email": "bench@example.com", "password": "bench"}
+POLLUTANT_GROUPS = ["All", "Particulate Matter", "Nitrogen Compounds", "Sulfur and Carbon Compounds",
+                    "Heavy Metals", "Others"]
+
+
+def seed_database(path, sensors=60, start="2024-01-01", end="2024-04-01", seed=42):
+    """Load the synthetic dataset and the login user into the DuckDB file at `path`."""
+    from database.storage import EmbeddedStorage
+    from database.synthetic import load_synthetic
+
+    storage = EmbeddedStorage(path)
+    try:
+        stats = load_synthetic(storage, sensors, start, end, seed)
+        with storage.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+                           (BENCH_USER["username"], BENCH_USER["email"], BENCH_USER["password"]))
+    finally:
+        storage.close()
+    return stats
+
+
+def use_embedded(path):
+    """Point server.py at the DuckDB file at `path`: call before database.storage or server are imported."""
+    os.environ["GEOAIR_STORAGE"] = "embedded"
+    os.environ["GEOAIR_EMBEDDED_PATH"] = path
+    os.environ.setdefault("GEOAIR_ANALYTICS", "database")
+    os.environ.setdefault("GEOAIR_CACHE", "memory")
+
+
+def sample_arguments(server):
+    """Pollutants, sensor, province and a 30-day range present in the seeded data."""
+    with server.storage.connection() as conn:
+        stations = server.storage.read_sql(conn, "SELECT idsensore, nometiposensore, provincia FROM station")
+        latest = server.storage.read_sql(conn, "SELECT MAX(data) AS latest FROM measurement")["latest"].iloc[0]
+    counts = stations["nometiposensore"].value_counts()
+    pollutant, second = counts.index[0], counts.index[1]
+    sensor = stations[stations["nometiposensore"] == pollutant].sort_values("idsensore").iloc[0]
+    other = stations[stations["nometiposensore"] == second].sort_values("idsensore").iloc[0]
+    return {
+        "pollutant": pollutant,
+        "pollutants": [pollutant, second],
+        "idsensore": sensor["idsensore"],
+        "sensors": [sensor["idsensore"], other["idsensore"]],
+        "provincia": sensor["provincia"],
+        "start_date": (latest - timedelta(days=30)).strftime("%Y-%m-%d"),
+        "end_date": latest.strftime("%Y-%m-%d"),
+    }
+
+
+def api_scenarios(args):
+    """(name, method, path, query string or JSON body, served from the result cache) of every endpoint."""
+    window = {"start_date": args["start_date"], "end_date": args["end_date"]}
+    return [
+        ("provinces", "GET", "/api/provinces", {}, True),
+        ("stations", "GET", "/api/stations", {}, True),
+        ("stations.pollutant", "GET", "/api/stations", {"pollutant": args["pollutant"]}, True),
+        ("measurements.records", "GET", "/api/measurements", {"idsensore": args["idsensore"], **window}, False),
+        ("measurements.arrow", "GET", "/api/measurements",
+         {"idsensore": args["idsensore"], "format": "arrow", **window}, False),
+        ("measurements.align", "GET", "/api/measurements", {"idsensore": args["sensors"], "align": 1, **window}, False),
+        ("measurements.page", "GET", "/api/measurements", {"fields": "idsensore,data,valore", "limit": 5000}, False),
+        ("measurements.stream", "GET", "/api/measurements",
+         {"idsensore": args["idsensore"], "stream": 1, "format": "ndjson"}, False),
+        ("measurements_filters", "GET", "/api/measurements_filters",
+         {"pollutant": args["pollutant"], "provincia": args["provincia"], **window}, True),
+        ("measurements_filters.region", "GET", "/api/measurements_filters", {"pollutant": args["pollutant"]}, True),
+        ("measurements_pollutants", "GET", "/api/measurements_pollutants",
+         {"pollutant": args["pollutants"], "provincia": args["provincia"], **window}, True),
+        ("avg_province_time", "GET", "/api/avg_province_time", {"pollutant": args["pollutant"]}, True),
+        ("avg_province_time.range", "GET", "/api/avg_province_time", {"pollutant": args["pollutant"], **window}, True),
+        ("login", "POST", "/api/login", BENCH_USER, False),
+        ("signin", "POST", "/api/signin", None, False),
+        ("pool_stats", "GET", "/api/pool_stats", {}, False),
+        ("cache_stats", "GET", "/api/cache_stats", {}, False),
+        ("metrics", "GET", "/metrics", {}, False),
+    ]
+
+
+def _invalid_json(response, constant):
+    raise RuntimeError(f"{response.request.path}: invalid JSON, the body contains {constant}")
+
+
+def bench_api(server, args, repeat=50, warmup=3):
+    """{"api.<scenario>.<mode>": stats} for every endpoint."""
+    client = server.app.test_client()
+    # what the Dash pages send (requests' defaults), so compression is part of the timing
+    base_headers = {"Accept-Encoding": requests.utils.default_headers()["Accept-Encoding"]}
+    new_users = itertools.count()
+    results = {}
+
+    def expect(*statuses):
+        def check(response):
+            if response.status_code not in statuses:
+                raise RuntimeError(f"{response.request.path}: HTTP {response.status_code} {response.get_data()[:200]!r}")
+        return check
+
+    def strict_json(response):
+        """JSON bodies must parse without the NaN / Infinity extensions (JSON.parse rejects them)."""
+        if response.mimetype == "application/json":
+            json.loads(response.get_data(), parse_constant=lambda name: _invalid_json(response, name))
+
+    for name, method, path, payload, cached in api_scenarios(args):
+        def call(headers=base_headers):
+            if method == "POST":
+                body = payload
+                if body is None:   # signin: a new user every call
+                    n = next(new_users)
+                    body = {"username": f"bench{n}", "email": f"bench{n}@example.com", "password": "bench"}
+                response = client.post(path, json=body, headers=headers)
+            else:
+                response = client.get(path, query_string=payload, headers=headers)
+            response.get_data()    # consume streamed bodies
+            response.close()       # releases the connection of a streamed response
+            return response
+
+        first = call()
+        expect(200)(first)
+        if method == "GET":
+            strict_json(call({}))   # uncompressed
+        modes = {"cold": server.result_cache.clear, "warm": None} if cached else {"": None}
+        for mode, setup in modes.items():
+            stats = measure(call, repeat, warmup, setup=setup, check=expect(200))
+            stats["bytes"] = len(first.get_data())
+            results[".".join(filter(None, ["api", name, mode]))] = stats
+
+        etag = first.headers.get("ETag")
+        if etag:
+            headers = {**base_headers, "If-None-Match": etag}
+            results[f"api.{name}.not_modified"] = measure(lambda: call(headers), repeat, warmup, check=expect(304))
+    return results
+
+
+def bench_pages(server, args, repeat=50, warmup=3):
+    """{"pages.<function>.<case>": stats} of the hot-path functions of the Dash pages."""
+    from components import http_cache
+
+    # the pages fetch from the API in process
+    http_cache._session.mount(API_URL, FlaskTransport(server.app))
+    os.environ.setdefault("GEOAIR_WARMUP", "blocking")   # caches filled before timing, no thread alongside
+    import app  # noqa: F401  (registers the pages, as in production)
+    from components.fetch_pollutant import station_catalogue
+    from components.map_component import create_layer_group
+    from pages import graph_page, home_page, map_page
+
+    stations = station_catalogue.frame()
+    if stations.empty:
+        raise RuntimeError("The station catalogue is empty: the API could not be read")
+    avg_province = map_page.fetch_avg_province_pollutant(args["pollutant"])
+    series = graph_page.fetch_data_multiple(args["pollutants"], None, args["start_date"], args["end_date"])
+
+    cases = {
+        "create_province_layer_legend": lambda: map_page.create_province_layer_legend(avg_province),
+        "create_layer_group.all": lambda: create_layer_group(stations, "Tutti"),
+        "create_layer_group.pollutant": lambda: create_layer_group(stations, args["pollutant"]),
+        "create_filtered_map.all": lambda: home_page.create_filtered_map("All", None, stations),
+        "create_filtered_map.province": lambda: home_page.create_filtered_map("Particulate Matter", args["provincia"],
+                                                                              stations),
+    }
+    for group in POLLUTANT_GROUPS:
+        key = group.lower().replace(" ", "_")
+        cases[f"filter_by_pollutant_group.{key}"] = lambda group=group: home_page.filter_by_pollutant_group(stations, group)
+    for smoothing in ("raw", "smoothed_7", "smoothed_14"):
+        cases[f"smooth_series.{smoothing}"] = lambda smoothing=smoothing: graph_page.smooth_series(series, smoothing)
+
+    results = {}
+    for name, fn in cases.items():
+        results[f"pages.{name}"] = measure(fn, repeat, warmup)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints and the Dash hot paths")
+    parser.add_argument("--only", choices=["api", "pages"], default=None, help="run one group of benchmarks")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls before timing")
+    parser.add_argument("--path", default=None, help="DuckDB file to seed (reused when it exists)")
+    parser.add_argument("--sensors", type=int, default=60, help="sensors of the synthetic dataset")
+    parser.add_argument("--start", default="2024-01-01", help="first day of the dataset")
+    parser.add_argument("--end", default="2024-04-01", help="day after the last one")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the dataset")
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/<time>.json)")
+    args = parser.parse_args(argv)
+
+    workdir = None
+    path = args.path
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix="geoair-bench-")
+        path = os.path.join(workdir, "bench.duckdb")
+    use_embedded(path)
+    try:
+        if not os.path.exists(path):
+            seed_database(path, args.sensors, args.start, args.end, args.seed)
+        import server
+        sample = sample_arguments(server)
+
+        # the keyword masks of filter_by_pollutant_group warn at every call
+        warnings.filterwarnings("ignore", category=UserWarning, message="This pattern is interpreted as a regular expression")
+        # every page call logs at INFO: keep the console (and its cost) out of the timings
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.WARNING)
+        results = {}
+        try:
+            if args.only in (None, "api"):
+                results.update(bench_api(server, sample, args.repeat, args.warmup))
+            if args.only in (None, "pages"):
+                results.update(bench_pages(server, sample, args.repeat, args.warmup))
+        finally:
+            root.setLevel(level)
+            server.storage.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    parameters = {key: getattr(args, key) for key in ("only", "repeat", "warmup", "sensors", "start", "end", "seed")}
+    parameters["sample"] = sample
+    output = save_results(results, parameters, args.output)
+    for name, stats in results.items():
+        logger.info(f"{name:<50} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms  "
+                    f"{stats['throughput_per_s']:>9.1f}/s")
+    logger.info(f"{len(results)} benchmarks saved to {output}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+use_embedded("data/bench.duckdb")
+import server
+results = bench_api(server, sample_arguments(server), repeat=100)
+save_results(results, {"repeat": 100})
+"""
@@ -0,0 +1,208 @@
+"""
+Colour classes of choropleth maps (province map, exports).
+    choropleth(values, method, k, palette, pollutant)   breaks, colour per value and legend of a series
+Methods of the class breaks:
+    equal_interval   k classes of the same width between min and max
+    quantile         k classes with the same number of values
+    jenks            natural breaks (Fisher-Jenks: least squared deviation within classes)
+    limits           fixed air quality thresholds of the pollutant: WHO 2021 guideline and EU limit value
+Values are classified with NumPy in one pass; a value on a break belongs to the lower class
+(the rule of assets/province_map.js, which colours the map from the same breaks).
+Everything is computed from the arguments: nothing shared is modified, so callbacks running in
+parallel threads can use it. Palettes are cached lookup tables (colours + the no-data colour).
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+
+MISSING_COLOR = "#cccccc"
+METHODS = ("equal_interval", "quantile", "jenks", "limits")
+
+# colours the ramp of a palette goes through, evenly spaced
+PALETTES = {
+    "GnYlRd": ((0, 255, 0), (255, 255, 0), (255, 0, 0)),   # green - yellow - red, the map's scale
+    "Blues": ((222, 235, 247), (107, 174, 214), (8, 48, 107)),
+    "Greys": ((240, 240, 240), (150, 150, 150), (37, 37, 37)),
+}
+
+# Thresholds per pollutant (`nometiposensore`), ascending: the shortest averaging period each
+# standard defines for the pollutant (daily or 8-hour where available, annual otherwise), the
+# closest to the averages of a few days shown on the map. Units are those of the measurements
+# (µg/m³; mg/m³ for carbon monoxide, ng/m³ for metals and benzo(a)pyrene).
+# WHO: global air quality guidelines 2021. EU: Directive 2008/50/EC and 2004/107/EC.
+LIMIT_VALUES = {
+    "PM10": (("WHO", 45), ("EU", 50)),                        # 24-hour
+    "PM10 (SM2005)": (("WHO", 45), ("EU", 50)),               # 24-hour
+    "Particelle sospese PM2.5": (("WHO", 15), ("EU", 25)),    # WHO 24-hour, EU annual
+    "Biossido di Azoto": (("WHO", 25), ("EU", 40)),           # WHO 24-hour, EU annual
+    "Ozono": (("WHO", 100), ("EU", 120)),                     # 8-hour
+    "Biossido di Zolfo": (("WHO", 40), ("EU", 125)),          # 24-hour
+    "Monossido di Carbonio": (("WHO", 4), ("EU", 10)),        # WHO 24-hour, EU 8-hour
+    "Benzene": (("EU", 5),),                                  # annual
+    "Benzo(a)pirene": (("EU", 1),),                           # annual target value
+    "Arsenico": (("EU", 6),),                                 # annual target value
+    "Cadmio": (("EU", 5),),                                   # annual target value
+    "Nikel": (("EU", 20),),                                   # annual target value
+    "Piombo": (("WHO", 500), ("EU", 500)),                    # annual (0.5 µg/m³)
+}
+
+# values beyond which Jenks breaks are computed on an evenly spaced sample of the sorted values
+JENKS_MAX_VALUES = 1000
+
+Choropleth = namedtuple("Choropleth", ["breaks", "colors", "classes", "value_colors", "labels"])
+Choropleth.__doc__ = """
+Classes of a series: `breaks` (k + 1 bounds), `colors` (k colours), `classes` (class of each value,
+-1 when missing), `value_colors` (colour of each value, MISSING_COLOR when missing), `labels` (k legend texts).
+"""
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def equal_interval_breaks(values, k):
+    values = _finite(values)
+    return np.linspace(values.min(), values.max(), k + 1)
+
+
+def quantile_breaks(values, k):
+    return np.quantile(_finite(values), np.linspace(0, 1, k + 1))
+
+
+def jenks_breaks(values, k):
+    """Fisher-Jenks natural breaks: the k classes of contiguous sorted values with the least squared deviation."""
+    x = np.sort(_finite(values))
+    if len(x) > JENKS_MAX_VALUES:
+        x = x[np.linspace(0, len(x) - 1, JENKS_MAX_VALUES).astype(int)]
+    n = len(x)
+    if n <= k:
+        return np.concatenate([[x[0]], x])
+
+    # squared deviation of x[a:b] for every a < b, from prefix sums
+    s1 = np.concatenate([[0.0], np.cumsum(x)])
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    a = np.arange(n + 1)[:, None]
+    b = np.arange(n + 1)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ssd = (s2[b] - s2[a]) - (s1[b] - s1[a]) ** 2 / (b - a)
+    ssd[a >= b] = np.inf
+
+    # cost[j][b]: best deviation of x[:b] in j + 1 classes; start[j][b]: first value of its last class
+    cost = ssd[0:1].copy()
+    starts = []
+    for _ in range(1, k):
+        total = cost[-1][:, None] + ssd          # last class x[a:b] after the best split of x[:a]
+        start = np.argmin(total, axis=0)
+        cost = np.vstack([cost, total[start, np.arange(n + 1)]])
+        starts.append(start)
+
+    # walk back from the last value: upper bound of each class = value before the next class starts
+    bounds, end = [], n
+    for start in reversed(starts):
+        end = start[end]
+        bounds.append(x[end - 1])
+    return np.array([x[0]] + bounds[::-1] + [x[-1]])
+
+
+def limit_breaks(values, pollutant):
+    """Breaks at the WHO guideline and EU limit of `pollutant`, from 0 (or below) to the highest value."""
+    if pollutant not in LIMIT_VALUES:
+        raise ValueError(f"No limit values for pollutant '{pollutant}'")
+    values = _finite(values)
+    thresholds = sorted({value for _, value in LIMIT_VALUES[pollutant]})
+    return np.array([min(0.0, values.min())] + thresholds + [max(values.max(), thresholds[-1])])
+
+
+def breaks_for(values, method="equal_interval", k=4, pollutant=None):
+    """k + 1 ascending class bounds of the finite `values` (fewer when bounds coincide, at least two)."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown classification method '{method}' (one of {', '.join(METHODS)})")
+    if not len(_finite(values)):
+        raise ValueError("No values to classify")
+    if method == "limits":
+        return limit_breaks(values, pollutant)   # fixed classes, even when empty
+    breaks = {"equal_interval": equal_interval_breaks, "quantile": quantile_breaks,
+              "jenks": jenks_breaks}[method](values, k)
+    breaks = np.unique(breaks)                  # ties (constant series, repeated quantiles): one class each
+    return breaks if len(breaks) > 1 else np.repeat(breaks, 2)
+
+
+@lru_cache(maxsize=64)
+def palette(name, k):
+    """k colours (hex) sampled at the middle of k equal parts of the ramp of `name`."""
+    if name not in PALETTES:
+        raise ValueError(f"Unknown palette '{name}' (one of {', '.join(PALETTES)})")
+    anchors = np.array(PALETTES[name], dtype=float)
+    positions = (np.arange(k) + 0.5) / k * (len(anchors) - 1)
+    segment = np.minimum(positions.astype(int), len(anchors) - 2)
+    fraction = (positions - segment)[:, None]
+    rgb = (anchors[segment] + (anchors[segment + 1] - anchors[segment]) * fraction).astype(int)
+    return tuple(f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb)
+
+
+@lru_cache(maxsize=64)
+def _lookup_table(name, k):
+    """Colours of the classes followed by the no-data colour, indexed by class (-1: missing)."""
+    table = np.array(palette(name, k) + (MISSING_COLOR,), dtype=object)
+    table.flags.writeable = False
+    return table
+
+
+def classify(values, breaks):
+    """Class of each value (0 .. len(breaks) - 2; -1 for missing values)."""
+    values = np.asarray(values, dtype=float)
+    classes = np.searchsorted(np.asarray(breaks)[1:-1], values, side="left")
+    return np.where(np.isfinite(values), classes, -1)
+
+
+def _labels(breaks, method, pollutant, digits):
+    ranges = [f"{lower:.{digits}f} - {upper:.{digits}f}" for lower, upper in zip(breaks[:-1], breaks[1:])]
+    if method != "limits":
+        return ranges
+    names = {}
+    for standard, value in LIMIT_VALUES[pollutant]:
+        names.setdefault(value, []).append(standard)
+    thresholds = sorted(names)
+    labels = [f"≤ {thresholds[0]:g} ({'/'.join(names[thresholds[0]])})"]
+    labels += [f"{lower:g} - {upper:g} ({'/'.join(names[upper])})" for lower, upper in zip(thresholds[:-1], thresholds[1:])]
+    labels.append(f"> {thresholds[-1]:g}")
+    return labels
+
+
+def choropleth(values, method="equal_interval", k=4, palette_name="GnYlRd", pollutant=None, digits=1):
+    """
+    Classes and colours of `values` (array-like, NaN for missing values).
+
+    Parameters:
+        method (str): one of METHODS ("limits" needs `pollutant`, a key of LIMIT_VALUES)
+        k (int): number of classes (the limits define their own)
+        palette_name (str): one of PALETTES
+        digits (int): decimals of the legend labels
+
+    Returns:
+        Choropleth: breaks, colors, classes, value_colors, labels
+    """
+    breaks = breaks_for(values, method, k, pollutant)
+    k = len(breaks) - 1
+    classes = classify(values, breaks)
+    table = _lookup_table(palette_name, k)
+    return Choropleth(
+        breaks=breaks,
+        colors=list(table[:-1]),
+        classes=classes,
+        value_colors=table[classes],
+        labels=_labels(breaks, method, pollutant, digits),
+    )
+
+
+"""
+# Example of usage:
+result = choropleth(df["mean"], method="quantile", k=5)
+df["color"] = result.value_colors
+legend = list(zip(result.colors, result.labels))
+choropleth(df["mean"], method="limits", pollutant="PM10")     # <= 45 (WHO), 45 - 50 (EU), > 50
+"""
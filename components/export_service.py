@@ -0,0 +1,221 @@
+"""
+Downloads of the map data (province shapes with the pollutant averages and their colours).
+    shapefile    zipped ESRI Shapefile (.shp, .shx, .dbf, .prj, .cpg)
+    gpkg         GeoPackage
+    geoparquet   GeoParquet (needs pyarrow)
+    geojson      GeoJSON
+Every export is written in memory, or in a temporary directory of its own for the formats
+GDAL writes as files, so simultaneous downloads never share a path.
+Exports are cached by (pollutant, date range, data version, format): the data version is the
+validator of the API response the export is built from, which changes with the data.
+An export runs in a worker thread; the page waits up to GEOAIR_EXPORT_WAIT_SECONDS (default 2)
+for it and downloads it directly, otherwise the export continues in the background and the page
+shows a link (/exports/<job id>) once it is ready. Jobs live in the memory of the Dash process
+for GEOAIR_EXPORT_JOB_TTL seconds (default 3600).
+"""
+
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from uuid import uuid4
+
+from components.logger import logger
+
+EXPORT_URL = "/exports/{job_id}"
+EXPORT_ROUTE = "/exports/<job_id>"   # Flask rule of EXPORT_URL
+
+WAIT_SECONDS = float(os.environ.get("GEOAIR_EXPORT_WAIT_SECONDS", 2))
+JOB_TTL = float(os.environ.get("GEOAIR_EXPORT_JOB_TTL", 3600))
+CACHE_BYTES = int(float(os.environ.get("GEOAIR_EXPORT_CACHE_MB", 64)) * 1024 * 1024)
+WORKERS = int(os.environ.get("GEOAIR_EXPORT_WORKERS", 2))
+
+# format -> (label, file extension, MIME type)
+FORMATS = {
+    "shapefile": ("Shapefile (.zip)", "zip", "application/zip"),
+    "gpkg": ("GeoPackage", "gpkg", "application/geopackage+sqlite3"),
+    "geoparquet": ("GeoParquet", "parquet", "application/vnd.apache.parquet"),
+    "geojson": ("GeoJSON", "geojson", "application/geo+json"),
+}
+
+
+def available_formats():
+    """Formats this process can write."""
+    # pyarrow (optional, for GeoParquet) is looked up without importing it: it loads with the first export
+    return [fmt for fmt in FORMATS if fmt != "geoparquet" or importlib.util.find_spec("pyarrow") is not None]
+
+
+def _write_files(gdf, fmt, name, driver):
+    """Write with GDAL into a temporary directory of this call and return the file (a zip of the shapefile's)."""
+    with tempfile.TemporaryDirectory(prefix="geoair-export-") as workdir:
+        path = os.path.join(workdir, f"{name}.{'shp' if fmt == 'shapefile' else FORMATS[fmt][1]}")
+        gdf.to_file(path, driver=driver)
+        if fmt != "shapefile":
+            with open(path, "rb") as f:
+                return f.read()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for fname in sorted(os.listdir(workdir)):
+                zipf.write(os.path.join(workdir, fname), arcname=fname)
+        return buffer.getvalue()
+
+
+def write_export(gdf, fmt, name="GeoAir_map"):
+    """Bytes of `gdf` in the format `fmt` (a key of FORMATS)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (one of {', '.join(FORMATS)})")
+    if fmt == "geojson":
+        return gdf.to_json(drop_id=True).encode("utf-8")
+    if fmt == "geoparquet":
+        if importlib.util.find_spec("pyarrow") is None:
+            raise RuntimeError("GeoParquet exports need pyarrow (pip install pyarrow)")
+        buffer = io.BytesIO()
+        gdf.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return _write_files(gdf, fmt, name, "GPKG" if fmt == "gpkg" else "ESRI Shapefile")
+
+
+class ExportJob:
+    """An export being built or ready: `status` is 'running', 'done' or 'failed'."""
+
+    def __init__(self, key, fmt, filename):
+        self.id = uuid4().hex
+        self.key, self.fmt, self.filename = key, fmt, filename
+        self.status = "running"
+        self.error = None
+        self.created = time.time()
+        self.future = None
+
+    @property
+    def url(self):
+        return EXPORT_URL.format(job_id=self.id)
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.fmt][2]
+
+
+class ExportService:
+    """
+    Builds exports in worker threads, keeps the recent ones (at most `cache_bytes`) by key and
+    the jobs for `job_ttl` seconds. A request for an export being built joins the running job.
+    """
+
+    def __init__(self, workers=WORKERS, cache_bytes=CACHE_BYTES, job_ttl=JOB_TTL):
+        self.cache_bytes = cache_bytes
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geoair-export")
+        self._results = OrderedDict()   # key -> bytes
+        self._jobs = {}                 # job id -> ExportJob
+        self._running = {}              # key -> job id of the export being built
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "cache_hits": 0, "joined": 0, "built": 0, "failed": 0}
+
+    def submit(self, key, fmt, build, filename):
+        """
+        Job of the export `key` in format `fmt`; `build()` returns the GeoDataFrame to write and
+        is only called when the export is neither cached nor being built.
+        """
+        key = tuple(key) + (fmt,)
+        with self._lock:
+            self._prune()
+            self._stats["requests"] += 1
+            running = self._running.get(key)
+            if running is not None:
+                self._stats["joined"] += 1
+                return self._jobs[running]
+            job = ExportJob(key, fmt, filename)
+            self._jobs[job.id] = job
+            if key in self._results:
+                self._results.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                job.status = "done"
+                return job
+            self._running[key] = job.id
+        job.future = self._executor.submit(self._run, job, build)
+        return job
+
+    def _run(self, job, build):
+        started = time.perf_counter()
+        try:
+            body = write_export(build(), job.fmt, os.path.splitext(job.filename)[0])
+        except Exception as e:
+            logger.error(f"Export {job.filename} failed: {e}")
+            with self._lock:
+                job.status, job.error = "failed", str(e)
+                self._running.pop(job.key, None)
+                self._stats["failed"] += 1
+            return
+        with self._lock:
+            self._results[job.key] = body
+            while len(self._results) > 1 and sum(map(len, self._results.values())) > self.cache_bytes:
+                self._results.popitem(last=False)
+            job.status = "done"
+            self._running.pop(job.key, None)
+            self._stats["built"] += 1
+        logger.info(f"Export {job.filename} ({len(body) / 1024:.0f} KB) built in "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def wait(self, job, timeout=WAIT_SECONDS):
+        """Wait up to `timeout` seconds for the job; True when it is finished."""
+        if job.future is not None:
+            try:
+                job.future.result(timeout=timeout)
+            except TimeoutError:
+                pass
+        return job.status != "running"
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        """Bytes of a finished export (None when it failed or was evicted from the cache)."""
+        with self._lock:
+            return self._results.get(job.key) if job.status == "done" else None
+
+    def _prune(self):
+        expired = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.created < expired and job.status != "running"]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, jobs=len(self._jobs), running=len(self._running),
+                        cached=len(self._results), cached_bytes=sum(map(len, self._results.values())))
+
+
+exports = ExportService()
+
+
+def export_view(job_id):
+    """Flask view of /exports/<job_id>: the file of a finished export."""
+    from flask import abort, jsonify, send_file
+
+    job = exports.job(job_id)
+    if job is None:
+        abort(404)
+    if job.status == "running":
+        return jsonify({"status": "running"}), 202
+    body = exports.result(job)
+    if body is None:
+        return jsonify({'error': job.error or "Export expired, request it again"}), 410
+    return send_file(io.BytesIO(body), mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
+
+"""
+# Example of usage:
+job = exports.submit(("provinces", "Ozono", "2024-12-01", "2024-12-31", etag), "gpkg",
+                     build=lambda: gdf, filename="GeoAir_map.gpkg")
+if exports.wait(job):
+    body = exports.result(job)           # bytes of the GeoPackage
+else:
+    job.url                              # '/exports/<job id>', answers 202 until the export is ready
+server.add_url_rule(EXPORT_ROUTE, "export_download", export_view)
+"""
@@ -2,30 +2,154 @@
 Fetch pollutant data from the API.
 Returns a pandas DataFrame with station data filtered by pollutant if specified.
 Logs errors if the fetch fails.
+
+The station list is held by a process-wide catalogue (`station_catalogue`): it is
+downloaded once, revalidated in the background every `ttl` seconds (a 304 when the
+station data version did not change) and filtered in memory through indexes on
+pollutant, province and station name, so Dash callbacks never wait on /api/stations.
 """
 
+import os
+import threading
+import time
+
+import numpy as np
 import pandas as pd
-import requests
 from components.logger import logger
+from components.http_cache import http_get
+
+
+STATIONS_URL = "http://localhost:5001/api/stations"
+
+# Columns indexed for filtering: keyword argument of StationCatalogue.filter -> column
+INDEXED_COLUMNS = {
+    "pollutant": "nometiposensore",
+    "province": "provincia",
+    "station": "nomestazione",
+}
+
+
+class StationCatalogue:
+    """
+    In-memory station list shared by every page of the process.
+    The first access loads it (blocking); afterwards a stale catalogue keeps serving
+    while a background thread revalidates it. DataFrames returned are shared: copy before modifying.
+    """
+
+    def __init__(self, url=STATIONS_URL, ttl=60.0, retry_interval=10.0):
+        self.url = url
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._df = pd.DataFrame()
+        self._indexes = {}
+        self._response = None        # last response decoded, to skip re-indexing after a 304
+        self._loaded_at = None
+        self._attempted_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def refresh(self):
+        """Revalidate the station list with the API and rebuild the indexes if it changed."""
+        try:
+            response = http_get(self.url, revalidate=True)
+            response.raise_for_status()
+            if response is not self._response:
+                df = pd.DataFrame(response.json())
+                indexes = {
+                    column: df.groupby(column, sort=False).indices if column in df.columns else {}
+                    for column in INDEXED_COLUMNS.values()
+                }
+                with self._lock:
+                    self._df, self._indexes, self._response = df, indexes, response
+                logger.info(f"Station catalogue loaded: {len(df)} sensors")
+            with self._lock:
+                self._loaded_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error fetching data: {e}")
+        finally:
+            with self._lock:
+                self._attempted_at = time.monotonic()
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            # First access: load now (other callers wait), without hammering an unreachable API
+            with self._load_lock:
+                attempted = self._attempted_at
+                if self._loaded_at is None and (attempted is None or time.monotonic() - attempted >= self.retry_interval):
+                    self.refresh()
+            return
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._loaded_at < self.ttl:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="station-catalogue-refresh", daemon=True).start()
+
+    def ready(self):
+        """True once the station list was loaded (it may still be empty)."""
+        return self._loaded_at is not None
+
+    def frame(self):
+        """Every station (empty DataFrame if the API could not be reached)."""
+        self._ensure_loaded()
+        return self._df
+
+    def filter(self, pollutant=None, province=None, station=None):
+        """Stations matching every given filter, looked up in the indexes."""
+        self._ensure_loaded()
+        with self._lock:
+            df, indexes = self._df, self._indexes
+        positions = None
+        for name, value in (("pollutant", pollutant), ("province", province), ("station", station)):
+            if value is None:
+                continue
+            found = indexes.get(INDEXED_COLUMNS[name], {}).get(value, np.empty(0, dtype=int))
+            positions = found if positions is None else np.intersect1d(positions, found, assume_unique=True)
+        if positions is None:
+            return df
+        return df.iloc[np.sort(positions)]
+
+    def _values(self, column, **filters):
+        df = self.filter(**filters)
+        if df.empty or column not in df.columns:
+            return []
+        return sorted(df[column].dropna().unique())
+
+    def pollutants(self, **filters):
+        """Sorted pollutant names (optionally of a province or station)."""
+        return self._values("nometiposensore", **filters)
+
+    def stations(self, **filters):
+        """Sorted station names (optionally for a pollutant or province)."""
+        return self._values("nomestazione", **filters)
+
+    def provinces(self, **filters):
+        return self._values("provincia", **filters)
+
+    def sensor_ids(self, pollutant=None, station=None):
+        """Unique sensor IDs of a pollutant and/or station."""
+        df = self.filter(pollutant=pollutant, station=station)
+        if df.empty:
+            return []
+        return df["idsensore"].unique().tolist()
+
+
+station_catalogue = StationCatalogue(ttl=float(os.environ.get("GEOAIR_CATALOGUE_TTL", 60)))
+
 
 def fetch_pollutant(pollutant=None):
-    try:
-        url = "http://localhost:5001/api/stations"
-        if pollutant:
-            url += f"?pollutant={pollutant}"
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        logger.info(f"Filter: '{pollutant}' - Stations data fetched successfully")
-        return pd.DataFrame(response.json())
-    except Exception as e:
-        logger.error(f"Error fetching data: {e}")
-        return pd.DataFrame()
+    """Stations, optionally of one pollutant, from the shared catalogue."""
+    return station_catalogue.filter(pollutant=pollutant)
 
 
 """
 # Example of usage:
-from functions.fetch_pollutant import fetch_pollutant
+from components.fetch_pollutant import fetch_pollutant, station_catalogue
 data_all = fetch_pollutant()                # Fetch all data
 data_pm10 = fetch_pollutant("PM10")         # Fetch only PM10 pollutant data
+
+station_catalogue.pollutants()                          # dropdown options
+station_catalogue.stations(pollutant="Ozono")
+station_catalogue.sensor_ids(pollutant="Ozono", station="Milano v.Senato")
 """
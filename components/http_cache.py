@@ -0,0 +1,242 @@
+"""
+HTTP caching and compression between the Flask API and the Dash pages.
+Server side:
+    - ETag / Last-Modified derived from the data versions (database/versions.py), so a
+      conditional request with an unchanged version is answered 304 without running a query
+    - Cache-Control policy per endpoint
+    - gzip (or brotli, if installed) compression of responses above a size threshold
+Client side:
+    - http_get(): requests.get with a small per-process cache that honours max-age and
+      revalidates with If-None-Match / If-Modified-Since; it holds at most CLIENT_CACHE_SIZE
+      responses and GEOAIR_CLIENT_CACHE_MB of bodies (default 32), and bodies above a quarter
+      of that are not cached
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import requests
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+# Binary formats already compressed (Parquet) are sent as they are
+COMPRESSIBLE_MIMES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.geoair.columns+json",
+    "application/vnd.apache.arrow.stream",
+}
+
+
+# --- Server side ---
+
+def make_etag(request, versions, datasets):
+    """Validator of a GET request: path, query string, Accept header and versions of the datasets read."""
+    stamps = [f"{name}={versions[name].version}" for name in sorted(datasets) if name in versions]
+    raw = "|".join([
+        request.path,
+        "&".join(sorted(f"{k}={v}" for k, v in request.args.items(multi=True))),
+        request.headers.get("Accept", ""),
+        *stamps,
+    ])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional(data_versions, datasets, cache_control):
+    """
+    Decorator for read endpoints whose result only changes with the data versions of `datasets`.
+    Sets ETag, Last-Modified and Cache-Control, and answers 304 before calling the view
+    when the client already holds the current version.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import Response, request
+
+            versions = data_versions.current()
+            current = [versions[name] for name in datasets if name in versions]
+            if not current:
+                # No version stamps (migration not applied): only the caching policy
+                response = _as_response(view(*args, **kwargs))
+                response.headers.setdefault("Cache-Control", cache_control)
+                return response
+
+            etag = make_etag(request, versions, datasets)
+            last_modified = max(v.changed_at for v in current)
+
+            not_modified = (
+                request.if_none_match.contains_weak(etag) if request.if_none_match
+                else request.if_modified_since is not None
+                and last_modified.replace(microsecond=0) <= request.if_modified_since
+            )
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = _as_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)  # weak: equal content whatever the Content-Encoding
+            response.last_modified = last_modified
+            response.headers["Cache-Control"] = cache_control
+            response.vary.update(("Accept", "Accept-Encoding"))
+            return response
+        return wrapper
+    return decorator
+
+
+def _as_response(rv):
+    """Flask response of a view return value (response, or (body, status) tuple)."""
+    from flask import make_response
+    return make_response(rv)
+
+
+def compress_response(response, request, min_size=1024):
+    """
+    Compress a complete response body with brotli or gzip when the client accepts it.
+    Streamed, small, non-200 and already compressed responses are left unchanged.
+    """
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMES):
+        return response
+
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality("br") > 0:
+        body, encoding = brotli.compress(body, quality=5), "br"
+    elif accepted.quality("gzip") > 0:
+        body, encoding = gzip.compress(body, compresslevel=6), "gzip"
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# --- Client side ---
+
+_session = requests.Session()  # keep-alive connections to the API
+_cache = OrderedDict()         # request key -> (response, fresh until)
+_cache_lock = threading.Lock()
+_cache_bytes = 0               # total body size of the cached responses
+_outcomes = {"fresh": 0, "not_modified": 0, "fetched": 0, "too_large": 0}   # how http_get answered
+CLIENT_CACHE_SIZE = 128
+CLIENT_CACHE_BYTES = int(float(os.environ.get("GEOAIR_CLIENT_CACHE_MB", 32)) * 1024 * 1024)
+CLIENT_CACHE_MAX_BODY = CLIENT_CACHE_BYTES // 4
+
+
+def _max_age(response):
+    """Seconds the response may be reused without revalidation (0 for no-cache / no-store)."""
+    directives = [d.strip() for d in response.headers.get("Cache-Control", "").split(",")]
+    if "no-cache" in directives or "no-store" in directives:
+        return 0
+    for d in directives:
+        if d.startswith("max-age="):
+            try:
+                return int(d.split("=", 1)[1])
+            except ValueError:
+                return 0
+    return 0
+
+
+def _count(outcome):
+    with _cache_lock:
+        _outcomes[outcome] += 1
+
+
+def client_cache_stats():
+    """
+    Cached responses (entries, bytes of their bodies) and how http_get answered: from cache (fresh),
+    after a 304, or with a full download (too_large: not cached, above CLIENT_CACHE_MAX_BODY).
+    """
+    with _cache_lock:
+        stats = dict(_outcomes, entries=len(_cache), bytes=_cache_bytes)
+    total = stats["fresh"] + stats["not_modified"] + stats["fetched"]
+    # a 304 still costs a round trip but no body or query
+    stats["hit_ratio"] = round((stats["fresh"] + stats["not_modified"]) / total, 3) if total else None
+    return stats
+
+
+def http_get(url, params=None, headers=None, timeout=30, revalidate=False):
+    """
+    GET through the shared session, reusing a cached response while it is fresh and
+    revalidating it afterwards (a 304 costs no body transfer).
+    With `revalidate` a fresh cached response is revalidated anyway, to notice data changes early.
+    Compressed bodies are decoded transparently by requests.
+    """
+    headers = dict(headers or {})
+    items = sorted((params or {}).items())
+    key = (url, tuple((k, str(v)) for k, v in items if v is not None), headers.get("Accept", ""))
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        response, fresh_until = cached
+        if time.monotonic() < fresh_until and not revalidate:
+            _count("fresh")
+            return response
+        if response.headers.get("ETag"):
+            headers["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+
+    fresh = _session.get(url, params=params, headers=headers, timeout=timeout)
+    if fresh.status_code == 304 and cached is not None:
+        _count("not_modified")
+        response = cached[0]
+        max_age = _max_age(fresh) if "Cache-Control" in fresh.headers else _max_age(response)
+    else:
+        _count("fetched")
+        response = fresh
+        max_age = _max_age(response)
+
+    if response.status_code == 200 and (response.headers.get("ETag") or max_age):
+        _store(key, response, max_age)
+    return response
+
+
+def _store(key, response, max_age):
+    """Cache `response`, evicting the least recently used ones beyond the entry and byte limits."""
+    global _cache_bytes
+    size = len(response.content)
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old[0].content)
+        if size > CLIENT_CACHE_MAX_BODY:
+            _outcomes["too_large"] += 1
+            return
+        _cache[key] = (response, time.monotonic() + max_age)
+        _cache_bytes += size
+        while len(_cache) > CLIENT_CACHE_SIZE or _cache_bytes > CLIENT_CACHE_BYTES:
+            evicted, _ = _cache.popitem(last=False)[1]
+            _cache_bytes -= len(evicted.content)
+
+
+"""
+# Example of usage:
+# server
+@app.route('/api/stations')
+@conditional(data_versions, ("station",), "public, max-age=300")
+def get_stations(): ...
+
+app.after_request(lambda response: compress_response(response, request))
+
+# client
+response = http_get("http://localhost:5001/api/stations", params={"pollutant": "Ozono"})
+"""
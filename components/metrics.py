@@ -0,0 +1,331 @@
+"""
+Metrics of the Flask API and of the Dash server, exposed in the Prometheus text format.
+    instrument(app, service)   wraps a Flask app (the API, or the Dash app's `server`): request count,
+                               latency and response size per route, DB time and rows per route,
+                               slow request log, and GET /metrics
+    observe_query(seconds, rows)  called by the storage backends for every query, attributed
+                               to the route of the request being served
+    REGISTRY.collector(fn)     families read when /metrics is scraped (pool, caches)
+Dash callbacks are reported as routes of their own (`callback:<first output>`), so the
+load of each callback is visible rather than one /_dash-update-component total.
+Requests slower than GEOAIR_SLOW_REQUEST_MS (default 1000) are logged with their parameters.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from components.logger import logger
+
+
+SLOW_REQUEST_MS = float(os.environ.get("GEOAIR_SLOW_REQUEST_MS", 1000))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# State of the request being served in this thread (None outside requests)
+_current = contextvars.ContextVar("geoair_request_metrics", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}     # labels -> [counts per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics of the process, plus collectors called at every scrape."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """
+        Register `fn()` returning [(name, type, help, [(labels dict, value)])]: values read at scrape
+        time, such as the pool state. Usable as a decorator.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("geoair_http_requests_total", "HTTP requests served",
+                            ("service", "route", "method", "status"))
+LATENCY = REGISTRY.histogram("geoair_http_request_duration_seconds", "Time to serve a request, body included",
+                             ("service", "route", "method"))
+RESPONSE_SIZE = REGISTRY.histogram("geoair_http_response_size_bytes", "Response body size (after compression)",
+                                   ("service", "route"), SIZE_BUCKETS)
+QUERY_TIME = REGISTRY.histogram("geoair_db_query_duration_seconds", "Time of a database query, rows fetched included",
+                                ("service", "route"))
+QUERY_ROWS = REGISTRY.histogram("geoair_db_query_rows", "Rows returned by a database query",
+                                ("service", "route"), ROWS_BUCKETS)
+SLOW_REQUESTS = REGISTRY.counter("geoair_http_slow_requests_total", "Requests slower than GEOAIR_SLOW_REQUEST_MS",
+                                 ("service", "route"))
+
+
+def gauges(name, documentation, values, **labels):
+    """Collector families of the numeric entries of a stats dict: one gauge per key (`<name>_<key>`)."""
+    return [
+        (f"{name}_{key}", "gauge", f"{documentation} ({key})", [(labels, value)])
+        for key, value in values.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+
+def observe_query(seconds, rows):
+    """Record a query of the current request (ignored outside requests, e.g. in the ingestion jobs)."""
+    state = _current.get()
+    if state is None:
+        return
+    state["db_seconds"] += seconds
+    state["db_rows"] += rows
+    state["queries"] += 1
+    QUERY_TIME.observe(seconds, service=state["service"], route=state["route"])
+    QUERY_ROWS.observe(rows, service=state["service"], route=state["route"])
+
+
+def observe_batches(batches):
+    """Yield the DataFrames of a streamed query, recording its time and rows once it is consumed."""
+    seconds, rows = 0.0, 0
+    try:
+        iterator = iter(batches)
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - started
+                break
+            seconds += time.perf_counter() - started
+            rows += len(batch)
+            yield batch
+    finally:
+        observe_query(seconds, rows)
+
+
+def _redact(value):
+    """Drop password values from logged parameters."""
+    if isinstance(value, dict):
+        return {k: "***" if "password" in str(k).lower() else _redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def _callback_details(request):
+    """(route label, logged parameters) of a Dash callback request."""
+    body = request.get_json(silent=True) or {}
+    first_output = str(body.get("output", "")).strip(".").split("...")[0]
+    values = {}
+    for item in (body.get("inputs") or []) + (body.get("state") or []):
+        if isinstance(item, dict) and "id" in item:
+            key = f"{item['id']}.{item.get('property')}"
+            values[key] = "***" if "password" in key.lower() else _redact(item.get("value"))
+    return f"callback:{first_output}", values
+
+
+class _Body:
+    """Response iterable counting the bytes sent, with the request state active while the body is produced."""
+
+    def __init__(self, body, state, finish):
+        self._body, self._state, self._finish = body, state, finish
+
+    def __iter__(self):
+        iterator = iter(self._body)
+        while True:
+            token = _current.set(self._state)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            self._state["bytes"] += len(chunk)
+            yield chunk
+
+    def close(self):
+        token = _current.set(self._state)
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            _current.reset(token)
+            self._finish(self._state)
+
+
+class MetricsMiddleware:
+    """WSGI middleware timing every request until its body is fully sent (streamed responses included)."""
+
+    def __init__(self, wsgi_app, service, slow_ms=SLOW_REQUEST_MS):
+        self.wsgi_app = wsgi_app
+        self.service = service
+        self.slow_ms = slow_ms
+
+    def __call__(self, environ, start_response):
+        state = {
+            "service": self.service, "route": "unmatched", "method": environ.get("REQUEST_METHOD", ""),
+            "status": "", "params": None, "bytes": 0, "db_seconds": 0.0, "db_rows": 0, "queries": 0,
+            "started": time.perf_counter(),
+        }
+        environ["geoair.metrics"] = state
+
+        def capture(status, headers, exc_info=None):
+            state["status"] = status.split(" ", 1)[0]
+            return start_response(status, headers, exc_info)
+
+        token = _current.set(state)
+        try:
+            body = self.wsgi_app(environ, capture)
+        except Exception:
+            state["status"] = "500"
+            self.finish(state)
+            raise
+        finally:
+            _current.reset(token)
+        return _Body(body, state, self.finish)
+
+    def finish(self, state):
+        seconds = time.perf_counter() - state["started"]
+        service, route = state["service"], state["route"]
+        REQUESTS.inc(service=service, route=route, method=state["method"], status=state["status"])
+        LATENCY.observe(seconds, service=service, route=route, method=state["method"])
+        RESPONSE_SIZE.observe(state["bytes"], service=service, route=route)
+        if seconds * 1000 >= self.slow_ms:
+            SLOW_REQUESTS.inc(service=service, route=route)
+            logger.warning(
+                f"Slow request: {state['method']} {route} {state['status']} in {seconds * 1000:.0f} ms "
+                f"(db {state['db_seconds'] * 1000:.0f} ms, {state['queries']} queries, {state['db_rows']} rows, "
+                f"{state['bytes']} bytes) params={json.dumps(state['params'], default=str)}"
+            )
+
+
+def instrument(app, service, slow_ms=SLOW_REQUEST_MS, path="/metrics"):
+    """Measure every request of the Flask `app` and serve the registry at `path`."""
+    from flask import Response, request
+
+    @app.before_request
+    def label_request():
+        state = request.environ.get("geoair.metrics")
+        if state is None:
+            return
+        if request.path.endswith("/_dash-update-component"):
+            state["route"], state["params"] = _callback_details(request)
+        else:
+            state["route"] = request.url_rule.rule if request.url_rule else "unmatched"
+            # query string only: request bodies may carry credentials
+            state["params"] = request.args.to_dict(flat=False) or None
+
+    @app.route(path, endpoint="metrics")
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, service, slow_ms)
+    return app
+
+
+"""
+# Example of usage:
+instrument(app, "api")            # Flask API
+instrument(dash_app.server, "dash")
+
+@REGISTRY.collector
+def pool_metrics():
+    return gauges("geoair_pool", "Connection pool", pool.stats())
+
+curl http://localhost:5001/metrics
+"""
@@ -0,0 +1,197 @@
+"""
+Province geometry of the map page, prepared once instead of at every callback.
+The shapefile (maps/Lombardy_admin2.shp) is reprojected to WGS84, keyed by province
+abbreviation (sigla, the `provincia` of the database) and simplified per zoom level:
+    low     zoom <= 7   region overview
+    medium  zoom 8-9
+    high    zoom >= 10
+Simplification treats the provinces as one coverage (shared borders are simplified once,
+so no gaps or overlaps appear between neighbours) and coordinates are snapped to 1e-5 degrees.
+The results are cached as GeoJSON files (GEOAIR_GEOMETRY_CACHE, default maps/cache), rebuilt
+when the shapefile changes; the Dash server serves them at /geo/provinces-<level>.geojson with
+a long max-age, so a browser downloads each level once.
+    python -m components.province_geometry            # build the cache (e.g. at deploy time)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+from components.logger import logger, setup_logging
+
+
+SHAPEFILE = os.path.join("maps", "Lombardy_admin2.shp")
+CACHE_DIR = os.environ.get("GEOAIR_GEOMETRY_CACHE", os.path.join("maps", "cache"))
+GEOJSON_URL = "/geo/provinces-{level}.geojson"
+GEOJSON_ROUTE = "/geo/provinces-<level>.geojson"   # Flask rule of GEOJSON_URL
+
+# Province names of the shapefile -> abbreviations used in the database
+NAME_TO_SIGLA = {
+    "Milano": "MI", "Bergamo": "BG", "Brescia": "BS",
+    "Como": "CO", "Cremona": "CR", "Lecco": "LC",
+    "Lodi": "LO", "Mantua": "MN", "Monza and Brianza": "MB",
+    "Pavia": "PV", "Sondrio": "SO", "Varese": "VA"
+}
+
+# level -> (highest zoom it is used for, simplification tolerance in degrees)
+LEVELS = {
+    "low": (7, 0.01),
+    "medium": (9, 0.002),
+    "high": (None, 0.0005),
+}
+PRECISION = 1e-5
+
+_build_lock = threading.Lock()
+
+
+def level_for_zoom(zoom):
+    """Geometry level to draw at a map zoom."""
+    for level, (max_zoom, _) in LEVELS.items():
+        if max_zoom is None or (zoom is not None and zoom <= max_zoom):
+            return level
+    return "high"
+
+
+def geojson_url(zoom):
+    return GEOJSON_URL.format(level=level_for_zoom(zoom))
+
+
+@lru_cache(maxsize=1)
+def provinces(path=SHAPEFILE):
+    """Full-resolution provinces in WGS84 with their `sigla` (shared: copy before modifying)."""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path).to_crs(epsg=4326)
+    gdf["sigla"] = gdf["NAME_2"].map(NAME_TO_SIGLA)
+    return gdf
+
+
+def simplify(geometries, tolerance):
+    """Topology-preserving simplification of adjacent polygons, snapped to PRECISION."""
+    import shapely
+
+    if hasattr(shapely, "coverage_simplify"):   # shapely >= 2.1 (GEOS >= 3.12)
+        simplified = shapely.coverage_simplify(geometries, tolerance)
+    else:
+        # each polygon on its own: valid shapes, but shared borders may drift apart slightly
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    return shapely.set_precision(simplified, PRECISION)
+
+
+def feature_collection(gdf, tolerance):
+    """GeoJSON dict of the provinces simplified at `tolerance`, features identified by sigla."""
+    from shapely.geometry import mapping
+
+    geometries = simplify(gdf.geometry.values, tolerance)
+    features = [
+        {
+            "type": "Feature",
+            "id": sigla,
+            "properties": {"sigla": sigla, "name": name},
+            "geometry": mapping(geometry),
+        }
+        for sigla, name, geometry in zip(gdf["sigla"], gdf["NAME_2"], geometries)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _source_stamp(path):
+    """Fingerprint of the shapefile (all its sidecar files), to notice a changed source."""
+    digest = hashlib.sha1()
+    base = os.path.splitext(path)[0]
+    for ext in (".shp", ".shx", ".dbf", ".prj"):
+        if os.path.exists(base + ext):
+            stat = os.stat(base + ext)
+            digest.update(f"{ext}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def build_cache(path=SHAPEFILE, cache_dir=CACHE_DIR):
+    """Write provinces-<level>.geojson for every level and a manifest; returns {level: bytes written}."""
+    os.makedirs(cache_dir, exist_ok=True)
+    gdf = provinces(path)
+    sizes = {}
+    for level, (_, tolerance) in LEVELS.items():
+        body = json.dumps(feature_collection(gdf, tolerance), separators=(",", ":"))
+        target = os.path.join(cache_dir, f"provinces-{level}.geojson")
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(target + ".tmp", target)
+        sizes[level] = len(body)
+    manifest = {"source": path, "stamp": _source_stamp(path), "levels": {k: v[1] for k, v in LEVELS.items()}}
+    with open(os.path.join(cache_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Province geometry cached in {cache_dir}: " +
+                ", ".join(f"{level} {size / 1024:.0f} KB" for level, size in sizes.items()))
+    return sizes
+
+
+def _cache_is_current(path, cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get("stamp") == _source_stamp(path)
+            and manifest.get("levels") == {k: v[1] for k, v in LEVELS.items()}
+            and all(os.path.exists(os.path.join(cache_dir, f"provinces-{level}.geojson")) for level in LEVELS))
+
+
+@lru_cache(maxsize=len(LEVELS))
+def geojson_bytes(level, path=SHAPEFILE, cache_dir=CACHE_DIR):
+    """Cached GeoJSON of a level (built on first use when the cache is missing or stale)."""
+    if level not in LEVELS:
+        raise KeyError(level)
+    with _build_lock:
+        if not _cache_is_current(path, cache_dir):
+            build_cache(path, cache_dir)
+    with open(os.path.join(cache_dir, f"provinces-{level}.geojson"), "rb") as f:
+        return f.read()
+
+
+def warm_cache():
+    """Load the provinces and the cached GeoJSON of every level (building it if needed), e.g. at startup."""
+    provinces()
+    for level in LEVELS:
+        geojson_bytes(level)
+    return True
+
+
+def geojson_view(level):
+    """Flask view of /geo/provinces-<level>.geojson: long-lived, revalidated by ETag, compressed."""
+    from flask import Response, abort, request
+    from components.http_cache import compress_response
+
+    try:
+        body = geojson_bytes(level)
+    except KeyError:
+        abort(404)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    response.make_conditional(request)
+    return compress_response(response, request)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the simplified province GeoJSON cache")
+    parser.add_argument("--shapefile", default=SHAPEFILE, help="province shapefile")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="output directory")
+    args = parser.parse_args(argv)
+    build_cache(args.shapefile, args.cache_dir)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+build_cache()                                   # maps/cache/provinces-{low,medium,high}.geojson
+geojson_url(zoom=8)                             # '/geo/provinces-medium.geojson'
+server.add_url_rule(GEOJSON_ROUTE, "province_geojson", geojson_view)
+"""
@@ -0,0 +1,274 @@
+"""
+DataFrame transport between the Flask API and the Dash pages.
+Besides the usual JSON records (one dict per row), measurement endpoints can answer with:
+    - columnar JSON  (one array per column)          application/vnd.geoair.columns+json
+    - Apache Arrow IPC stream                        application/vnd.apache.arrow.stream
+    - Parquet                                        application/vnd.apache.parquet
+    - newline-delimited JSON (one record per line)   application/x-ndjson
+The format is chosen with `?format=records|columns|arrow|parquet|ndjson` or the Accept header.
+Arrow and Parquet need pyarrow; without it the API falls back to JSON.
+Large results can be streamed batch by batch (streaming_response) in every format but columnar JSON.
+"""
+
+import io
+import json
+from decimal import Decimal
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+
+RECORDS_MIME = "application/json"
+COLUMNS_MIME = "application/vnd.geoair.columns+json"
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+PARQUET_MIME = "application/vnd.apache.parquet"
+NDJSON_MIME = "application/x-ndjson"
+
+FORMAT_MIMES = {
+    "records": RECORDS_MIME,
+    "columns": COLUMNS_MIME,
+    "ndjson": NDJSON_MIME,
+    "arrow": ARROW_MIME,
+    "parquet": PARQUET_MIME,
+}
+MIME_FORMATS = {mime: fmt for fmt, mime in FORMAT_MIMES.items()}
+
+
+def available_formats():
+    """Formats this process can encode/decode."""
+    if pa is None:
+        return ["records", "columns", "ndjson"]
+    return list(FORMAT_MIMES)
+
+
+# --- Server side ---
+
+def negotiate_format(request):
+    """Pick the response format from ?format= or the Accept header (JSON records by default)."""
+    requested = request.args.get("format", type=str)
+    if requested:
+        return requested if requested in available_formats() else "records"
+
+    # Only an explicit mention of a columnar/binary type changes the default
+    offered = [FORMAT_MIMES[f] for f in available_formats()]
+    explicit = [mime for mime in offered if mime in request.accept_mimetypes.values()]
+    if not explicit:
+        return "records"
+    best = request.accept_mimetypes.best_match(explicit + [RECORDS_MIME], default=RECORDS_MIME)
+    return MIME_FORMATS.get(best, "records")
+
+
+def normalize_dataframe(df):
+    """Convert NUMERIC (Decimal) columns to float so every format carries plain numbers."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            sample = df[col].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], Decimal):
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def json_records(df):
+    """Rows of `df` as dicts, missing values (NaN, NaT) as None: JSON has no NaN."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def encode_columns(df):
+    """Columnar JSON: {"column": [values...], ...}, timestamps as ISO strings, NaN as null."""
+    payload = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dt.strftime("%Y-%m-%dT%H:%M:%S").astype(object)
+        else:
+            values = series.astype(object)
+        payload[col] = values.where(series.notna(), None).tolist()
+    return json.dumps(payload, default=str, separators=(",", ":"))
+
+
+def encode_ndjson(df):
+    """One JSON record per line, timestamps as ISO strings."""
+    if df.empty:
+        return ""
+    return df.to_json(orient="records", lines=True, date_format="iso").rstrip("\n") + "\n"
+
+
+def encode_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_parquet(df):
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    return buffer.getvalue()
+
+
+def dataframe_response(df, request):
+    """Flask response for `df` in the format negotiated with the client."""
+    from flask import Response, jsonify
+
+    fmt = negotiate_format(request)
+    if fmt == "records":
+        return jsonify(json_records(df))
+
+    df = normalize_dataframe(df)
+    if fmt == "columns":
+        body = encode_columns(df)
+    elif fmt == "ndjson":
+        body = encode_ndjson(df)
+    elif fmt == "arrow":
+        body = encode_arrow(df)
+    else:
+        body = encode_parquet(df)
+    return Response(body, mimetype=FORMAT_MIMES[fmt])
+
+
+def _drain(buffer):
+    """Return what was written to a BytesIO so far and empty it."""
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def stream_chunks(batches, fmt):
+    """
+    Generator of response chunks for an iterable of DataFrame batches.
+    Only one batch is in memory at a time; the first batch fixes the schema.
+    """
+    if fmt == "records":
+        # Same body as jsonify(records), written one batch at a time
+        from flask import current_app
+        yield "["
+        first = True
+        for df in batches:
+            if df.empty:
+                continue
+            records = ",".join(
+                current_app.json.dumps(record, separators=(",", ":")) for record in json_records(df)
+            )
+            yield records if first else "," + records
+            first = False
+        yield "]\n"
+        return
+
+    if fmt == "ndjson":
+        for df in batches:
+            chunk = encode_ndjson(normalize_dataframe(df))
+            if chunk:
+                yield chunk
+        return
+
+    buffer = io.BytesIO()
+    writer = None
+    schema = None
+    for df in batches:
+        df = normalize_dataframe(df)
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            if fmt == "arrow":
+                writer = pa.ipc.new_stream(buffer, schema)
+            else:
+                writer = pq.ParquetWriter(buffer, schema)
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        writer.write_table(table)
+        yield _drain(buffer)
+    if writer is not None:
+        writer.close()
+        yield _drain(buffer)
+
+
+def streaming_response(batches, request):
+    """
+    Chunked Flask response streaming DataFrame batches in the negotiated format.
+    Columnar JSON cannot be written incrementally, so it is sent as NDJSON.
+    """
+    from flask import Response, stream_with_context
+
+    fmt = negotiate_format(request)
+    if fmt == "columns":
+        fmt = "ndjson"
+    return Response(
+        stream_with_context(stream_chunks(batches, fmt)),
+        mimetype=FORMAT_MIMES[fmt],
+        headers={"X-Accel-Buffering": "no"}  # let proxies forward chunks as they come
+    )
+
+
+# --- Client side ---
+
+def accept_header():
+    """Accept header for the fetchers: Arrow when pyarrow is installed, else columnar JSON."""
+    if pa is not None:
+        return f"{ARROW_MIME}, {COLUMNS_MIME};q=0.9, {RECORDS_MIME};q=0.5"
+    return f"{COLUMNS_MIME}, {RECORDS_MIME};q=0.5"
+
+
+def read_dataframe(response):
+    """Decode a `requests` response of any supported format into a DataFrame."""
+    mime = response.headers.get("Content-Type", RECORDS_MIME).split(";")[0].strip()
+
+    if mime == ARROW_MIME:
+        with pa.ipc.open_stream(response.content) as reader:
+            return reader.read_all().to_pandas()
+    if mime == PARQUET_MIME:
+        return pq.read_table(io.BytesIO(response.content)).to_pandas()
+    if mime == COLUMNS_MIME:
+        return pd.DataFrame(response.json())
+    if mime == NDJSON_MIME:
+        if not response.content.strip():
+            return pd.DataFrame()
+        return pd.read_json(io.BytesIO(response.content), lines=True, convert_dates=False)
+    data = response.json()
+    return pd.DataFrame(data) if data else pd.DataFrame()
+
+
+def iter_dataframes(response, chunk_rows=50000):
+    """
+    Decode a streamed response (requests.get(..., stream=True)) batch by batch,
+    so the client can start working on the first rows while the rest arrives.
+    """
+    mime = response.headers.get("Content-Type", RECORDS_MIME).split(";")[0].strip()
+    if mime == ARROW_MIME:
+        with pa.ipc.open_stream(response.raw) as reader:
+            for batch in reader:
+                yield batch.to_pandas()
+    elif mime == NDJSON_MIME:
+        lines = []
+        for line in response.iter_lines():
+            if line:
+                lines.append(json.loads(line))
+            if len(lines) >= chunk_rows:
+                yield pd.DataFrame(lines)
+                lines = []
+        if lines:
+            yield pd.DataFrame(lines)
+    else:
+        yield read_dataframe(response)
+
+
+"""
+# Example of usage:
+# server
+return dataframe_response(df, request)
+return streaming_response(batches, request)       # batches: iterable of DataFrames
+
+# client
+response = requests.get(url, params=params, headers={"Accept": accept_header()})
+df = read_dataframe(response)
+
+with requests.get(url, headers={"Accept": NDJSON_MIME}, stream=True) as response:
+    for batch in iter_dataframes(response):
+        ...
+"""
@@ -0,0 +1,198 @@
+"""
+Startup of the Dash app (app.py): what is deferred, and how long each part takes.
+The pages load no data when they are imported: their layouts are functions, built at each visit
+from caches (station catalogue, API client cache, province geometry) that a warm-up fills,
+and the heavy modules only used by callbacks (plotly.express, geopandas, pyarrow) load on first use.
+    GEOAIR_WARMUP=background   (default) the server answers at once, a thread runs the warm-up
+    GEOAIR_WARMUP=blocking     the warm-up runs before the server starts
+    GEOAIR_WARMUP=off          everything loads on first use
+Warm-up steps that fail (the API not up yet) are retried every few seconds for at most
+GEOAIR_WARMUP_TIMEOUT seconds (default 120), so the dropdowns fill as soon as server.py answers.
+The startup phases and warm-up steps are logged and exposed on /metrics (geoair_startup_seconds,
+geoair_warmup_seconds).
+    python -m components.startup                      # import-time profile of app.py and startup profile
+    python -m components.startup --top 40 --timeout 30
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from components.logger import logger, setup_logging
+
+
+STARTED = time.perf_counter()   # first import of this module: the top of app.py
+
+WARMUP_MODES = ("background", "blocking", "off")
+WARMUP_MODE = os.environ.get("GEOAIR_WARMUP", "background")
+WARMUP_TIMEOUT = float(os.environ.get("GEOAIR_WARMUP_TIMEOUT", 120))
+RETRY_DELAY = 5.0
+
+
+class StartupProfile:
+    """Durations of the startup phases (time since the previous mark) and of the warm-up steps."""
+
+    def __init__(self, started=STARTED):
+        self._last = started
+        self.phases = OrderedDict()     # phase -> seconds
+        self.steps = OrderedDict()      # warm-up step -> seconds from the warm-up start to its success (None: gave up)
+        self.warmed_up = False
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        """End of `phase`: the time since the previous mark (or the start)."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases[phase] = now - self._last
+            self._last = now
+
+    def step(self, name, seconds):
+        with self._lock:
+            self.steps[name] = seconds
+
+    def report(self):
+        with self._lock:
+            phases, steps = dict(self.phases), dict(self.steps)
+        text = "Startup: " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items())
+        text += f" (total {sum(phases.values()) * 1000:.0f} ms)"
+        if steps:
+            text += "; warm-up, ready after: " + ", ".join(
+                f"{name} {'gave up' if seconds is None else f'{seconds * 1000:.0f} ms'}" for name, seconds in steps.items()
+            )
+        return text
+
+    def metrics(self):
+        """Collector families of components/metrics.py."""
+        with self._lock:
+            phases, steps = dict(self.phases), dict(self.steps)
+        return [
+            ("geoair_startup_seconds", "gauge", "Duration of a startup phase of the Dash app",
+             [({"phase": phase}, seconds) for phase, seconds in phases.items()]),
+            ("geoair_warmup_seconds", "gauge", "Duration of a warm-up step (until it succeeded)",
+             [({"step": name}, seconds) for name, seconds in steps.items() if seconds is not None]),
+            ("geoair_warmup_done", "gauge", "1 once every warm-up step succeeded", [({}, int(self.warmed_up))]),
+        ]
+
+
+profile = StartupProfile()
+
+
+def preload(*modules):
+    """Import `modules` (the missing optional ones are skipped)."""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            logger.info(f"Warm-up: optional module {name} not installed")
+    return True
+
+
+def warm_up(steps, timeout=WARMUP_TIMEOUT, retry_delay=RETRY_DELAY):
+    """
+    Run the (name, fn) steps; a step raising or returning False is retried every `retry_delay`
+    seconds until `timeout`. Returns True when every step succeeded.
+    """
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    pending = list(steps)
+    while True:
+        failed = []
+        for name, fn in pending:
+            try:
+                ok = fn() is not False
+            except Exception as e:
+                logger.debug(f"Warm-up step {name} failed: {e}")
+                ok = False
+            if ok:
+                profile.step(name, time.perf_counter() - started)
+            else:
+                failed.append((name, fn))
+        pending = failed
+        if not pending or time.monotonic() + retry_delay > deadline:
+            break
+        time.sleep(retry_delay)
+
+    for name, _ in pending:
+        profile.step(name, None)
+        logger.warning(f"Warm-up step {name} gave up after {timeout:.0f} s: loaded on first use instead")
+    profile.warmed_up = not pending
+    logger.info(profile.report())
+    return not pending
+
+
+def start_warm_up(steps, mode=WARMUP_MODE, timeout=WARMUP_TIMEOUT):
+    """Run the warm-up as configured by `mode` (one of WARMUP_MODES); returns its thread in background mode."""
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"Unknown GEOAIR_WARMUP '{mode}' (one of {', '.join(WARMUP_MODES)})")
+    if mode == "off":
+        return None
+    if mode == "blocking":
+        warm_up(steps, timeout)
+        return None
+    thread = threading.Thread(target=warm_up, args=(steps, timeout), name="geoair-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(module="app", top=25):
+    """
+    Import-time profile of `module` in a fresh interpreter (python -X importtime), without warm-up:
+    (total seconds, [(module, self seconds, cumulative seconds)] of the `top` slowest modules).
+    """
+    env = dict(os.environ, GEOAIR_WARMUP="off")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.rstrip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1:]}")
+    total = next((cumulative for name, _, cumulative in rows if name.strip() == module), None)
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return total, rows[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time and startup profile of the Dash app")
+    parser.add_argument("--module", default="app", help="module to profile")
+    parser.add_argument("--top", type=int, default=25, help="slowest modules listed")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds the warm-up may retry (API not up)")
+    args = parser.parse_args(argv)
+
+    total, rows = import_profile(args.module, args.top)
+    print(f"import {args.module}: {total * 1000:.0f} ms (python -X importtime, cumulative)")
+    for name, self_seconds, cumulative in rows:
+        print(f"{cumulative * 1000:>9.1f} ms {self_seconds * 1000:>9.1f} ms self  {name}")
+
+    # in this process: the startup phases, then the warm-up run to completion (through the module
+    # instance the app imported, not this __main__ one)
+    os.environ["GEOAIR_WARMUP"] = "off"
+    module = importlib.import_module(args.module)
+    startup = importlib.import_module("components.startup")
+    steps = getattr(module, "WARMUP_STEPS", [])
+    if steps:
+        startup.warm_up(steps, args.timeout, retry_delay=1.0)
+    print(startup.profile.report())
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+from components.startup import profile, start_warm_up     # first import of app.py
+...
+profile.mark("imports")
+start_warm_up([("station catalogue", station_catalogue.ready), ("modules", lambda: preload("geopandas"))])
+REGISTRY.collector(profile.metrics)
+"""
@@ -0,0 +1,173 @@
+"""
+Query backends of the analytical endpoints (/api/measurements_filters, /api/avg_province_time).
+    database  the API storage (database/storage.py: Postgres, on the rollup tables when they
+              are built, or the embedded database) (default)
+    duckdb    the Parquet export of database/lake.py, scanned in process by DuckDB:
+              no load on Postgres, vectorised aggregation, partitions pruned by pollutant and month
+Selected with GEOAIR_ANALYTICS=database|duckdb (GEOAIR_LAKE_PATH for the Parquet directory).
+Every backend returns the same DataFrames; `datasets` names the data versions its results
+depend on, for the result cache and the ETags.
+"""
+
+import glob
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from components.metrics import observe_query
+from database import queries
+from database.lake import LAKE_PATH, pollutant_slug
+from database.rollup import rollups_available, to_timestamp
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+
+class DatabaseAnalytics:
+    """Analytical queries on the API storage (hourly/daily rollups when available)."""
+
+    datasets = ("station", "measurement")
+
+    def __init__(self, storage, use_rollups=True):
+        self.storage = storage
+        self.use_rollups = use_rollups
+
+    def measurements_filters(self, provincia=None, pollutant=None, start_date=None, end_date=None):
+        """Average value per timestamp (data, valore[, provincia])."""
+        with self.storage.connection() as conn:
+            query, params = queries.measurements_filters_query(
+                provincia, pollutant, start_date, end_date,
+                use_rollups=self.use_rollups and rollups_available(conn)
+            )
+            return self.storage.read_sql(conn, query, params)
+
+    def avg_province(self, pollutant, start_date=None, end_date=None):
+        """Average per province (unitamisura, provincia, mean); last 7 days of data without a range."""
+        with self.storage.connection() as conn:
+            use_rollups = self.use_rollups and rollups_available(conn)
+            latest = None
+            if not start_date or not end_date:
+                with conn.cursor() as cursor:
+                    cursor.execute(*queries.latest_measurement_query(use_rollups))
+                    row = cursor.fetchone()   # no row: rollup state not written yet
+                    latest = row[0] if row else None
+                if latest is None:
+                    return pd.DataFrame(columns=["unitamisura", "provincia", "mean"])
+            query, params = queries.avg_province_query(pollutant, start_date, end_date, latest, use_rollups=use_rollups)
+            return self.storage.read_sql(conn, query, params)
+
+
+class DuckDBAnalytics:
+    """
+    Analytical queries on the Parquet export, through an in-process DuckDB.
+    Files are globbed at every query, so a new export is picked up without a restart.
+    """
+
+    datasets = ("lake",)
+
+    def __init__(self, path=LAKE_PATH, threads=None):
+        if duckdb is None:
+            raise RuntimeError("The DuckDB analytics backend needs duckdb (pip install duckdb)")
+        self.path = path
+        self._conn = duckdb.connect(":memory:")
+        if threads:
+            self._conn.execute(f"SET threads = {int(threads)}")
+        self._lock = threading.Lock()
+
+    def _source(self):
+        """read_parquet() over the partitions; None when nothing was exported yet."""
+        pattern = os.path.join(self.path, "pollutant=*", "month=*", "*.parquet")
+        if not glob.glob(pattern):
+            return None
+        pattern = pattern.replace("'", "''")
+        return (f"read_parquet('{pattern}', hive_partitioning = true, "
+                f"hive_types = {{'pollutant': VARCHAR, 'month': VARCHAR}})")
+
+    def _query(self, sql, params=()):
+        # one cursor per query: DuckDB cursors are not shared between threads
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            started = time.perf_counter()
+            df = cursor.execute(sql, list(params)).df()
+            observe_query(time.perf_counter() - started, len(df))
+            return df
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _filters(provincia=None, pollutant=None, start_date=None, end_date=None):
+        """WHERE clause on valid rows; partition columns are filtered too so DuckDB skips files."""
+        where, params = ["stato = 'VA'"], []
+        if provincia:
+            where.append("provincia = ?")
+            params.append(provincia)
+        if pollutant:
+            where.append("pollutant = ? AND nometiposensore = ?")
+            params += [pollutant_slug(pollutant), pollutant]
+        if start_date:
+            start = to_timestamp(start_date)
+            where.append("month >= ? AND data >= ?")
+            params += [start.strftime("%Y-%m"), start]
+        if end_date:
+            end = to_timestamp(end_date)
+            where.append("month <= ? AND data <= ?")
+            params += [end.strftime("%Y-%m"), end]
+        return " AND ".join(where), params
+
+    def measurements_filters(self, provincia=None, pollutant=None, start_date=None, end_date=None):
+        columns = ["data", "valore"] + (["provincia"] if provincia else [])
+        source = self._source()
+        if source is None:
+            return pd.DataFrame(columns=columns)
+        where, params = self._filters(provincia, pollutant, start_date, end_date)
+        group_by = "data, provincia" if provincia else "data"
+        return self._query(f"""
+            SELECT data, AVG(valore) AS valore{', provincia' if provincia else ''}
+            FROM {source}
+            WHERE {where}
+            GROUP BY {group_by}
+            ORDER BY data
+        """, params)
+
+    def avg_province(self, pollutant, start_date=None, end_date=None):
+        empty = pd.DataFrame(columns=["unitamisura", "provincia", "mean"])
+        source = self._source()
+        if source is None:
+            return empty
+        if not start_date or not end_date:
+            # No range: the 7 days before the most recent measurement
+            latest = self._query(f"SELECT MAX(data) AS latest FROM {source}")["latest"].iloc[0]
+            if pd.isna(latest):
+                return empty
+            start_date, end_date = pd.Timestamp(latest).to_pydatetime() - timedelta(days=7), None
+        where, params = self._filters(pollutant=pollutant, start_date=start_date, end_date=end_date)
+        return self._query(f"""
+            SELECT unitamisura, provincia, AVG(valore) AS mean
+            FROM {source}
+            WHERE {where}
+            GROUP BY provincia, unitamisura
+        """, params)
+
+
+def create_analytics_backend(name, storage, use_rollups=True, path=LAKE_PATH):
+    """Backend from its configuration name: 'database' (or 'postgres') or 'duckdb'."""
+    name = (name or "database").lower()
+    if name in ("database", "postgres"):
+        return DatabaseAnalytics(storage, use_rollups)
+    if name == "duckdb":
+        return DuckDBAnalytics(path)
+    raise ValueError(f"Unknown analytics backend: {name}")
+
+
+"""
+# Example of usage:
+analytics = create_analytics_backend("duckdb", storage)
+analytics.measurements_filters(provincia="MI", pollutant="Ozono", start_date="2024-12-01", end_date="2024-12-31")
+analytics.avg_province("PM10 (SM2005)")
+"""
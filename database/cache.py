@@ -0,0 +1,235 @@
+"""
+Result cache for the Flask API.
+Results are keyed on the endpoint, its normalised query parameters and the version
+stamps of the datasets it reads (database/versions.py): when an ingestion step bumps
+a version, the old entries are no longer reachable and age out of the LRU.
+Each endpoint has its own TTL as a safety net for changes made without a bump.
+
+Backends:
+    - MemoryBackend: per-process LRU dictionary (default)
+    - SQLiteBackend: file on the local disk shared by every API process of the host,
+      a stand-in for a shared cache such as Redis or memcached
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from database.rollup import to_timestamp
+from database.versions import DATASETS
+
+
+MISSING = object()
+
+# Query parameters holding dates: '2024-12-01' and '2024-12-01 00:00:00' hit the same entry
+DATE_PARAMS = {"start_date", "end_date"}
+
+
+def normalize_params(params):
+    """Drop empty parameters, strip strings and write dates in one format."""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        if name in DATE_PARAMS:
+            try:
+                value = to_timestamp(value).isoformat()
+            except ValueError:
+                pass  # left as is: the endpoint reports the error
+        normalized[name] = value
+    return normalized
+
+
+class MemoryBackend:
+    """LRU dictionary of (expiry, value) limited to `max_entries`."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    LRU cache in a SQLite file, shared by the processes of one host.
+    Values are pickled; the least recently read entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path=None, max_entries=512):
+        self.path = path or os.path.join(tempfile.gettempdir(), "geoair_cache.sqlite")
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS result_cache_accessed_idx ON result_cache (accessed)")
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM result_cache WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return MISSING
+            conn.execute("UPDATE result_cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl, now)
+            )
+            conn.execute("DELETE FROM result_cache WHERE expires <= ?", (now,))
+            conn.execute("""
+                DELETE FROM result_cache WHERE key IN (
+                    SELECT key FROM result_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM result_cache")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+
+
+class ResultCache:
+    """
+    Cache of endpoint results with per-endpoint TTLs and version-stamp invalidation.
+    `versions` is a database.versions.DataVersions (or None to rely on TTLs only);
+    without a backend every call is computed.
+    """
+
+    def __init__(self, backend, versions=None, ttls=None, default_ttl=300):
+        self.backend = backend
+        self.versions = versions
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def key(self, endpoint, params, datasets=DATASETS):
+        """Cache key of an endpoint call: endpoint, sorted normalised parameters and data versions."""
+        current = self.versions.current() if self.versions is not None else {}
+        stamps = {name: current[name].version for name in datasets if name in current}
+        raw = json.dumps([endpoint, normalize_params(params), stamps], sort_keys=True, default=str)
+        return f"{endpoint}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    def get_or_compute(self, endpoint, params, compute, datasets=DATASETS):
+        """
+        Cached result of `compute()` for this endpoint and parameters.
+        Exceptions are not cached; results must not be modified by the caller.
+        """
+        if self.backend is None:
+            return compute()
+
+        key = self.key(endpoint, params, datasets)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self._count(endpoint, "hits")
+            return value
+
+        self._count(endpoint, "misses")
+        value = compute()
+        self.backend.set(key, value, self.ttls.get(endpoint, self.default_ttl))
+        return value
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """Hit/miss counters per endpoint and overall, plus the number of cached entries."""
+        with self._lock:
+            endpoints = {name: dict(c) for name, c in self._counters.items()}
+        for counters in endpoints.values():
+            total = counters["hits"] + counters["misses"]
+            counters["hit_ratio"] = round(counters["hits"] / total, 3) if total else None
+        hits = sum(c["hits"] for c in endpoints.values())
+        misses = sum(c["misses"] for c in endpoints.values())
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "endpoints": endpoints,
+        }
+
+
+def create_backend(name="memory", max_entries=512, path=None):
+    """Backend by name: 'memory', 'sqlite' or 'off' (None)."""
+    if name == "off":
+        return None
+    if name == "sqlite":
+        return SQLiteBackend(path, max_entries)
+    if name == "memory":
+        return MemoryBackend(max_entries)
+    raise ValueError(f"Unknown cache backend '{name}'")
+
+
+"""
+# Example of usage:
+cache = ResultCache(MemoryBackend(256), versions=DataVersions(pool), ttls={"stations": 3600})
+df = cache.get_or_compute("stations", {"pollutant": pollutant}, lambda: load_stations(pollutant),
+                          datasets=("station",))
+cache.stats()   # {'hits': ..., 'misses': ..., 'hit_ratio': ..., 'endpoints': {...}}
+"""
@@ -0,0 +1,131 @@
+"""
+Builds the embedded (DuckDB) database of database/storage.py from the ingestion output,
+so the API, the benchmarks and the tests run without PostgreSQL:
+    recordings  API pages saved by `python -m ingestion.replay record` (stations and measurements)
+    postgres    a copy of an existing database (optionally only the measurements since a date)
+Rows are inserted a DataFrame at a time; loading twice keeps one row per key.
+    python -m database.embedded recordings recordings/
+    python -m database.embedded postgres --since 2024-01-01
+    GEOAIR_STORAGE=embedded python server.py
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from components.logger import logger, setup_logging
+from database.queries import fetch_batches
+from database.storage import EMBEDDED_PATH, EmbeddedStorage
+from database.versions import bump_data_version
+from ingestion.socrata import HISTORICAL_DATASET, MEASUREMENT_DATASET, STATION_DATASET
+from ingestion.stations import STATION_COLUMNS, station_tuples
+from ingestion.writer import MEASUREMENT_COLUMNS, measurement_tuples
+
+
+def load_stations(conn, rows):
+    """Insert or replace station tuples (STATION_COLUMNS order); returns the number of rows."""
+    frame = pd.DataFrame(list(rows), columns=STATION_COLUMNS)
+    if frame.empty:
+        return 0
+    db = conn.duckdb
+    db.register("station_frame", frame)
+    try:
+        db.execute(f"""
+            INSERT OR REPLACE INTO station ({', '.join(STATION_COLUMNS)})
+            SELECT {', '.join(STATION_COLUMNS[:-3])},
+                   CAST(lat AS DOUBLE), CAST(lng AS DOUBLE), locationtxt
+            FROM station_frame
+        """)
+    finally:
+        db.unregister("station_frame")
+    return len(frame)
+
+
+def load_measurements(conn, rows):
+    """Insert measurement tuples (MEASUREMENT_COLUMNS order), skipping stored keys; returns the rows read."""
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows), columns=MEASUREMENT_COLUMNS)
+    if frame.empty:
+        return 0
+    db = conn.duckdb
+    db.register("measurement_frame", frame[MEASUREMENT_COLUMNS])
+    try:
+        db.execute(f"""
+            INSERT OR IGNORE INTO measurement ({', '.join(MEASUREMENT_COLUMNS)})
+            SELECT idsensore, CAST(data AS TIMESTAMP), CAST(valore AS DOUBLE), stato, idoperatore
+            FROM measurement_frame
+        """)
+    finally:
+        db.unregister("measurement_frame")
+    return len(frame)
+
+
+def load_recordings(storage, directory):
+    """Load the recorded station and measurement pages of `directory`; returns {table: rows}."""
+    from ingestion.replay import load_recordings as read_recordings
+
+    datasets = read_recordings(directory)
+    counts = {"station": 0, "measurement": 0}
+    with storage.connection() as conn:
+        counts["station"] = load_stations(conn, station_tuples(datasets.get(STATION_DATASET, [])))
+        for dataset in (HISTORICAL_DATASET, MEASUREMENT_DATASET):
+            counts["measurement"] += load_measurements(conn, measurement_tuples(datasets.get(dataset, [])))
+        bump_data_version(conn, "station", "measurement")
+    return counts
+
+
+def copy_from_postgres(pg_conn, storage, since=None, batch_size=100000):
+    """Copy stations and measurements (since `since`) from Postgres; returns {table: rows}."""
+    counts = {"station": 0, "measurement": 0}
+    with storage.connection() as conn:
+        stations = fetch_batches(pg_conn, f"SELECT {', '.join(STATION_COLUMNS)} FROM station")
+        counts["station"] = sum(load_stations(conn, batch.itertuples(index=False, name=None)) for batch in stations)
+        query = f"SELECT {', '.join(MEASUREMENT_COLUMNS)} FROM measurement"
+        params = ()
+        if since:
+            query += " WHERE data >= %s"
+            params = (since,)
+        for batch in fetch_batches(pg_conn, query, params, batch_size):
+            counts["measurement"] += load_measurements(conn, batch)
+            logger.debug(f"{counts['measurement']} measurements copied")
+        bump_data_version(conn, "station", "measurement")
+    pg_conn.rollback()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the embedded database")
+    parser.add_argument("--path", default=EMBEDDED_PATH, help="DuckDB database file")
+    sub = parser.add_subparsers(dest="source", required=True)
+    rec = sub.add_parser("recordings", help="load pages saved by ingestion.replay")
+    rec.add_argument("directory")
+    pg = sub.add_parser("postgres", help="copy the Postgres database")
+    pg.add_argument("--since", default=None, help="only the measurements from this date")
+    pg.add_argument("--batch-size", type=int, default=100000, help="rows per batch")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    storage = EmbeddedStorage(args.path)
+    if args.source == "recordings":
+        counts = load_recordings(storage, args.directory)
+    else:
+        from server import pool
+        with pool.connection() as pg_conn:
+            counts = copy_from_postgres(pg_conn, storage, args.since, args.batch_size)
+    storage.close()
+    logger.info(f"Loaded {counts['station']} stations and {counts['measurement']} measurements "
+                f"into {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+storage = EmbeddedStorage("data/geoair.duckdb")
+load_recordings(storage, "recordings")
+with storage.connection() as conn:
+    storage.read_sql(conn, *queries.stations_query("Ozono"))
+"""
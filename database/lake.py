@@ -0,0 +1,178 @@
+"""
+Parquet export of the measurements for the analytics backend.
+`measurement` joined with `station` is streamed from Postgres and written as
+Hive-style partitions, one directory per pollutant and month:
+    <path>/pollutant=PM10_SM2005/month=2024-12/part-00000.parquet
+so DuckDB (database/analytics.py) only opens the files of the pollutant and months
+a query asks for. The export is written to a staging directory and the partitions
+are swapped in at the end; `--since` rewrites only the months from that date on.
+The 'lake' data version is bumped afterwards so cached analytics results expire.
+    python -m database.lake                          # full export to GEOAIR_LAKE_PATH (data/lake)
+    python -m database.lake --since 2024-12-01       # refresh the recent months only
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from components.logger import logger, setup_logging
+from database.queries import fetch_batches
+from database.rollup import to_timestamp
+from database.versions import bump_data_version, read_data_versions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+
+
+LAKE_PATH = os.environ.get("GEOAIR_LAKE_PATH", os.path.join("data", "lake"))
+MANIFEST = "_manifest.json"
+
+# Columns stored in the files; pollutant and month are in the directory names
+LAKE_COLUMNS = ["idsensore", "data", "valore", "stato", "nometiposensore", "unitamisura", "provincia", "nomestazione"]
+
+EXPORT_SQL = """
+    SELECT m.idsensore, m.data, m.valore::float8 AS valore, m.stato,
+           s.nometiposensore, s.unitamisura, s.provincia, s.nomestazione
+    FROM measurement m
+    JOIN station s ON m.idsensore = s.idsensore
+    {where}
+    ORDER BY m.data
+"""
+
+
+def pollutant_slug(name):
+    """Directory-safe partition value of a pollutant name ('PM10 (SM2005)' -> 'PM10_SM2005')."""
+    return re.sub(r"[^0-9A-Za-z]+", "_", name or "").strip("_") or "unknown"
+
+
+def _schema():
+    return pa.schema([
+        ("idsensore", pa.string()),
+        ("data", pa.timestamp("us")),
+        ("valore", pa.float64()),
+        ("stato", pa.string()),
+        ("nometiposensore", pa.string()),
+        ("unitamisura", pa.string()),
+        ("provincia", pa.string()),
+        ("nomestazione", pa.string()),
+    ])
+
+
+def _partitions(path):
+    """{(pollutant, month): directory} of the partitions under `path`."""
+    found = {}
+    for directory in glob.glob(os.path.join(path, "pollutant=*", "month=*")):
+        month = os.path.basename(directory).split("=", 1)[1]
+        pollutant = os.path.basename(os.path.dirname(directory)).split("=", 1)[1]
+        found[(pollutant, month)] = directory
+    return found
+
+
+def export_parquet(conn, path=LAKE_PATH, since=None, batch_size=100000, bump=True):
+    """
+    Write measurement joined with station under `path`, partitioned by pollutant and month.
+    With `since`, only the months from `since` on are rewritten (the others are kept).
+    Rows arrive ordered by `data`, so a month's files are closed as soon as the next month starts
+    and memory stays at one batch. Returns a dict of statistics (rows, files, partitions, seconds).
+    """
+    if pa is None:
+        raise RuntimeError("The Parquet export needs pyarrow (pip install pyarrow)")
+
+    since = to_timestamp(since)
+    if since is not None:
+        since = datetime(since.year, since.month, 1)   # whole months only
+    started = time.perf_counter()
+    staging = os.path.join(path, f".staging-{uuid4().hex}")
+    os.makedirs(staging)
+    schema = _schema()
+    writers = {}
+    stats = {"rows": 0, "files": 0, "partitions": 0}
+
+    def close(keys):
+        for key in keys:
+            writers.pop(key).close()
+
+    try:
+        where, params = ("WHERE m.data >= %s", (since,)) if since else ("", ())
+        for df in fetch_batches(conn, EXPORT_SQL.format(where=where), params, batch_size):
+            if df.empty:
+                continue
+            df["data"] = df["data"].astype("datetime64[us]")
+            months = df["data"].dt.strftime("%Y-%m")
+            # earlier months are complete: rows are ordered by data
+            close([key for key in writers if key[1] < months.iloc[0]])
+            for (pollutant, month), part in df.groupby([df["nometiposensore"].map(pollutant_slug), months]):
+                key = (pollutant, month)
+                if key not in writers:
+                    directory = os.path.join(staging, f"pollutant={pollutant}", f"month={month}")
+                    os.makedirs(directory, exist_ok=True)
+                    writers[key] = pq.ParquetWriter(os.path.join(directory, "part-00000.parquet"),
+                                                    schema, compression="zstd")
+                    stats["files"] += 1
+                writers[key].write_table(pa.Table.from_pandas(part[LAKE_COLUMNS], schema=schema,
+                                                              preserve_index=False))
+            stats["rows"] += len(df)
+        close(list(writers))
+
+        # swap: drop the partitions being replaced, move the new ones in
+        since_month = since.strftime("%Y-%m") if since else ""
+        for (pollutant, month), directory in _partitions(path).items():
+            if month >= since_month:
+                shutil.rmtree(directory)
+        for (pollutant, month), directory in _partitions(staging).items():
+            target = os.path.join(path, f"pollutant={pollutant}", f"month={month}")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(directory, target)
+            stats["partitions"] += 1
+    finally:
+        close(list(writers))
+        shutil.rmtree(staging, ignore_errors=True)
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    manifest = {
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "since": since.isoformat() if since else None,
+        "data_versions": {name: v.version for name, v in read_data_versions(conn).items()},
+        **stats,
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported {stats['rows']} rows to {stats['partitions']} partitions of {path} in {stats['seconds']}s")
+
+    if bump:
+        bump_data_version(conn, "lake")
+    return stats
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Export measurements to partitioned Parquet files")
+    parser.add_argument("--path", default=LAKE_PATH, help="export directory")
+    parser.add_argument("--since", default=None, help="rewrite only the months from this date on")
+    parser.add_argument("--batch-size", type=int, default=100000, help="rows fetched per batch")
+    args = parser.parse_args(argv)
+
+    with pool.connection() as conn:
+        export_parquet(conn, args.path, args.since, args.batch_size)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+with pool.connection() as conn:
+    export_parquet(conn, "data/lake", since="2024-12-01")
+"""
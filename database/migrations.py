@@ -0,0 +1,207 @@
+"""
+Versioned schema migrations for the air quality database.
+Applied migrations are recorded in the `schema_migrations` table, so running
+the tool again only applies what is missing:
+    python -m database.migrations status
+    python -m database.migrations migrate            # up to the latest version
+    python -m database.migrations migrate --to 2
+New migrations are appended to MIGRATIONS with the next version number; never edit an applied one.
+"""
+
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from components.logger import logger, setup_logging
+from database.rollup import SCHEMA_SQL as ROLLUP_SCHEMA_SQL
+from database.versions import SCHEMA_SQL as DATA_VERSION_SCHEMA_SQL
+from ingestion.state import SCHEMA_SQL as INGESTION_STATE_SCHEMA_SQL, SHARD_SCHEMA_SQL as INGESTION_SHARD_SCHEMA_SQL
+
+
+# Composite index for the station filters (pollutant, then province)
+STATION_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS station_pollutant_province_idx ON station (nometiposensore, provincia);
+"""
+
+# Convert measurement into a table partitioned by month on `data`.
+# Existing rows are copied into monthly partitions; a default partition catches
+# rows outside the created months until measurement_ensure_partition() is called.
+MEASUREMENT_PARTITIONS_SQL = """
+    CREATE OR REPLACE FUNCTION measurement_ensure_partition(month TIMESTAMP) RETURNS void AS $$
+    DECLARE
+        lo TIMESTAMP := date_trunc('month', month);
+        hi TIMESTAMP := date_trunc('month', month) + interval '1 month';
+        part TEXT := 'measurement_' || to_char(date_trunc('month', month), 'YYYY_MM');
+    BEGIN
+        IF to_regclass(part) IS NOT NULL THEN
+            RETURN;
+        END IF;
+        -- rows of that month already in the default partition must move to the new one
+        CREATE TEMP TABLE measurement_moved AS
+            SELECT * FROM measurement_default WHERE data >= lo AND data < hi;
+        DELETE FROM measurement_default WHERE data >= lo AND data < hi;
+        EXECUTE format('CREATE TABLE %I PARTITION OF measurement FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+        INSERT INTO measurement SELECT * FROM measurement_moved;
+        DROP TABLE measurement_moved;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    DECLARE
+        first_month TIMESTAMP;
+        last_month TIMESTAMP;
+        month TIMESTAMP;
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'measurement'::regclass) THEN
+            RETURN;
+        END IF;
+
+        ALTER TABLE measurement RENAME TO measurement_unpartitioned;
+        ALTER INDEX IF EXISTS measurement_pkey RENAME TO measurement_unpartitioned_pkey;
+
+        CREATE TABLE measurement (
+            idsensore TEXT,
+            data TIMESTAMP NOT NULL,
+            valore NUMERIC,
+            stato TEXT,
+            idoperatore TEXT,
+            PRIMARY KEY (idsensore, data)
+        ) PARTITION BY RANGE (data);
+        CREATE TABLE measurement_default PARTITION OF measurement DEFAULT;
+
+        SELECT date_trunc('month', MIN(data)), date_trunc('month', MAX(data))
+        INTO first_month, last_month
+        FROM measurement_unpartitioned;
+
+        -- one partition per month of existing data, plus the next month for new loads
+        month := COALESCE(first_month, date_trunc('month', now()));
+        WHILE month <= COALESCE(last_month, date_trunc('month', now())) + interval '1 month' LOOP
+            PERFORM measurement_ensure_partition(month);
+            month := month + interval '1 month';
+        END LOOP;
+
+        INSERT INTO measurement (idsensore, data, valore, stato, idoperatore)
+        SELECT idsensore, data, valore, stato, idoperatore FROM measurement_unpartitioned;
+        DROP TABLE measurement_unpartitioned;
+    END;
+    $$;
+"""
+
+# Indexes for the API filters: every endpoint reads only valid ('VA') rows
+MEASUREMENT_INDEXES_SQL = """
+    -- series of one sensor ordered by time (/api/measurements)
+    CREATE INDEX IF NOT EXISTS measurement_valid_sensor_idx
+        ON measurement (idsensore, data) INCLUDE (valore) WHERE stato = 'VA';
+    -- time range scans over all sensors (filters, province averages, rollup refresh)
+    CREATE INDEX IF NOT EXISTS measurement_data_brin
+        ON measurement USING brin (data) WITH (pages_per_range = 32);
+    -- latest valid measurement and short time windows
+    CREATE INDEX IF NOT EXISTS measurement_valid_data_idx
+        ON measurement (data) WHERE stato = 'VA';
+    ANALYZE measurement;
+    ANALYZE station;
+"""
+
+# (version, name, SQL)
+MIGRATIONS = [
+    (1, "station_pollutant_province_index", STATION_INDEXES_SQL),
+    (2, "measurement_monthly_partitions", MEASUREMENT_PARTITIONS_SQL),
+    (3, "measurement_valid_and_brin_indexes", MEASUREMENT_INDEXES_SQL),
+    (4, "rollup_tables", ROLLUP_SCHEMA_SQL),
+    (5, "data_version_stamps", DATA_VERSION_SCHEMA_SQL),
+    (6, "ingestion_state", INGESTION_STATE_SCHEMA_SQL),
+    (7, "ingestion_shard_checkpoints", INGESTION_SHARD_SCHEMA_SQL),
+]
+
+
+def _ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def applied_versions(conn):
+    """Set of migration versions already applied to the database."""
+    with conn.cursor() as cur:
+        _ensure_migrations_table(cur)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def migrate(conn, target=None):
+    """
+    Apply every pending migration up to `target` (latest if None), each in its own transaction.
+    Returns the list of versions applied.
+    """
+    done = applied_versions(conn)
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        logger.info(f"Applying migration {version:03d} '{name}'...")
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Migration {version:03d} '{name}' failed: {e}")
+            raise
+        applied.append(version)
+    if not applied:
+        logger.info("Database schema is up to date")
+    return applied
+
+
+def migration_status(conn):
+    """DataFrame with every known migration and when it was applied."""
+    applied_versions(conn)
+    applied = pd.read_sql_query("SELECT version, applied_at FROM schema_migrations", conn)
+    applied_at = dict(zip(applied["version"], applied["applied_at"]))
+    return pd.DataFrame(
+        [(version, name, applied_at.get(version)) for version, name, _ in MIGRATIONS],
+        columns=["version", "name", "applied_at"]
+    )
+
+
+def ensure_partitions(conn, start, end):
+    """Create the monthly measurement partitions covering [start, end] (no-op if not partitioned)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regproc('measurement_ensure_partition') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return
+        month = datetime(start.year, start.month, 1)
+        while month <= end:
+            cur.execute("SELECT measurement_ensure_partition(%s)", (month,))
+            month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+    conn.commit()
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Versioned schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list migrations and their state")
+    run = sub.add_parser("migrate", help="apply pending migrations")
+    run.add_argument("--to", type=int, default=None, help="stop at this version")
+    args = parser.parse_args(argv)
+
+    with pool.connection() as conn:
+        if args.command == "status":
+            print(migration_status(conn).to_string(index=False))
+        else:
+            migrate(conn, args.to)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
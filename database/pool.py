@@ -0,0 +1,250 @@
+"""
+Thread-safe PostgreSQL connection pool shared by every endpoint of server.py.
+Connections are opened lazily (importing the server never touches the database),
+checked before being handed out, and always returned through a context manager.
+The pool also keeps statistics (in use, waiting, checkout latency) for monitoring.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from components.logger import logger
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Pool of psycopg2 connections with a min/max size.
+
+    Parameters:
+        minconn (int): connections opened on first use and kept idle afterwards
+        maxconn (int): hard limit of open connections
+        timeout (float): seconds to wait for a free connection before PoolTimeout
+        check_interval (float): idle seconds after which a connection is pinged on borrow
+                                (0 pings on every checkout)
+        **connect_kwargs: arguments passed to psycopg2.connect (host, database, ...)
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=10.0, check_interval=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: need 0 <= minconn <= maxconn and maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()        # (connection, last time it was returned)
+        self._size = 0              # open connections, idle + in use
+        self._waiting = 0
+        self._prefilled = False
+        self._closed = False
+
+        # statistics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._failed_checks = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+    # --- connection lifecycle ---
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _prefill(self):
+        # Open the minimum number of connections the first time the pool is used
+        self._prefilled = True
+        for _ in range(self.minconn):
+            with self._cond:
+                if self._size >= self.minconn:
+                    break
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_healthy(self, conn, last_used):
+        """Check a connection before lending it: closed or broken connections are discarded."""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Borrow a connection, waiting up to `timeout` seconds (default: pool timeout)."""
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+        if not self._prefilled:
+            self._prefill()
+
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            last_used = None
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"(max {self.maxconn} in use)"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                # Open a new connection outside the lock
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, last_used):
+                self._failed_checks += 1
+                logger.warning("Discarding broken database connection from the pool")
+                self._discard(conn)
+                continue
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._checkout_time_total += elapsed
+                self._checkout_time_max = max(self._checkout_time_max, elapsed)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a borrowed connection. Open transactions are rolled back."""
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager: `with pool.connection() as conn:` always gives the connection back."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    @contextmanager
+    def cursor(self, timeout=None):
+        """Context manager yielding a cursor on a pooled connection; commits on success."""
+        with self.connection(timeout) as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+                conn.commit()
+            finally:
+                cur.close()
+
+    def closeall(self):
+        """Close idle connections and refuse new checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._cond.notify_all()
+
+    # --- monitoring ---
+
+    def stats(self):
+        """Snapshot of the pool state and checkout latency."""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "failed_health_checks": self._failed_checks,
+                "checkout_ms_avg": round(1000 * self._checkout_time_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "checkout_ms_max": round(1000 * self._checkout_time_max, 3),
+            }
+
+
+"""
+# Example of usage:
+from database.pool import ConnectionPool
+pool = ConnectionPool(minconn=1, maxconn=5, host="localhost", database="lombardia_air_quality",
+                      user="airdata_user", password="user")
+
+with pool.connection() as conn:       # connection is returned even if the block raises
+    df = pd.read_sql_query("SELECT * FROM station", conn)
+
+with pool.cursor() as cur:            # commit on success, rollback on error
+    cur.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s)", ("a", "b", "c"))
+
+print(pool.stats())                   # {'size': 1, 'in_use': 0, 'waiting': 0, 'checkout_ms_avg': 0.2, ...}
+"""
@@ -0,0 +1,310 @@
+"""
+SQL used by the Flask API (server.py).
+Each builder returns a (query, params) tuple, so the same statements can be
+executed by the endpoints and inspected by maintenance tools.
+Aggregate endpoints are routed to the rollup tables (database/rollup.py) when available.
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pandas as pd
+
+from database.rollup import plan_segments, province_segments_sql, to_timestamp
+
+
+PROVINCES_QUERY = "SELECT DISTINCT provincia FROM station ORDER BY provincia"
+
+
+def latest_measurement_query(use_rollups=False):
+    """Timestamp of the most recent measurement."""
+    if use_rollups:
+        # High-water mark stored by the last rollup refresh: no scan of the measurement table
+        return "SELECT refreshed_until FROM rollup_state WHERE name = 'measurement'", ()
+    return "SELECT MAX(data) FROM measurement", ()
+
+
+# Columns clients may select with `fields=`; the defaults are the historical response columns
+STATION_FIELDS = ["idsensore", "nometiposensore", "unitamisura", "idstazione", "nomestazione", "quota",
+                  "provincia", "comune", "datastart", "datastop", "lat", "lng"]
+STATION_DEFAULT_FIELDS = ["nomestazione", "lat", "lng", "nometiposensore", "idsensore", "provincia"]
+MEASUREMENT_FIELDS = ["idsensore", "data", "valore", "stato", "idoperatore"]
+
+# Keyset (pagination) columns of each endpoint
+STATION_KEYS = ["idsensore"]
+MEASUREMENT_KEYS = ["idsensore", "data"]
+
+
+def _select_columns(fields, default, keys):
+    """Requested columns, plus the keyset columns needed to build the next cursor."""
+    columns = list(fields or default)
+    return columns + [k for k in keys if k not in columns]
+
+
+def stations_query(pollutant=None, fields=None, after=None, limit=None):
+    """
+    Stations with coordinates, optionally of one pollutant.
+    With `limit` and/or `after` the result is a keyset page ordered by idsensore;
+    limit + 1 rows are fetched so split_page() can tell whether a next page exists.
+    """
+    paged = limit is not None or after is not None
+    columns = _select_columns(fields, STATION_DEFAULT_FIELDS, STATION_KEYS if paged else [])
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM station
+        WHERE lat IS NOT NULL AND lng IS NOT NULL
+    """
+    params = []
+    if pollutant:
+        query += " AND nometiposensore = %s"
+        params.append(pollutant)
+    if after is not None:
+        query += " AND idsensore > %s"
+        params.extend(after)
+    if paged:
+        query += " ORDER BY idsensore"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, tuple(params)
+
+
+def measurements_query(idsensore=None, fields=None, after=None, limit=None, start_date=None, end_date=None):
+    """
+    Valid measurements, optionally of some sensors (one ID or a list) and a date range.
+    Sensors' series come one after the other, each ordered by time (all sensors: ordered by time).
+    With `limit` and/or `after` the result is a keyset page ordered by (idsensore, data),
+    read straight from the (idsensore, data) index whatever the page number.
+    """
+    paged = limit is not None or after is not None
+    columns = _select_columns(fields, MEASUREMENT_FIELDS, MEASUREMENT_KEYS if paged else [])
+    query = f"SELECT {', '.join(columns)} FROM measurement WHERE stato = 'VA' "
+    params = []
+
+    if isinstance(idsensore, str):
+        idsensore = [idsensore]
+    if idsensore:
+        query += " AND idsensore = ANY(%s)"
+        params.append(list(idsensore))
+
+    if start_date:
+        query += " AND data >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND data <= %s"
+        params.append(end_date)
+
+    if after is not None:
+        query += " AND (idsensore, data) > (%s, %s)"
+        params.extend(after)
+
+    if paged or idsensore:
+        query += " ORDER BY idsensore, data"
+    else:
+        query += " ORDER BY data ASC"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, tuple(params)
+
+
+def align_series(df, value="valore"):
+    """
+    Time-aligned merge of the series of several sensors: one row per timestamp and
+    one column per sensor (named by its idsensore), NaN where a sensor has no value
+    (null in the JSON records, see components/response_format.py).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["data"])
+    df = df.assign(**{value: pd.to_numeric(df[value], errors="coerce")})
+    wide = df.pivot_table(index="data", columns="idsensore", values=value, aggfunc="first")
+    wide.columns = [str(c) for c in wide.columns]
+    return wide.reset_index()
+
+
+def encode_cursor(values):
+    """Opaque page token for a keyset position (list of key values)."""
+    values = [v.isoformat() if isinstance(v, (datetime, pd.Timestamp)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, keys):
+    """Key values of a page token built on `keys`; raises ValueError if the token is not valid."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Invalid cursor")
+    return [to_timestamp(v) if k == "data" else v for k, v in zip(keys, values)]
+
+
+def split_page(df, limit, keys, fields=None):
+    """
+    Trim the look-ahead row of a page query.
+    Returns (page without the columns added only for the cursor, next cursor or None).
+    """
+    next_cursor = None
+    if limit is not None and len(df) > limit:
+        df = df.iloc[:limit]
+        next_cursor = encode_cursor([df[k].iloc[-1] for k in keys])
+    if fields:
+        df = df[list(fields)]
+    return df, next_cursor
+
+
+def measurements_filters_query(provincia=None, pollutant=None, start_date=None, end_date=None, use_rollups=False):
+    """Average value per timestamp, optionally filtered by province, pollutant and date range."""
+    if use_rollups:
+        # Output is one row per timestamp, so the hourly rollup is the coarsest usable grain
+        columns = ["data", "provincia"] if provincia else ["data"]
+        segments = plan_segments(to_timestamp(start_date), to_timestamp(end_date), coarsest="hour")
+        union, params = province_segments_sql(segments, columns, {"provincia": provincia, "pollutant": pollutant})
+        group_by = ", ".join(columns)
+        query = f"""
+            SELECT data, SUM(total) / SUM(n) AS valore{', provincia' if provincia else ''}
+            FROM ({union}) AS parts
+            GROUP BY {group_by}
+            ORDER BY data
+        """
+        return query, tuple(params)
+
+    params = []
+
+    # Build SELECT and GROUP BY clauses dynamically depending on presence of 'provincia'
+    if provincia:
+        # Include province in SELECT and group by it
+        select_clause = "SELECT m.data, AVG(m.valore) AS valore, s.provincia"
+        group_by_clause = "GROUP BY m.data, s.provincia"
+    else:
+        # Exclude province if not specified in input
+        select_clause = "SELECT m.data, AVG(m.valore) AS valore"
+        group_by_clause = "GROUP BY m.data"
+
+    # Base SQL query with JOIN between measurement and station
+    query = f"""
+        {select_clause}
+        FROM measurement m
+        JOIN station s ON m.idsensore = s.idsensore
+        WHERE m.stato = 'VA'
+    """
+
+    # Add optional filters dynamically
+    if provincia:
+        query += " AND s.provincia = %s"
+        params.append(provincia)
+
+    if pollutant:
+        query += " AND s.nometiposensore = %s"
+        params.append(pollutant)
+
+    if start_date:
+        query += " AND m.data >= %s"
+        params.append(start_date)
+
+    if end_date:
+        query += " AND m.data <= %s"
+        params.append(end_date)
+
+    # Finalize the query with GROUP BY and ORDER BY
+    query += f" {group_by_clause} ORDER BY m.data"
+    return query, tuple(params)
+
+
+def measurements_pollutants_query(pollutants, provincia=None, start_date=None, end_date=None, use_rollups=False):
+    """
+    Average value per timestamp of several pollutants in one grouped query,
+    optionally filtered by province and date range: one series per nometiposensore.
+    """
+    if use_rollups:
+        segments = plan_segments(to_timestamp(start_date), to_timestamp(end_date), coarsest="hour")
+        union, params = province_segments_sql(
+            segments, ["data", "nometiposensore"], {"provincia": provincia, "pollutants": pollutants}
+        )
+        query = f"""
+            SELECT data, nometiposensore, SUM(total) / SUM(n) AS valore
+            FROM ({union}) AS parts
+            GROUP BY data, nometiposensore
+            ORDER BY nometiposensore, data
+        """
+        return query, tuple(params)
+
+    query = """
+        SELECT m.data, s.nometiposensore, AVG(m.valore) AS valore
+        FROM measurement m
+        JOIN station s ON m.idsensore = s.idsensore
+        WHERE m.stato = 'VA' AND s.nometiposensore = ANY(%s)
+    """
+    params = [list(pollutants)]
+    if provincia:
+        query += " AND s.provincia = %s"
+        params.append(provincia)
+    if start_date:
+        query += " AND m.data >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND m.data <= %s"
+        params.append(end_date)
+    query += " GROUP BY m.data, s.nometiposensore ORDER BY s.nometiposensore, m.data"
+    return query, tuple(params)
+
+
+# Columns of avg_province_query, no row
+EMPTY_AVG_PROVINCE_QUERY = "SELECT NULL AS unitamisura, NULL AS provincia, NULL AS mean WHERE 1 = 0"
+
+
+def avg_province_query(pollutant, start_date=None, end_date=None, latest=None, use_rollups=False):
+    """
+    Average value per province for a pollutant over a date range.
+    Without a range the last 7 days before `latest` (most recent measurement) are used,
+    and no row is returned when there is no measurement (`latest` None).
+    """
+    if not start_date or not end_date:
+        if latest is None:
+            return EMPTY_AVG_PROVINCE_QUERY, ()
+        start_date, end_date = to_timestamp(latest) - timedelta(days=7), None
+
+    if use_rollups:
+        segments = plan_segments(to_timestamp(start_date), to_timestamp(end_date), coarsest="day")
+        union, params = province_segments_sql(segments, ["unitamisura", "provincia"], {"pollutant": pollutant})
+        query = f"""
+            SELECT unitamisura, provincia, SUM(total) / SUM(n) AS mean
+            FROM ({union}) AS parts
+            GROUP BY provincia, unitamisura
+        """
+        return query, tuple(params)
+
+    query = """
+        SELECT s.unitamisura, s.provincia, AVG(m.valore) as mean
+        FROM measurement as m JOIN station as s ON m.idsensore = s.idsensore
+        WHERE s.nometiposensore = %s AND m.data >= %s
+        AND m.stato = 'VA'
+    """
+    params = [pollutant, start_date]
+    if end_date:
+        query += " AND m.data <= %s"
+        params.append(end_date)
+    query += " GROUP BY s.provincia, s.unitamisura;"
+    return query, tuple(params)
+
+
+def fetch_batches(conn, query, params=(), batch_size=10000):
+    """
+    Run a query on a server-side (named) cursor and yield DataFrames of `batch_size` rows,
+    so memory stays flat whatever the result size. At least one (maybe empty) batch is yielded.
+    """
+    with conn.cursor(name=f"stream_{uuid4().hex}") as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        yielded = False
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows and yielded:
+                break
+            # description is only available after the first fetch on named cursors
+            yield pd.DataFrame.from_records(rows, columns=[desc[0] for desc in cur.description], coerce_float=True)
+            yielded = True
+            if len(rows) < batch_size:
+                break
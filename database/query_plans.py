@@ -0,0 +1,194 @@
+"""
+EXPLAIN-based check that the API queries use the indexes and partitions created
+by database/migrations.py. Each query of database/queries.py is explained with
+parameters taken from the data, and the plan is searched for the expected indexes
+and for partition pruning on date ranges:
+    python -m database.query_plans
+    python -m database.query_plans --force-index     # small test databases: disable seq scans
+Exit status is 1 if any query misses its expectations, or if there is no data to sample.
+"""
+
+import argparse
+import json
+import sys
+from datetime import timedelta
+
+from components.logger import logger, setup_logging
+from database import queries
+from database.rollup import rollups_available
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def _parent_index_names(conn):
+    """Map index names of the partitions to the index defined on the partitioned table."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, p.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE c.relkind = 'i'
+        """)
+        return dict(cur.fetchall())
+
+
+def _measurement_partitions(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('measurement')
+        """)
+        return {row[0] for row in cur.fetchall()}
+
+
+def explain(conn, query, params, analyze=False):
+    """Return the JSON plan of a query."""
+    with conn.cursor() as cur:
+        cur.execute(f"EXPLAIN (FORMAT JSON{', ANALYZE' if analyze else ''}) {query}", params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def summarize_plan(plan, parents, partitions):
+    """Indexes (by parent name), relations and measurement partitions touched by a plan."""
+    indexes, relations, scanned = set(), set(), set()
+    for node in _walk(plan):
+        if "Index Name" in node:
+            indexes.add(parents.get(node["Index Name"], node["Index Name"]))
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+            if node["Relation Name"] in partitions:
+                scanned.add(node["Relation Name"])
+    return {"indexes": indexes, "relations": relations, "partitions": scanned}
+
+
+def _sample_parameters(conn):
+    """
+    Pick a sensor, pollutant, province and a one-month range that exist in the data.
+    Raises LookupError when there are no stations or no measurements (e.g. a freshly migrated database).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.idsensore, s.nometiposensore, s.provincia
+            FROM station s
+            WHERE s.nometiposensore IS NOT NULL AND s.provincia IS NOT NULL
+            ORDER BY s.idsensore LIMIT 1
+        """)
+        station = cur.fetchone()
+        cur.execute(*queries.latest_measurement_query())
+        latest = cur.fetchone()[0]
+    conn.rollback()
+    if station is None or latest is None:
+        raise LookupError(f"No data to sample: the {'station' if station is None else 'measurement'} table is empty")
+    idsensore, pollutant, provincia = station
+    return {
+        "idsensore": idsensore,
+        "pollutant": pollutant,
+        "provincia": provincia,
+        "start_date": latest - timedelta(days=30),
+        "end_date": latest,
+        "latest": latest,
+    }
+
+
+def planned_checks(conn):
+    """(name, query, params, expectation) for every API query."""
+    p = _sample_parameters(conn)
+    use_rollups = rollups_available(conn)
+    rollup_indexes = {"rollup_province_hourly_pkey", "rollup_province_daily_pkey",
+                      "rollup_province_hourly_bucket_idx", "rollup_province_daily_bucket_idx"}
+    range_indexes = {"measurement_data_brin", "measurement_valid_data_idx", "measurement_valid_sensor_idx"}
+
+    checks = [
+        ("latest measurement", *queries.latest_measurement_query(use_rollups),
+         {"indexes": {"rollup_state_pkey", "measurement_valid_data_idx"}} if use_rollups else {}),
+        ("stations", *queries.stations_query(p["pollutant"]),
+         {"indexes": {"station_pollutant_province_idx"}}),
+        ("measurements", *queries.measurements_query(p["idsensore"]),
+         {"indexes": {"measurement_valid_sensor_idx", "measurement_pkey"}}),
+        ("measurements (keyset page)", *queries.measurements_query(
+            after=[p["idsensore"], p["start_date"]], limit=1000),
+         {"indexes": {"measurement_valid_sensor_idx", "measurement_pkey"}}),
+        ("measurements_filters", *queries.measurements_filters_query(
+            p["provincia"], p["pollutant"], p["start_date"], p["end_date"], use_rollups=use_rollups),
+         {"indexes": rollup_indexes | range_indexes | {"station_pollutant_province_idx"}, "pruned": True}),
+        ("measurements_pollutants", *queries.measurements_pollutants_query(
+            [p["pollutant"]], p["provincia"], p["start_date"], p["end_date"], use_rollups=use_rollups),
+         {"indexes": rollup_indexes | range_indexes | {"station_pollutant_province_idx"}, "pruned": True}),
+        ("avg_province_time", *queries.avg_province_query(
+            p["pollutant"], p["start_date"], p["end_date"], use_rollups=use_rollups),
+         {"indexes": rollup_indexes | range_indexes, "pruned": True}),
+        ("avg_province_time (last 7 days)", *queries.avg_province_query(
+            p["pollutant"], latest=p["latest"], use_rollups=use_rollups),
+         {"indexes": rollup_indexes | range_indexes, "pruned": True}),
+    ]
+    return checks
+
+
+def check_query_plans(conn, force_index=False, analyze=False):
+    """
+    Explain every API query and compare with its expectations.
+    Returns a list of result dicts with an 'ok' flag and the reasons of failures.
+    """
+    parents = _parent_index_names(conn)
+    partitions = _measurement_partitions(conn)
+    results = []
+
+    for name, query, params, expected in planned_checks(conn):
+        with conn.cursor() as cur:
+            if force_index:
+                # Tiny test tables are cheaper to scan sequentially: check the indexes are usable
+                cur.execute("SET LOCAL enable_seqscan = off")
+        plan = explain(conn, query, params, analyze)
+        conn.rollback()
+
+        found = summarize_plan(plan, parents, partitions)
+        problems = []
+        if "indexes" in expected and not (found["indexes"] & expected["indexes"]):
+            problems.append(f"none of {sorted(expected['indexes'])} used")
+        if expected.get("pruned") and partitions and found["partitions"] and len(found["partitions"]) >= len(partitions):
+            problems.append(f"no partition pruning ({len(found['partitions'])}/{len(partitions)} partitions scanned)")
+
+        results.append({
+            "query": name,
+            "ok": not problems,
+            "indexes": sorted(found["indexes"]),
+            "partitions": f"{len(found['partitions'])}/{len(partitions)}" if partitions else "not partitioned",
+            "problems": problems,
+        })
+    return results
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Check that the API queries use the expected indexes")
+    parser.add_argument("--force-index", action="store_true", help="disable sequential scans (small databases)")
+    parser.add_argument("--analyze", action="store_true", help="run EXPLAIN ANALYZE (executes the queries)")
+    args = parser.parse_args(argv)
+
+    try:
+        with pool.connection() as conn:
+            results = check_query_plans(conn, args.force_index, args.analyze)
+    except LookupError as e:
+        logger.error(f"{e}: load some data before checking the query plans")
+        return 1
+
+    for r in results:
+        status = "OK  " if r["ok"] else "FAIL"
+        print(f"{status} {r['query']:<32} partitions {r['partitions']:<16} indexes: {', '.join(r['indexes']) or '-'}")
+        for problem in r["problems"]:
+            print(f"     -> {problem}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    setup_logging()
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""
+Pre-aggregated rollups of the measurement table.
+Valid ('VA') measurements are summarised per sensor and per province/pollutant
+at hourly and daily grain (count, sum, min, max, sum of squares), so averages
+over long ranges read a few thousand rollup rows instead of millions of raw rows.
+
+The rollups are refreshed incrementally after each ingestion run:
+    python -m database.rollup refresh --since "2024-12-01"
+and rebuilt from scratch with:
+    python -m database.rollup rebuild
+A station sync recomputes, from the sensor rollups, the province groups its changes move sensors in or out of.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from components.logger import logger, setup_logging
+from database.versions import bump_data_version
+
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# Grains ordered from the coarsest to the finest
+GRAINS = {"day": DAY, "hour": HOUR}
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS rollup_sensor_hourly (
+        bucket TIMESTAMP NOT NULL,
+        idsensore TEXT NOT NULL,
+        n BIGINT NOT NULL,
+        total NUMERIC NOT NULL,
+        minimum NUMERIC,
+        maximum NUMERIC,
+        total_sq NUMERIC NOT NULL,
+        PRIMARY KEY (idsensore, bucket)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_sensor_daily (LIKE rollup_sensor_hourly INCLUDING ALL);
+
+    CREATE TABLE IF NOT EXISTS rollup_province_hourly (
+        bucket TIMESTAMP NOT NULL,
+        nometiposensore TEXT NOT NULL,
+        provincia TEXT NOT NULL,
+        unitamisura TEXT NOT NULL DEFAULT '',
+        n BIGINT NOT NULL,
+        total NUMERIC NOT NULL,
+        minimum NUMERIC,
+        maximum NUMERIC,
+        total_sq NUMERIC NOT NULL,
+        PRIMARY KEY (nometiposensore, provincia, unitamisura, bucket)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_province_daily (LIKE rollup_province_hourly INCLUDING ALL);
+
+    CREATE INDEX IF NOT EXISTS rollup_province_hourly_bucket_idx ON rollup_province_hourly (bucket);
+    CREATE INDEX IF NOT EXISTS rollup_province_daily_bucket_idx ON rollup_province_daily (bucket);
+
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        refreshed_until TIMESTAMP,
+        refreshed_at TIMESTAMP
+    );
+"""
+
+ROLLUP_TABLES = ["rollup_sensor_hourly", "rollup_sensor_daily", "rollup_province_hourly", "rollup_province_daily"]
+
+
+def create_rollup_tables(conn):
+    """Create the rollup tables if they do not exist."""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+    conn.commit()
+
+
+# --- Refresh ---
+
+# (nometiposensore, provincia, unitamisura) among the groups passed as the arrays %(types)s, %(provinces)s, %(units)s
+GROUP_IN = "({}) IN (SELECT * FROM unnest(%(types)s::text[], %(provinces)s::text[], %(units)s::text[]))"
+
+
+def _refresh_statements(since, groups=False):
+    """
+    SQL statements recomputing every bucket from `since` on (all buckets if None).
+    Whole buckets are deleted and re-inserted, so the refresh is idempotent.
+    Hourly sensor rollups come from raw rows, every other rollup from the finer one.
+    With `groups`, the province statements only touch the province/pollutant groups of GROUP_IN.
+    """
+    hour_from = "WHERE bucket >= date_trunc('hour', %(since)s::timestamp)" if since else ""
+    day_from = "WHERE bucket >= date_trunc('day', %(since)s::timestamp)" if since else ""
+    raw_hour_from = "AND data >= date_trunc('hour', %(since)s::timestamp)" if since else ""
+    sensor_hour_from = "AND r.bucket >= date_trunc('hour', %(since)s::timestamp)" if since else ""
+    hour_day_from = "WHERE bucket >= date_trunc('day', %(since)s::timestamp)" if since else ""
+    province_hour_from, province_day_from, province_hour_day_from = hour_from, day_from, hour_day_from
+    if groups:
+        in_groups = GROUP_IN.format("nometiposensore, provincia, unitamisura")
+        province_hour_from = f"{hour_from} AND {in_groups}" if since else f"WHERE {in_groups}"
+        province_day_from = f"{day_from} AND {in_groups}" if since else f"WHERE {in_groups}"
+        province_hour_day_from = f"{hour_day_from} AND {in_groups}" if since else f"WHERE {in_groups}"
+        sensor_hour_from += " AND " + GROUP_IN.format("s.nometiposensore, s.provincia, COALESCE(s.unitamisura, '')")
+
+    return [
+        # per sensor, hourly: from raw measurements
+        f"DELETE FROM rollup_sensor_hourly {hour_from}",
+        f"""
+        INSERT INTO rollup_sensor_hourly (bucket, idsensore, n, total, minimum, maximum, total_sq)
+        SELECT date_trunc('hour', data), idsensore, COUNT(valore), SUM(valore), MIN(valore), MAX(valore),
+               SUM(valore * valore)
+        FROM measurement
+        WHERE stato = 'VA' AND valore IS NOT NULL {raw_hour_from}
+        GROUP BY 1, 2
+        """,
+        # per sensor, daily: from the hourly rollup
+        f"DELETE FROM rollup_sensor_daily {day_from}",
+        f"""
+        INSERT INTO rollup_sensor_daily (bucket, idsensore, n, total, minimum, maximum, total_sq)
+        SELECT date_trunc('day', bucket), idsensore, SUM(n), SUM(total), MIN(minimum), MAX(maximum), SUM(total_sq)
+        FROM rollup_sensor_hourly
+        {hour_day_from}
+        GROUP BY 1, 2
+        """,
+        # per province and pollutant, hourly: sensor rollup joined with the station catalogue
+        f"DELETE FROM rollup_province_hourly {province_hour_from}",
+        f"""
+        INSERT INTO rollup_province_hourly (bucket, nometiposensore, provincia, unitamisura, n, total, minimum, maximum, total_sq)
+        SELECT r.bucket, s.nometiposensore, s.provincia, COALESCE(s.unitamisura, ''),
+               SUM(r.n), SUM(r.total), MIN(r.minimum), MAX(r.maximum), SUM(r.total_sq)
+        FROM rollup_sensor_hourly r
+        JOIN station s ON r.idsensore = s.idsensore
+        WHERE s.nometiposensore IS NOT NULL AND s.provincia IS NOT NULL {sensor_hour_from}
+        GROUP BY 1, 2, 3, 4
+        """,
+        # per province and pollutant, daily: from the hourly province rollup
+        f"DELETE FROM rollup_province_daily {province_day_from}",
+        f"""
+        INSERT INTO rollup_province_daily (bucket, nometiposensore, provincia, unitamisura, n, total, minimum, maximum, total_sq)
+        SELECT date_trunc('day', bucket), nometiposensore, provincia, unitamisura,
+               SUM(n), SUM(total), MIN(minimum), MAX(maximum), SUM(total_sq)
+        FROM rollup_province_hourly
+        {province_hour_day_from}
+        GROUP BY 1, 2, 3, 4
+        """,
+    ]
+
+
+def refresh_rollups(conn, since=None):
+    """
+    Refresh the rollups for measurements with data >= `since`.
+    If `since` is None, the refresh starts from the stored high-water mark;
+    if no refresh ever ran, every rollup is rebuilt.
+    Returns the new high-water mark (latest measurement timestamp).
+    """
+    started = time.perf_counter()
+    create_rollup_tables(conn)
+
+    with conn.cursor() as cur:
+        if since is None:
+            cur.execute("SELECT refreshed_until FROM rollup_state WHERE name = 'measurement'")
+            row = cur.fetchone()
+            since = row[0] if row else None
+
+        params = {"since": since}
+        for statement in _refresh_statements(since):
+            cur.execute(statement, params)
+
+        cur.execute("SELECT MAX(data) FROM measurement")
+        refreshed_until = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO rollup_state (name, refreshed_until, refreshed_at)
+            VALUES ('measurement', %s, now())
+            ON CONFLICT (name) DO UPDATE
+            SET refreshed_until = EXCLUDED.refreshed_until, refreshed_at = EXCLUDED.refreshed_at
+        """, (refreshed_until,))
+    # cached API results computed from the old rollups are now stale
+    bump_data_version(conn, "measurement", commit=False)
+    conn.commit()
+
+    logger.info(f"Rollups refreshed since '{since or 'beginning'}' in {time.perf_counter() - started:.2f}s")
+    return refreshed_until
+
+
+def rebuild_rollups(conn):
+    """Drop every rollup row and recompute from the raw measurements (e.g. after station changes)."""
+    create_rollup_tables(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(ROLLUP_TABLES)}")
+        cur.execute("DELETE FROM rollup_state WHERE name = 'measurement'")
+    conn.commit()
+    return refresh_rollups(conn)
+
+
+def rebuild_province_rollups(conn, groups=None, commit=True):
+    """
+    Recompute the province rollups from the sensor rollups after station changes (a sensor's
+    province, pollutant or unit): no raw rows are read. `groups` limits it to the
+    (nometiposensore, provincia, unitamisura) groups a change moved sensors out of or into
+    (None: every group). Does nothing, and returns False, while the rollups were never refreshed.
+    Without `commit`, runs in the caller's transaction.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('rollup_state') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute("SELECT 1 FROM rollup_state WHERE name = 'measurement' AND refreshed_until IS NOT NULL")
+        if cur.fetchone() is None:
+            return False
+        started = time.perf_counter()
+        params = {}
+        if groups is not None:
+            groups = list(groups)
+            params = {"types": [g[0] for g in groups], "provinces": [g[1] for g in groups],
+                      "units": [g[2] or "" for g in groups]}
+        for statement in _refresh_statements(None, groups is not None)[4:]:   # the province statements
+            cur.execute(statement, params)
+    if commit:
+        conn.commit()
+    logger.info(f"Province rollups of {'every group' if groups is None else f'{len(groups)} groups'} "
+                f"rebuilt in {time.perf_counter() - started:.2f}s")
+    return True
+
+
+_rollups_ready = False
+
+def rollups_available(conn):
+    """True once the rollups exist and have been refreshed at least once."""
+    global _rollups_ready
+    if _rollups_ready:
+        return True
+    if getattr(conn, "dialect", "postgres") != "postgres":
+        return False   # the embedded database has no rollup tables
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('rollup_state') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT 1 FROM rollup_state WHERE name = 'measurement' AND refreshed_until IS NOT NULL")
+            _rollups_ready = cur.fetchone() is not None
+    conn.rollback()
+    return _rollups_ready
+
+
+# --- Query routing ---
+
+def _floor(ts, step):
+    if step == DAY:
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil(ts, step):
+    floored = _floor(ts, step)
+    return floored if floored == ts else floored + step
+
+
+def to_timestamp(value):
+    """Parse a date parameter ('2024-12-01', '2024-12-01 00:00:00', ISO strings...) to datetime; ValueError if it is not one."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    parsed = pd.Timestamp(value)
+    if parsed is pd.NaT:
+        raise ValueError(f"Not a date: '{value}'")
+    return parsed.to_pydatetime().replace(tzinfo=None)
+
+
+def plan_segments(start=None, end=None, coarsest="day"):
+    """
+    Split the inclusive range [start, end] into segments answered by the coarsest rollup possible.
+
+    Returns a list of (source, lo, hi, closed) where source is 'day', 'hour' or 'raw'.
+    Segments cover [lo, hi), or [lo, hi] when closed is True: the trailing hour up to
+    `end` always comes from raw rows because the API treats end_date as inclusive.
+    None means unbounded.
+    """
+    if start is not None and end is not None and start > end:
+        return [("raw", start, end, True)]
+
+    segments = []
+    lo, hi = start, end
+
+    # Leading partial hour from raw rows
+    if start is not None and _floor(start, HOUR) != start:
+        lo = _ceil(start, HOUR)
+        if end is not None and lo > end:
+            return [("raw", start, end, True)]
+        segments.append(("raw", start, lo, False))
+
+    # Trailing hour containing `end` from raw rows
+    tail = None
+    if end is not None:
+        hi = _floor(end, HOUR)
+        tail = ("raw", hi, end, True)
+
+    def split(lo, hi, grains):
+        grain, step = grains[0], GRAINS[grains[0]]
+        if len(grains) == 1:
+            return [(grain, lo, hi, False)]
+        inner_lo = _ceil(lo, step) if lo is not None else None
+        inner_hi = _floor(hi, step) if hi is not None else None
+        if inner_lo is not None and inner_hi is not None and inner_lo >= inner_hi:
+            return split(lo, hi, grains[1:])
+        parts = []
+        if lo is not None and inner_lo != lo:
+            parts += split(lo, inner_lo, grains[1:])
+        parts.append((grain, inner_lo, inner_hi, False))
+        if hi is not None and inner_hi != hi:
+            parts += split(inner_hi, hi, grains[1:])
+        return parts
+
+    if lo is None or hi is None or lo < hi:
+        grains = list(GRAINS)[list(GRAINS).index(coarsest):]
+        segments += split(lo, hi, grains)
+    if tail:
+        segments.append(tail)
+    return segments
+
+
+PROVINCE_TABLES = {"day": "rollup_province_daily", "hour": "rollup_province_hourly"}
+
+
+def province_segments_sql(segments, columns, filters):
+    """
+    UNION ALL of partial aggregates (n, total) for the given segments.
+
+    Parameters:
+        segments (list): output of plan_segments
+        columns (list): output columns, among 'data', 'provincia', 'unitamisura', 'nometiposensore'
+        filters (dict): optional 'provincia' and 'pollutant' equality filters, 'pollutants' list filter
+    Returns:
+        (sql, params): subquery exposing `columns`, n and total
+    """
+    rollup_columns = {"data": "bucket AS data", "provincia": "provincia", "unitamisura": "NULLIF(unitamisura, '') AS unitamisura",
+                      "nometiposensore": "nometiposensore"}
+    raw_columns = {"data": "m.data", "provincia": "s.provincia", "unitamisura": "s.unitamisura",
+                   "nometiposensore": "s.nometiposensore"}
+
+    parts, params = [], []
+    for source, lo, hi, closed in segments:
+        if source == "raw":
+            select = ", ".join([raw_columns[c] for c in columns] + ["1 AS n", "m.valore AS total"])
+            sql = f"""
+                SELECT {select}
+                FROM measurement m JOIN station s ON m.idsensore = s.idsensore
+                WHERE m.stato = 'VA' AND m.valore IS NOT NULL
+            """
+            if filters.get("provincia"):
+                sql += " AND s.provincia = %s"
+                params.append(filters["provincia"])
+            if filters.get("pollutant"):
+                sql += " AND s.nometiposensore = %s"
+                params.append(filters["pollutant"])
+            if filters.get("pollutants"):
+                sql += " AND s.nometiposensore = ANY(%s)"
+                params.append(list(filters["pollutants"]))
+            if lo is not None:
+                sql += " AND m.data >= %s"
+                params.append(lo)
+            if hi is not None:
+                sql += " AND m.data <= %s" if closed else " AND m.data < %s"
+                params.append(hi)
+        else:
+            select = ", ".join([rollup_columns[c] for c in columns] + ["n", "total"])
+            sql = f"SELECT {select} FROM {PROVINCE_TABLES[source]} WHERE TRUE"
+            if filters.get("provincia"):
+                sql += " AND provincia = %s"
+                params.append(filters["provincia"])
+            if filters.get("pollutant"):
+                sql += " AND nometiposensore = %s"
+                params.append(filters["pollutant"])
+            if filters.get("pollutants"):
+                sql += " AND nometiposensore = ANY(%s)"
+                params.append(list(filters["pollutants"]))
+            if lo is not None:
+                sql += " AND bucket >= %s"
+                params.append(lo)
+            if hi is not None:
+                sql += " AND bucket < %s"
+                params.append(hi)
+        parts.append(sql)
+
+    return " UNION ALL ".join(parts), params
+
+
+# --- Command line ---
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Maintain the measurement rollup tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="create the rollup tables")
+    refresh = sub.add_parser("refresh", help="refresh rollups incrementally")
+    refresh.add_argument("--since", help="recompute buckets from this timestamp (default: last high-water mark)")
+    sub.add_parser("rebuild", help="recompute every rollup from raw measurements")
+    args = parser.parse_args(argv)
+
+    with pool.connection() as conn:
+        if args.command == "create":
+            create_rollup_tables(conn)
+        elif args.command == "refresh":
+            refresh_rollups(conn, to_timestamp(args.since))
+        else:
+            rebuild_rollups(conn)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+from database.rollup import refresh_rollups, plan_segments
+refresh_rollups(conn, since=datetime(2024, 12, 1))     # after loading new measurements
+
+plan_segments(datetime(2024, 12, 1, 6), datetime(2024, 12, 31))
+# [('hour', 2024-12-01 06:00, 2024-12-02, False), ('day', 2024-12-02, 2024-12-31, False),
+#  ('raw', 2024-12-31, 2024-12-31, True)]
+"""
@@ -0,0 +1,257 @@
+"""
+Storage backends of the Flask API.
+    postgres   PostgreSQL through the shared connection pool (default)
+    embedded   one DuckDB file in process: the whole stack runs without a database server
+Selected with GEOAIR_STORAGE=postgres|embedded (GEOAIR_EMBEDDED_PATH for the DuckDB file).
+Both run the same SQL of database/queries.py: embedded connections accept the psycopg2
+`%s` placeholders and the DB-API calls the endpoints use, so the server only deals with
+`storage.connection()`, `storage.read_sql()` and `storage.stream()`.
+The embedded database is built by database/embedded.py.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from components.metrics import observe_batches, observe_query
+from database.queries import fetch_batches
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+
+EMBEDDED_PATH = os.environ.get("GEOAIR_EMBEDDED_PATH", os.path.join("data", "geoair.duckdb"))
+
+# Tables of the embedded database: the Postgres schema without PostGIS, partitions and rollups
+EMBEDDED_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS station (
+        idsensore TEXT PRIMARY KEY,
+        nometiposensore TEXT,
+        unitamisura TEXT,
+        idstazione TEXT,
+        nomestazione TEXT,
+        quota TEXT,
+        provincia TEXT,
+        comune TEXT,
+        storico TEXT,
+        datastart TIMESTAMP,
+        datastop TIMESTAMP,
+        utm_nord TEXT,
+        utm_est TEXT,
+        lat DOUBLE,
+        lng DOUBLE,
+        locationtxt TEXT
+    );
+    CREATE TABLE IF NOT EXISTS measurement (
+        idsensore TEXT,
+        data TIMESTAMP,
+        valore DOUBLE,
+        stato TEXT,
+        idoperatore TEXT,
+        PRIMARY KEY (idsensore, data)
+    );
+    CREATE SEQUENCE IF NOT EXISTS users_id_seq;
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY DEFAULT nextval('users_id_seq'),
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        type TEXT NOT NULL DEFAULT 'user',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS data_version (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        changed_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+    INSERT INTO data_version (name) VALUES ('station'), ('measurement') ON CONFLICT (name) DO NOTHING;
+"""
+
+
+class PostgresStorage:
+    """The PostgreSQL database behind the connection pool of server.py."""
+
+    name = "postgres"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def connection(self, timeout=None):
+        """Borrow a pooled connection: `with storage.connection() as conn:`."""
+        return self.pool.connection(timeout)
+
+    def read_sql(self, conn, query, params=()):
+        started = time.perf_counter()
+        df = pd.read_sql_query(query, conn, params=params)
+        observe_query(time.perf_counter() - started, len(df))
+        return df
+
+    def stream(self, query, params=(), batch_size=10000):
+        """
+        (batches, release): DataFrames read from a server-side cursor on a connection
+        held until `release()` is called (when the streamed response is closed).
+        """
+        conn = self.pool.getconn()
+        try:
+            return observe_batches(fetch_batches(conn, query, params, batch_size)), lambda: self.pool.putconn(conn)
+        except Exception:
+            self.pool.putconn(conn)
+            raise
+
+    def stats(self):
+        return self.pool.stats()
+
+
+def _placeholders(query):
+    """psycopg2 placeholders (%s, literal %%) to DuckDB ones (?)."""
+    return re.sub(r"%(s|%)", lambda m: "?" if m.group(1) == "s" else "%", query)
+
+
+class EmbeddedCursor:
+    """DB-API cursor over a DuckDB connection, accepting psycopg2-style queries."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.itersize = None   # accepted for server-side cursor compatibility; DuckDB fetches in chunks anyway
+
+    def execute(self, query, params=()):
+        self._conn.execute(_placeholders(query), list(params or ()))
+        return self
+
+    @property
+    def description(self):
+        return self._conn.description
+
+    @property
+    def rowcount(self):
+        return self._conn.rowcount
+
+    def fetchone(self):
+        return self._conn.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._conn.fetchmany(size)
+
+    def fetchall(self):
+        return self._conn.fetchall()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EmbeddedConnection:
+    """
+    DB-API connection of the embedded backend (one DuckDB cursor, i.e. a connection
+    of its own on the shared database). Statements autocommit unless a transaction is open.
+    """
+
+    dialect = "duckdb"
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name=None):
+        # `name` (server-side cursors on Postgres) is accepted and ignored
+        return EmbeddedCursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        try:
+            self._conn.rollback()
+        except duckdb.TransactionException:
+            pass   # nothing to roll back: statements autocommit
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def duckdb(self):
+        """The underlying DuckDB connection, for bulk loads (register DataFrames, COPY...)."""
+        return self._conn
+
+
+class EmbeddedStorage:
+    """
+    A DuckDB database file used in place of Postgres. Opened once per process;
+    every borrowed connection is a DuckDB cursor, so threads do not share state.
+    DuckDB allows one writing process per file: run a single API process on it.
+    """
+
+    name = "embedded"
+
+    def __init__(self, path=EMBEDDED_PATH, read_only=False):
+        if duckdb is None:
+            raise RuntimeError("The embedded storage needs duckdb (pip install duckdb)")
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = duckdb.connect(path, read_only=read_only)
+        # timestamps such as data_version.changed_at are stored in UTC
+        self._db.execute("SET GLOBAL TimeZone = 'UTC'")
+        if not read_only:
+            self._db.execute(EMBEDDED_SCHEMA_SQL)
+        self._lock = threading.Lock()
+        self._borrowed = 0
+
+    @contextmanager
+    def connection(self, timeout=None):
+        with self._lock:
+            conn = self._db.cursor()
+            self._borrowed += 1
+        try:
+            yield EmbeddedConnection(conn)
+        finally:
+            conn.close()
+            with self._lock:
+                self._borrowed -= 1
+
+    def read_sql(self, conn, query, params=()):
+        # DuckDB builds the DataFrame column by column, without going through Python rows
+        started = time.perf_counter()
+        df = conn.duckdb.execute(_placeholders(query), list(params or ())).df()
+        observe_query(time.perf_counter() - started, len(df))
+        return df
+
+    def stream(self, query, params=(), batch_size=10000):
+        with self._lock:
+            conn = self._db.cursor()
+        return observe_batches(fetch_batches(EmbeddedConnection(conn), query, params, batch_size)), conn.close
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "path": self.path, "in_use": self._borrowed}
+
+    def close(self):
+        self._db.close()
+
+
+def create_storage(name, pool, path=EMBEDDED_PATH):
+    """Storage from its configuration name: 'postgres' or 'embedded'."""
+    name = (name or "postgres").lower()
+    if name == "postgres":
+        return PostgresStorage(pool)
+    if name == "embedded":
+        return EmbeddedStorage(path)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+"""
+# Example of usage:
+storage = create_storage("embedded", pool, "data/geoair.duckdb")
+with storage.connection() as conn:
+    df = storage.read_sql(conn, *queries.stations_query("Ozono"))
+"""
@@ -0,0 +1,275 @@
+"""
+Synthetic station and measurement data for scale tests and benchmarks.
+Stations are spread over the real Lombardy provinces (maps/Provinces.csv, placed inside
+the province polygons of maps/Lombardy_admin2.shp) and carry the real `nometiposensore`
+names and units. Each series combines a pollutant level, a seasonal cycle (winter peak
+for NOx and particulates, summer peak for ozone), a diurnal profile (traffic peaks,
+afternoon ozone), a daily "weather" factor and hourly noise; particulates, metals and
+benzo(a)pyrene are daily values as in the real feed. Outages remove whole days, single
+readings go missing, and a share of readings is 'NA' with valore -9999.
+Everything derives from `seed` (one generator per sensor), so two runs with the same
+arguments produce the same rows and benchmark results stay comparable.
+Synthetic sensor ids start at 900000: load them into a dedicated database.
+    python -m database.synthetic --sensors 1000 --start 2015-01-01 --end 2025-01-01
+    python -m database.synthetic --sensors 50 --start 2024-01-01 --storage embedded --path data/bench.duckdb
+"""
+
+import argparse
+import os
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from components.logger import logger, setup_logging
+from database.rollup import rebuild_rollups, to_timestamp
+from database.versions import bump_data_version
+from ingestion.stations import STATION_COLUMNS
+from ingestion.writer import MEASUREMENT_COLUMNS
+
+
+PROVINCES_CSV = os.path.join("maps", "Provinces.csv")
+PROVINCES_SHP = os.path.join("maps", "Lombardy_admin2.shp")
+
+# Province names of the shapefile to the abbreviations used in the database
+PROVINCE_SIGLA = {
+    "Milano": "MI", "Bergamo": "BG", "Brescia": "BS",
+    "Como": "CO", "Cremona": "CR", "Lecco": "LC",
+    "Lodi": "LO", "Mantua": "MN", "Monza and Brianza": "MB",
+    "Pavia": "PV", "Sondrio": "SO", "Varese": "VA"
+}
+
+# Share of the stations (roughly the population) and pollution level of each province
+PROVINCE_WEIGHT = {"MI": 3.2, "BS": 1.25, "BG": 1.1, "VA": 0.9, "MB": 0.9, "CO": 0.6,
+                   "PV": 0.55, "MN": 0.4, "CR": 0.35, "LC": 0.35, "LO": 0.25, "SO": 0.2}
+PROVINCE_LEVEL = {"MI": 1.3, "MB": 1.25, "BG": 1.15, "BS": 1.15, "LO": 1.1, "CR": 1.1, "MN": 1.1,
+                  "PV": 1.05, "CO": 1.0, "VA": 1.0, "LC": 0.95, "SO": 0.7}
+
+# unit, typical level, daily values, seasonal amplitude (> 0 winter peak, < 0 summer peak),
+# diurnal profile, share of the sensors
+Pollutant = namedtuple("Pollutant", ["unit", "level", "daily", "season", "profile", "weight"])
+POLLUTANTS = {
+    "Ossidi di Azoto": Pollutant("µg/m³", 60, False, 0.45, "traffic", 3),
+    "Biossido di Azoto": Pollutant("µg/m³", 35, False, 0.35, "traffic", 3),
+    "Monossido di Azoto": Pollutant("µg/m³", 20, False, 0.6, "traffic", 2),
+    "Ozono": Pollutant("µg/m³", 55, False, -0.55, "afternoon", 2),
+    "PM10 (SM2005)": Pollutant("µg/m³", 30, True, 0.45, "flat", 2),
+    "Particelle sospese PM2.5": Pollutant("µg/m³", 20, True, 0.5, "flat", 1.5),
+    "PM10": Pollutant("µg/m³", 30, False, 0.45, "traffic", 0.5),
+    "Monossido di Carbonio": Pollutant("mg/m³", 0.8, False, 0.4, "traffic", 1),
+    "Biossido di Zolfo": Pollutant("µg/m³", 4, False, 0.3, "flat", 1),
+    "Benzene": Pollutant("µg/m³", 1.5, False, 0.5, "traffic", 1),
+    "Ammoniaca": Pollutant("µg/m³", 10, False, -0.3, "flat", 0.5),
+    "BlackCarbon": Pollutant("µg/m³", 1.5, False, 0.5, "traffic", 0.5),
+    "Benzo(a)pirene": Pollutant("ng/m³", 0.5, True, 0.8, "flat", 0.3),
+    "Arsenico": Pollutant("ng/m³", 0.8, True, 0.3, "flat", 0.2),
+    "Cadmio": Pollutant("ng/m³", 0.3, True, 0.3, "flat", 0.2),
+    "Nikel": Pollutant("ng/m³", 2.0, True, 0.3, "flat", 0.2),
+    "Piombo": Pollutant("ng/m³", 8.0, True, 0.3, "flat", 0.2),
+}
+
+FIRST_SENSOR_ID = 900000
+FIRST_STATION_ID = 9000
+INVALID_VALUE = -9999
+
+
+def _diurnal(profile, hours):
+    """Multiplicative daily cycle (mean close to 1) at the given hours of the day."""
+    if profile == "traffic":
+        return 0.75 + 0.6 * np.exp(-((hours - 8) ** 2) / 4) + 0.5 * np.exp(-((hours - 19) ** 2) / 6)
+    if profile == "afternoon":
+        return 0.45 + 1.1 * np.exp(-((hours - 15) ** 2) / 12)
+    return np.ones_like(hours, dtype=float)
+
+
+def _points_in(geometry, count, rng):
+    """`count` random points inside a polygon (rejection sampling in its bounding box)."""
+    from shapely import contains_xy
+
+    minx, miny, maxx, maxy = geometry.bounds
+    xs, ys = [], []
+    while len(xs) < count:
+        x = rng.uniform(minx, maxx, 4 * count)
+        y = rng.uniform(miny, maxy, 4 * count)
+        inside = contains_xy(geometry, x, y)
+        xs.extend(x[inside])
+        ys.extend(y[inside])
+    return np.array(ys[:count]), np.array(xs[:count])
+
+
+def generate_stations(sensors=100, seed=42, start="2018-01-01"):
+    """
+    DataFrame of `sensors` sensors (STATION_COLUMNS) grouped in stations of 1-6 sensors,
+    each station in a province drawn by weight and placed inside its polygon.
+    """
+    import geopandas as gpd
+
+    rng = np.random.default_rng(seed)
+    names = pd.read_csv(PROVINCES_CSV)["NAME_2"].tolist()
+    shapes = gpd.read_file(PROVINCES_SHP).set_index("NAME_2").geometry
+    siglas = [PROVINCE_SIGLA[name] for name in names]
+    weights = np.array([PROVINCE_WEIGHT[s] for s in siglas])
+    pollutant_names = list(POLLUTANTS)
+    pollutant_weights = np.array([p.weight for p in POLLUTANTS.values()])
+
+    # stations and their sizes until every sensor has one
+    sizes = []
+    while sum(sizes) < sensors:
+        sizes.append(int(min(rng.integers(1, 7), sensors - sum(sizes))))
+    provinces = rng.choice(len(names), size=len(sizes), p=weights / weights.sum())
+    lat = np.empty(len(sizes))
+    lng = np.empty(len(sizes))
+    for p in np.unique(provinces):
+        chosen = provinces == p
+        lat[chosen], lng[chosen] = _points_in(shapes[names[p]], int(chosen.sum()), rng)
+
+    start = to_timestamp(start)
+    rows = []
+    sensor_id = FIRST_SENSOR_ID
+    for k, size in enumerate(sizes):
+        name, sigla = names[provinces[k]], siglas[provinces[k]]
+        station = f"{name} Sito {k + 1:04d}"
+        opened = start - timedelta(days=int(rng.integers(0, 15 * 365)))
+        chosen = rng.choice(len(pollutant_names), size=size, replace=False,
+                            p=pollutant_weights / pollutant_weights.sum())
+        for i in chosen:
+            pollutant = pollutant_names[i]
+            location = {"type": "Point", "coordinates": [round(lng[k], 8), round(lat[k], 8)]}
+            rows.append((str(sensor_id), pollutant, POLLUTANTS[pollutant].unit, str(FIRST_STATION_ID + k),
+                         station, str(int(rng.integers(20, 1200))), sigla, name, "N", opened, None,
+                         None, None, round(lat[k], 8), round(lng[k], 8), str(location)))
+            sensor_id += 1
+    return pd.DataFrame(rows, columns=STATION_COLUMNS)
+
+
+def _series(station, start, end, seed, missing_rate, invalid_rate, outages_per_year):
+    """Measurements of one sensor (DataFrame of MEASUREMENT_COLUMNS), from its own generator."""
+    rng = np.random.default_rng([seed, int(station.idsensore)])
+    pollutant = POLLUTANTS[station.nometiposensore]
+    freq = "D" if pollutant.daily else "h"
+    times = pd.date_range(start, end, freq=freq, inclusive="left")
+    if len(times) == 0:
+        return pd.DataFrame(columns=MEASUREMENT_COLUMNS)
+
+    days = (times - times[0]).days.to_numpy()
+    day_of_year = times.dayofyear.to_numpy()
+    seasonal = 1 + pollutant.season * np.cos(2 * np.pi * (day_of_year - 15) / 365.25)
+    diurnal = _diurnal(pollutant.profile, times.hour.to_numpy())
+    weather = rng.lognormal(0, 0.3, days[-1] + 1)[days]          # one factor per day
+    noise = rng.lognormal(0, 0.2 if not pollutant.daily else 0.1, len(times))
+    level = pollutant.level * PROVINCE_LEVEL.get(station.provincia, 1.0) * rng.uniform(0.8, 1.2)
+    values = np.round(level * seasonal * diurnal * weather * noise, 1 if pollutant.level >= 5 else 2)
+
+    keep = rng.random(len(times)) >= missing_rate
+    # outages: whole days without data
+    for _ in range(rng.poisson(outages_per_year * (days[-1] + 1) / 365.25)):
+        first = rng.integers(0, days[-1] + 1)
+        keep &= ~((days >= first) & (days < first + rng.integers(1, 15)))
+    invalid = rng.random(len(times)) < invalid_rate
+    values = np.where(invalid, INVALID_VALUE, values)
+
+    return pd.DataFrame({
+        "idsensore": station.idsensore,
+        "data": times[keep],
+        "valore": values[keep],
+        "stato": np.where(invalid[keep], "NA", "VA"),
+        "idoperatore": "1",
+    })
+
+
+def generate_measurements(stations, start, end, seed=42, missing_rate=0.02, invalid_rate=0.01,
+                          outages_per_year=2, batch_rows=500000):
+    """Yield DataFrames of about `batch_rows` measurements covering [start, end) for every station."""
+    start, end = to_timestamp(start), to_timestamp(end)
+    batch, size = [], 0
+    for station in stations.itertuples(index=False):
+        series = _series(station, start, end, seed, missing_rate, invalid_rate, outages_per_year)
+        batch.append(series)
+        size += len(series)
+        if size >= batch_rows:
+            yield pd.concat(batch, ignore_index=True)
+            batch, size = [], 0
+    if batch:
+        yield pd.concat(batch, ignore_index=True)
+
+
+def load_synthetic(storage, sensors=100, start="2024-01-01", end="2025-01-01", seed=42, missing_rate=0.02,
+                   invalid_rate=0.01, batch_rows=500000, refresh=True):
+    """
+    Generate and bulk-load a dataset into a storage of database/storage.py (Postgres or embedded).
+    On Postgres the rollups are rebuilt afterwards unless `refresh` is False.
+    Returns a dict of statistics (stations, sensors, measurements, seconds, rows_per_s).
+    """
+    started = time.perf_counter()
+    stations = generate_stations(sensors, seed, start)
+    station_rows = list(stations.itertuples(index=False, name=None))
+    stats = {"stations": stations["idstazione"].nunique(), "sensors": len(stations), "measurements": 0}
+
+    with storage.connection() as conn:
+        if storage.name == "postgres":
+            from ingestion.stations import sync_stations
+            from ingestion.writer import create_measurement_tables, write_measurement_frame
+            sync_stations(conn, station_rows, bump=False)
+            create_measurement_tables(conn)
+            write = write_measurement_frame
+        else:
+            from database.embedded import load_measurements, load_stations
+            load_stations(conn, station_rows)
+            write = load_measurements
+
+        for frame in generate_measurements(stations, start, end, seed, missing_rate, invalid_rate,
+                                           batch_rows=batch_rows):
+            write(conn, frame)
+            stats["measurements"] += len(frame)
+            elapsed = time.perf_counter() - started
+            logger.info(f"{stats['measurements']:,} measurements loaded ({stats['measurements'] / elapsed:,.0f} rows/s)")
+
+        if storage.name == "postgres" and refresh:
+            rebuild_rollups(conn)
+        bump_data_version(conn, "station", "measurement")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["rows_per_s"] = round(stats["measurements"] / stats["seconds"]) if stats["seconds"] else 0
+    logger.info(f"Synthetic dataset: {stats['sensors']} sensors in {stats['stations']} stations, "
+                f"{stats['measurements']:,} measurements in {stats['seconds']}s")
+    return stats
+
+
+def main(argv=None):
+    from database.storage import EMBEDDED_PATH, create_storage
+
+    parser = argparse.ArgumentParser(description="Generate and load a synthetic dataset")
+    parser.add_argument("--sensors", type=int, default=100, help="number of sensors")
+    parser.add_argument("--start", default="2024-01-01", help="first day of the measurements")
+    parser.add_argument("--end", default="2025-01-01", help="day after the last one")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same data)")
+    parser.add_argument("--missing-rate", type=float, default=0.02, help="share of readings dropped")
+    parser.add_argument("--invalid-rate", type=float, default=0.01, help="share of readings with stato 'NA'")
+    parser.add_argument("--storage", choices=["postgres", "embedded"], default="postgres", help="target backend")
+    parser.add_argument("--path", default=EMBEDDED_PATH, help="DuckDB file of the embedded backend")
+    parser.add_argument("--batch-rows", type=int, default=500000, help="rows per bulk insert")
+    parser.add_argument("--no-rollups", action="store_true", help="do not rebuild the rollups (Postgres)")
+    args = parser.parse_args(argv)
+
+    pool = None
+    if args.storage == "postgres":
+        from server import pool
+    storage = create_storage(args.storage, pool, args.path)
+    load_synthetic(storage, args.sensors, args.start, args.end, args.seed, args.missing_rate,
+                   args.invalid_rate, args.batch_rows, refresh=not args.no_rollups)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+stations = generate_stations(sensors=20, seed=1)
+for frame in generate_measurements(stations, "2024-01-01", "2024-02-01", seed=1):
+    ...
+load_synthetic(EmbeddedStorage("data/bench.duckdb"), sensors=1000, start="2015-01-01", end="2025-01-01")
+"""
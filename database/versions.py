@@ -0,0 +1,149 @@
+"""
+Data version stamps.
+Every ingestion step bumps the version of the dataset it changed ('station' or 'measurement')
+in the `data_version` table; the API uses the stamps to invalidate cached results.
+    python -m database.versions                    # show the current versions
+    python -m database.versions bump measurement   # after loading data outside the notebooks
+"""
+
+import argparse
+import threading
+import time
+from collections import namedtuple
+from datetime import timezone
+
+from components.logger import logger, setup_logging
+
+
+DATASETS = ("station", "measurement")
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS data_version (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        changed_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+    INSERT INTO data_version (name) VALUES ('station'), ('measurement') ON CONFLICT (name) DO NOTHING;
+"""
+
+DataVersion = namedtuple("DataVersion", ["version", "changed_at"])
+
+
+def bump_data_version(conn, *names, commit=True):
+    """
+    Increase the version of the given datasets (all if none given).
+    Call it in the transaction that changes the data, or right after it is committed.
+    Returns {name: new version}.
+    """
+    versions = {}
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        for name in names or DATASETS:
+            cur.execute("""
+                INSERT INTO data_version (name, version) VALUES (%s, 1)
+                ON CONFLICT (name) DO UPDATE
+                SET version = data_version.version + 1, changed_at = now()
+                RETURNING version
+            """, (name,))
+            versions[name] = cur.fetchone()[0]
+    if commit:
+        conn.commit()
+    return versions
+
+
+def read_data_versions(conn):
+    """{name: DataVersion} of every dataset (changed_at is timezone-aware); empty if the table was never created."""
+    if getattr(conn, "dialect", "postgres") == "duckdb":
+        # embedded database (database/storage.py): the table always exists, timestamps are UTC
+        with conn.cursor() as cur:
+            cur.execute("SELECT name, version, changed_at FROM data_version")
+            return {name: DataVersion(version, changed_at.replace(tzinfo=timezone.utc))
+                    for name, version, changed_at in cur.fetchall()}
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('data_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return {}
+        cur.execute("SELECT name, version, changed_at AT TIME ZONE current_setting('TimeZone') FROM data_version")
+        return {name: DataVersion(version, changed_at) for name, version, changed_at in cur.fetchall()}
+
+
+class DataVersions:
+    """
+    Current data versions as seen by the API process.
+    The table is read at most once every `check_interval` seconds, so a bump
+    reaches every process within that delay without a query per request.
+    One thread reads at a time, waiting at most `checkout_timeout` seconds for a connection;
+    meanwhile the other threads get the last known versions without waiting (only the very
+    first read is waited for, up to `checkout_timeout`).
+    """
+
+    def __init__(self, pool, check_interval=5.0, checkout_timeout=1.0):
+        self.pool = pool
+        self.check_interval = check_interval
+        self.checkout_timeout = checkout_timeout
+        self._versions = {}
+        self._checked_at = None
+        self._refreshing = False
+        self._loaded = threading.Event()   # set once a read finished (successful or not)
+        self._lock = threading.Lock()      # guards the fields above, never held during the read
+
+    def current(self):
+        """{name: DataVersion}; the last known versions are kept if the database cannot be read."""
+        now = time.monotonic()
+        with self._lock:
+            due = self._checked_at is None or now - self._checked_at >= self.check_interval
+            if not due:
+                return self._versions
+            refresh = not self._refreshing
+            self._refreshing = True
+        if not refresh:
+            # another thread is reading: its result is only worth waiting for the first time
+            if not self._loaded.is_set():
+                self._loaded.wait(self.checkout_timeout)
+            return self._versions
+
+        versions = None
+        try:
+            with self.pool.connection(self.checkout_timeout) as conn:
+                versions = read_data_versions(conn)
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"Could not read data versions: {e}")
+        finally:
+            with self._lock:
+                if versions is not None:
+                    self._versions = versions
+                self._checked_at = now
+                self._refreshing = False
+            self._loaded.set()
+        return self._versions
+
+    def expire(self):
+        """Force a read of the versions on the next call."""
+        with self._lock:
+            self._checked_at = None
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Show or bump the data version stamps")
+    sub = parser.add_subparsers(dest="command")
+    bump = sub.add_parser("bump", help="mark datasets as changed")
+    bump.add_argument("names", nargs="*", help=f"datasets among {', '.join(DATASETS)} (default: all)")
+    args = parser.parse_args(argv)
+    if args.command == "bump" and set(args.names) - set(DATASETS):
+        parser.error(f"unknown datasets: {', '.join(sorted(set(args.names) - set(DATASETS)))}")
+
+    with pool.connection() as conn:
+        if args.command == "bump":
+            for name, version in bump_data_version(conn, *args.names).items():
+                logger.info(f"Data version of '{name}' is now {version}")
+        else:
+            for name, (version, changed_at) in sorted(read_data_versions(conn).items()):
+                print(f"{name:<12} version {version:<6} changed at {changed_at:%Y-%m-%d %H:%M:%S}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
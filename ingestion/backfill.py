@@ -0,0 +1,182 @@
+"""
+Parallel backfill of the historical measurements (dataset "Dati sensori aria dal 2018").
+The period is split into time shards; a bounded pool of worker threads pages through
+the shards concurrently (each request retried with exponential backoff by the client)
+and hands the pages to a bounded queue. A single writer drains the queue and COPYs
+each page into Postgres, so memory stays at most `queue_size` pages however long
+the period is, and the database sees one writer.
+Every page commits with the checkpoint of its shard (offset reached, done flag):
+an interrupted backfill rerun with the same arguments skips the finished shards
+and resumes the others from their last committed page.
+    python -m ingestion.backfill --start 2018-01-01 --end 2024-01-01
+    python -m ingestion.backfill --start 2018-01-01 --end 2024-01-01 --workers 8 --shard-days 14
+    python -m ingestion.backfill --start 2018-01-01 --end 2024-01-01 --restart   # ignore checkpoints
+"""
+
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from components.logger import logger, setup_logging
+from database.rollup import refresh_rollups, to_timestamp
+from database.versions import bump_data_version
+from ingestion.socrata import BASE_URL, HISTORICAL_DATASET, SocrataClient, soql_timestamp
+from ingestion.state import (create_state_tables, reset_shard_checkpoints, save_shard_checkpoint,
+                             shard_checkpoints)
+from ingestion.writer import create_measurement_tables, measurement_tuples, write_measurements
+
+
+ORDER = "data, idsensore"
+
+
+def plan_shards(start, end, shard_days=30):
+    """Consecutive [lo, hi) ranges of `shard_days` days covering [start, end)."""
+    start, end = to_timestamp(start), to_timestamp(end)
+    shards = []
+    while start < end:
+        hi = min(start + timedelta(days=shard_days), end)
+        shards.append((start, hi))
+        start = hi
+    return shards
+
+
+def _put(pages, item, stop):
+    """Blocking put that gives up when the backfill is stopping."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch_shard(client_factory, dataset, shard, offset, page_size, pages, stop):
+    """Worker: page through one shard from `offset`, queueing (shard, records, next offset, last)."""
+    client = client_factory()
+    lo, hi = shard
+    where = f"data >= '{soql_timestamp(lo)}' AND data < '{soql_timestamp(hi)}'"
+    while not stop.is_set():
+        records = client.fetch_page(dataset, where, ORDER, page_size, offset)
+        offset += len(records)
+        last = len(records) < page_size
+        if not _put(pages, (shard, records, offset, last), stop) or last:
+            return
+
+
+def backfill(conn, client_factory, dataset=HISTORICAL_DATASET, start="2018-01-01", end=None,
+             shard_days=30, workers=4, page_size=10000, queue_size=None, job=None, refresh=True):
+    """
+    Load the measurements of [start, end) with `workers` concurrent shard fetchers and
+    one writer on `conn`. `client_factory()` builds a SocrataClient per worker (sessions
+    are not shared between threads). `queue_size` pages at most wait for the writer
+    (default: 2 per worker). Checkpoints are kept under `job` (default 'backfill:<dataset>').
+    Returns a dict of statistics (shards, skipped, pages, fetched, inserted, seconds, rows_per_s).
+    """
+    create_measurement_tables(conn)
+    create_state_tables(conn)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    job = job or f"backfill:{dataset}"
+    shards = plan_shards(start, end, shard_days)
+    checkpoints = shard_checkpoints(conn, job)
+    pending = [(shard, checkpoints.get(shard, (0, False))[0])
+               for shard in shards if not checkpoints.get(shard, (0, False))[1]]
+    logger.info(f"Backfill {job}: {len(shards)} shards of {shard_days} days, "
+                f"{len(shards) - len(pending)} already done, {workers} workers")
+
+    stats = {"shards": len(shards), "skipped": len(shards) - len(pending),
+             "pages": 0, "fetched": 0, "inserted": 0}
+    pages = queue.Queue(maxsize=queue_size or 2 * workers)
+    stop = threading.Event()
+    started = time.perf_counter()
+    loaded_from = None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+        futures = [executor.submit(_fetch_shard, client_factory, dataset, shard, offset, page_size, pages, stop)
+                   for shard, offset in pending]
+        remaining = len(pending)
+        try:
+            while remaining:
+                try:
+                    shard, records, offset, last = pages.get(timeout=1)
+                except queue.Empty:
+                    # nothing queued: surface a worker that gave up after its retries
+                    for future in futures:
+                        if future.done() and future.exception():
+                            raise future.exception()
+                    continue
+
+                def checkpoint(cur, inserted):
+                    save_shard_checkpoint(cur, job, shard, offset, inserted, last)
+
+                inserted, lo, _ = write_measurements(conn, measurement_tuples(records), checkpoint=checkpoint)
+                stats["pages"] += 1
+                stats["fetched"] += len(records)
+                stats["inserted"] += inserted
+                if lo is not None:
+                    loaded_from = lo if loaded_from is None else min(loaded_from, lo)
+                if last:
+                    remaining -= 1
+                    elapsed = time.perf_counter() - started
+                    logger.info(f"Shard {shard[0]:%Y-%m-%d}..{shard[1]:%Y-%m-%d} done, {remaining} left, "
+                                f"{stats['fetched'] / elapsed:,.0f} rows/s, queue {pages.qsize()}/{pages.maxsize}")
+        except BaseException:
+            stop.set()
+            raise
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["rows_per_s"] = round(stats["fetched"] / stats["seconds"]) if stats["seconds"] else 0
+    logger.info(f"Backfilled {stats['inserted']} new of {stats['fetched']} rows in {stats['seconds']}s "
+                f"({stats['rows_per_s']:,} rows/s)")
+
+    if stats["inserted"]:
+        if refresh:
+            refresh_rollups(conn, since=loaded_from)   # also bumps the data version
+        else:
+            bump_data_version(conn, "measurement")
+    return stats
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Parallel backfill of the historical measurements")
+    parser.add_argument("--start", default="2018-01-01", help="first day to load")
+    parser.add_argument("--end", default=None, help="day after the last one to load (default: today)")
+    parser.add_argument("--shard-days", type=int, default=30, help="days per shard")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent shard fetchers")
+    parser.add_argument("--page-size", type=int, default=10000, help="rows per API request")
+    parser.add_argument("--queue-size", type=int, default=None, help="pages waiting for the writer (default: 2 per worker)")
+    parser.add_argument("--retries", type=int, default=5, help="attempts per request after the first")
+    parser.add_argument("--backoff", type=float, default=1.0, help="initial retry delay in seconds")
+    parser.add_argument("--base-url", default=BASE_URL, help="Socrata API base URL")
+    parser.add_argument("--dataset", default=HISTORICAL_DATASET, help="dataset identifier")
+    parser.add_argument("--job", default=None, help="checkpoint name (default: backfill:<dataset>)")
+    parser.add_argument("--restart", action="store_true", help="forget the checkpoints of the job first")
+    parser.add_argument("--no-rollups", action="store_true", help="do not refresh the rollups")
+    args = parser.parse_args(argv)
+
+    def client_factory():
+        return SocrataClient(args.base_url, retries=args.retries, backoff=args.backoff)
+
+    with pool.connection() as conn:
+        if args.restart:
+            create_state_tables(conn)
+            reset_shard_checkpoints(conn, args.job or f"backfill:{args.dataset}")
+        backfill(conn, client_factory, args.dataset, args.start, args.end, args.shard_days, args.workers,
+                 args.page_size, args.queue_size, args.job, refresh=not args.no_rollups)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+with pool.connection() as conn:
+    backfill(conn, lambda: SocrataClient(retries=5), start="2018-01-01", end="2019-01-01", workers=8)
+"""
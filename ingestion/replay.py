@@ -0,0 +1,180 @@
+"""
+Local stand-in for the Socrata API, to run the ingestion without network access.
+`record` saves pages of a real dataset as JSON files; `serve` answers SoQL requests
+over the recorded rows, supporting the subset used by the ingestion jobs:
+    $where   conditions `field <op> 'value'` (op among = > >= < <=) joined by AND
+    $order   comma-separated fields, optionally ASC/DESC
+    $limit / $offset
+Recordings live in <directory>/<dataset>/*.json and are served at /resource/<dataset>.json.
+`--error-rate` answers a share of the requests with 503, to exercise the client retries.
+ingestion/recordings holds a small recording checked by ingestion/replay_check.py.
+    python -m ingestion.replay record recordings --dataset g2hp-ar79 --pages 5
+    python -m ingestion.replay serve recordings --port 8765
+    python -m ingestion.replay serve recordings --port 8765 --error-rate 0.1
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import threading
+from functools import cmp_to_key
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from components.logger import logger, setup_logging
+from ingestion.socrata import BASE_URL, MEASUREMENT_DATASET, SocrataClient
+
+
+CONDITION = re.compile(r"^\s*(\w+)\s*(>=|<=|=|>|<)\s*'([^']*)'\s*$")
+OPERATORS = {
+    "=": lambda a, b: a == b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def load_recordings(directory):
+    """{dataset: rows} of every recording in `directory`."""
+    datasets = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*", "*.json"))):
+        dataset = os.path.basename(os.path.dirname(path))
+        with open(path, encoding="utf-8") as f:
+            datasets.setdefault(dataset, []).extend(json.load(f))
+    return datasets
+
+
+def _where(condition):
+    """Predicate of a `$where` expression; ValueError outside the supported subset."""
+    tests = []
+    for part in re.split(r"\s+AND\s+", condition, flags=re.IGNORECASE) if condition else []:
+        match = CONDITION.match(part)
+        if not match:
+            raise ValueError(f"Unsupported condition: {part}")
+        field, op, value = match.groups()
+        tests.append((field, OPERATORS[op], value))
+    return lambda row: all(row.get(f) is not None and test(str(row[f]), v) for f, test, v in tests)
+
+
+def _order(expression):
+    """Comparison function of a `$order` expression (missing values first)."""
+    keys = []
+    for part in expression.split(",") if expression else []:
+        tokens = part.split()
+        keys.append((tokens[0], len(tokens) > 1 and tokens[1].upper() == "DESC"))
+
+    def compare(a, b):
+        for field, descending in keys:
+            x, y = a.get(field), b.get(field)
+            if x == y:
+                continue
+            result = -1 if x is None or (y is not None and str(x) < str(y)) else 1
+            return -result if descending else result
+        return 0
+    return cmp_to_key(compare)
+
+
+def query_rows(rows, params):
+    """Apply $where, $order, $offset and $limit to recorded rows."""
+    matches = _where(params.get("$where"))
+    selected = [r for r in rows if matches(r)]
+    if params.get("$order"):
+        selected.sort(key=_order(params["$order"]))
+    offset = int(params.get("$offset", 0))
+    limit = int(params.get("$limit", 1000))
+    return selected[offset:offset + limit]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    datasets = {}
+    error_rate = 0.0
+    injected = 0   # requests answered with an injected 503
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = re.match(r"^/resource/([\w-]+)\.json$", url.path)
+        if not match or match.group(1) not in self.datasets:
+            return self._send(404, {"error": f"Unknown dataset: {url.path}"})
+        if random.random() < self.error_rate:
+            type(self).injected += 1
+            return self._send(503, {"error": "Injected failure"})
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            rows = query_rows(self.datasets[match.group(1)], params)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        self._send(200, rows)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("replay: " + format % args)
+
+
+def start_replay_server(directory=None, host="127.0.0.1", port=0, datasets=None, error_rate=0.0):
+    """
+    Serve recordings (from `directory`, or a {dataset: rows} dict) in a background thread.
+    Returns (server, base_url); call server.shutdown() to stop it.
+    """
+    handler = type("Handler", (ReplayHandler,), {"datasets": datasets or load_recordings(directory),
+                                                 "error_rate": error_rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="socrata-replay", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/resource"
+
+
+def record(directory, dataset, pages, page_size=1000, where=None, order=None, base_url=BASE_URL):
+    """Save `pages` pages of a live dataset as JSON files; returns the number of rows."""
+    target = os.path.join(directory, dataset)
+    os.makedirs(target, exist_ok=True)
+    client = SocrataClient(base_url)
+    total = 0
+    for i, rows in enumerate(client.pages(dataset, where, order, page_size, max_pages=pages), start=1):
+        with open(os.path.join(target, f"page-{i:04d}.json"), "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        total += len(rows)
+    logger.info(f"Recorded {total} rows of '{dataset}' in {target}")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay Socrata API pages")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="save pages of a live dataset")
+    rec.add_argument("directory")
+    rec.add_argument("--dataset", default=MEASUREMENT_DATASET)
+    rec.add_argument("--pages", type=int, default=5)
+    rec.add_argument("--page-size", type=int, default=1000)
+    rec.add_argument("--where", default=None, help="SoQL $where of the recorded rows")
+    rec.add_argument("--order", default=":id", help="SoQL $order while recording")
+    serve = sub.add_parser("serve", help="serve recorded pages")
+    serve.add_argument("directory")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.directory, args.dataset, args.pages, args.page_size, args.where, args.order)
+    else:
+        server, base_url = start_replay_server(args.directory, args.host, args.port, error_rate=args.error_rate)
+        logger.info(f"Serving {', '.join(server.RequestHandlerClass.datasets)} at {base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
@@ -0,0 +1,147 @@
+"""
+Check of the incremental measurement load on the recording in ingestion/recordings, served by the
+replay server on an ephemeral port. The recording (dataset g2hp-ar79) has 3 sensors from
+2024-12-01 00:00 to 09:00: page-0001.json up to 05:00, where one sensor is missing, and
+page-0002.json with that late row at 05:00 and the hours after. ingest_measurements runs in a
+scratch schema of Postgres (dropped afterwards) with pages of 5 rows, and its statistics are checked:
+    first load       page-0001 only: every row, high-water mark at 05:00
+    rerun            the rows at the mark are asked again (data >= mark) and skipped as duplicates
+    new pages        both pages: the late row at the mark and the newer rows, mark moved to 09:00
+    rerun            nothing new
+    failures         both pages in a new schema, with --error-rate: every row after the client retries
+Exits with status 1 when a check fails.
+    python -m ingestion.replay_check
+    python -m ingestion.replay_check --dsn "host=localhost dbname=scratch user=postgres" --error-rate 0.5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from components.logger import logger, setup_logging
+from ingestion.measurements import ingest_measurements
+from ingestion.replay import start_replay_server
+from ingestion.socrata import MEASUREMENT_DATASET, SocrataClient
+
+
+RECORDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+PAGE_SIZE = 5
+
+
+def _hour(hour):
+    return datetime(2024, 12, 1, hour)
+
+
+@contextmanager
+def scratch_schema(dsn):
+    """Connection whose search_path is a new schema, dropped on exit."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    schema = f"replay_check_{os.getpid()}"
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET search_path TO {schema}")
+        conn.commit()
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+@contextmanager
+def replay_server(**kwargs):
+    server, base_url = start_replay_server(port=0, **kwargs)
+    try:
+        yield server, base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _expect(name, conn, stats, **expected):
+    """Failures of one run: `expected` values of its statistics, and `stored` rows in the table."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM measurement")
+        actual = dict(stats, stored=cur.fetchone()[0])
+    failures = [f"{name}: {key} is {actual[key]!r}, expected {value!r}"
+                for key, value in expected.items() if actual[key] != value]
+    logger.info(f"{name}: {'ok' if not failures else 'FAILED'} "
+                f"({', '.join(f'{key}={actual[key]}' for key in expected)})")
+    return failures
+
+
+def run_checks(dsn, error_rate=0.3, seed=1):
+    """Run every check; returns the list of failures (empty when all passed)."""
+    with open(os.path.join(RECORDINGS, MEASUREMENT_DATASET, "page-0001.json"), encoding="utf-8") as f:
+        first_page = json.load(f)
+    failures = []
+
+    def ingest(conn, base_url, **kwargs):
+        return ingest_measurements(conn, SocrataClient(base_url, **kwargs), page_size=PAGE_SIZE, refresh=False)
+
+    with scratch_schema(dsn) as conn:
+        with replay_server(datasets={MEASUREMENT_DATASET: first_page}) as (_, base_url):
+            client_args = {"retries": 0}
+            failures += _expect("first load", conn, ingest(conn, base_url, **client_args),
+                                pages=4, fetched=17, inserted=17, stored=17, high_water=_hour(5))
+            failures += _expect("rerun", conn, ingest(conn, base_url, **client_args),
+                                pages=1, fetched=2, inserted=0, stored=17, high_water=_hour(5))
+        with replay_server(directory=RECORDINGS) as (_, base_url):
+            failures += _expect("new pages", conn, ingest(conn, base_url, **client_args),
+                                pages=3, fetched=15, inserted=13, stored=30, high_water=_hour(9))
+            failures += _expect("rerun after new pages", conn, ingest(conn, base_url, **client_args),
+                                pages=1, fetched=3, inserted=0, stored=30, high_water=_hour(9))
+
+    # the server and the client jitter draw from `random`: the injected failures are the same every run
+    random.seed(seed)
+    with scratch_schema(dsn) as conn:
+        with replay_server(directory=RECORDINGS, error_rate=error_rate) as (server, base_url):
+            failures += _expect("failures", conn, ingest(conn, base_url, retries=10, backoff=0.01),
+                                pages=6, fetched=30, inserted=30, stored=30, high_water=_hour(9))
+            injected = server.RequestHandlerClass.injected
+        logger.info(f"failures: {injected} requests answered 503 and retried")
+        if error_rate and not injected:
+            failures.append("failures: no request failed, raise --error-rate or change --seed")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the measurement load on the recorded API pages")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres connection string (default: the database of server.py)")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="share of requests failing in the last run")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the injected failures")
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if dsn is None:
+        from server import pool
+        dsn = " ".join(f"{'dbname' if key == 'database' else key}={value}" for key, value in pool.connect_kwargs.items())
+
+    failures = run_checks(dsn, args.error_rate, args.seed)
+    for failure in failures:
+        logger.error(failure)
+    if failures:
+        sys.exit(1)
+    logger.info("Replay check passed")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+failures = run_checks("host=localhost dbname=lombardia_air_quality user=airdata_user password=user")
+# [] when the watermark, the duplicate skipping and the retries behave
+"""
@@ -0,0 +1,113 @@
+"""
+Client for the Socrata SoQL API of Dati Lombardia (https://www.dati.lombardia.it).
+Pages through a dataset with `$limit`/`$offset` under a `$where` filter and a
+stable `$order`, so a load can resume from a watermark.
+The base URL can point to the local replay server (ingestion/replay.py) for tests.
+"""
+
+import os
+import random
+import time
+from datetime import datetime
+
+import requests
+
+from components.logger import logger
+
+
+BASE_URL = os.environ.get("SOCRATA_BASE_URL", "https://www.dati.lombardia.it/resource")
+
+# Dataset identifiers
+MEASUREMENT_DATASET = "g2hp-ar79"   # air sensor data, recent years
+HISTORICAL_DATASET = "nicp-bhqi"    # "Dati sensori aria dal 2018", for backfills
+STATION_DATASET = "ib47-atvt"       # air quality stations
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def soql_timestamp(value):
+    """Floating timestamp literal of SoQL: '2024-12-01T00:00:00.000'."""
+    if isinstance(value, str):
+        return value
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+
+
+def parse_timestamp(value):
+    """Socrata floating timestamp ('2024-12-01T00:00:00.000') to datetime; None if missing."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value[:19])
+
+
+class SocrataClient:
+    """
+    Minimal SoQL client on a shared requests session.
+    An app token (SOCRATA_APP_TOKEN) raises the API rate limits.
+    Failed requests (connection errors, 429, 5xx) are retried `retries` times with
+    exponential backoff: backoff, 2 * backoff, 4 * backoff... seconds plus jitter.
+    """
+
+    def __init__(self, base_url=BASE_URL, app_token=None, timeout=60, retries=3, backoff=1.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        token = app_token or os.environ.get("SOCRATA_APP_TOKEN")
+        if token:
+            self.session.headers["X-App-Token"] = token
+
+    def url(self, dataset):
+        return f"{self.base_url}/{dataset}.json"
+
+    def fetch_page(self, dataset, where=None, order=None, limit=1000, offset=0, select=None):
+        """One page of rows (list of dicts)."""
+        params = {"$limit": limit, "$offset": offset}
+        if where:
+            params["$where"] = where
+        if order:
+            params["$order"] = order
+        if select:
+            params["$select"] = select
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.url(dataset), params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"{response.status_code} from {response.url}", response=response)
+                retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, retry_after = e, None
+            if attempt == self.retries:
+                raise error
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            delay += random.uniform(0, self.backoff)
+            logger.warning(f"{dataset} at offset {offset}: {error}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def pages(self, dataset, where=None, order=None, page_size=10000, offset=0, max_pages=None):
+        """
+        Yield successive pages until a short page (end of the result).
+        `order` must be a total order (e.g. 'data, idsensore') for offsets to be stable.
+        """
+        fetched = 0
+        while max_pages is None or fetched < max_pages:
+            rows = self.fetch_page(dataset, where, order, page_size, offset)
+            fetched += 1
+            logger.debug(f"{dataset}: {len(rows)} rows at offset {offset}")
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            offset += len(rows)
+
+
+"""
+# Example of usage:
+client = SocrataClient()
+for rows in client.pages(MEASUREMENT_DATASET, where="data >= '2024-12-01T00:00:00.000'", order="data, idsensore"):
+    ...
+"""
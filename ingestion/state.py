@@ -0,0 +1,95 @@
+"""
+Persisted progress of the ingestion jobs.
+`ingestion_state` keeps one high-water mark per job: the latest `data` loaded,
+so a rerun only asks the API for newer rows.
+`ingestion_shard` keeps the checkpoints of the backfill shards: the offset reached
+in each time range, so an interrupted backfill resumes where it stopped.
+"""
+
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS ingestion_state (
+        name TEXT PRIMARY KEY,
+        high_water TIMESTAMP,
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+"""
+
+
+SHARD_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS ingestion_shard (
+        job TEXT,
+        shard_start TIMESTAMP,
+        shard_end TIMESTAMP,
+        next_offset BIGINT NOT NULL DEFAULT 0,
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        done BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (job, shard_start, shard_end)
+    );
+"""
+
+
+def create_state_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        cur.execute(SHARD_SCHEMA_SQL)
+    conn.commit()
+
+
+def get_high_water(conn, name):
+    """Latest timestamp loaded by job `name` (None if it never ran)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT high_water FROM ingestion_state WHERE name = %s", (name,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def advance_high_water(cur, name, high_water, rows_loaded):
+    """
+    Move the high-water mark of `name` forward (never backward) and count the rows.
+    Runs on the caller's cursor, so it commits together with the rows it describes.
+    """
+    cur.execute("""
+        INSERT INTO ingestion_state (name, high_water, rows_loaded, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (name) DO UPDATE
+        SET high_water = GREATEST(ingestion_state.high_water, EXCLUDED.high_water),
+            rows_loaded = ingestion_state.rows_loaded + EXCLUDED.rows_loaded,
+            updated_at = now()
+    """, (name, high_water, rows_loaded))
+
+
+def reset_high_water(conn, name):
+    """Forget the progress of a job: the next run loads everything again."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM ingestion_state WHERE name = %s", (name,))
+    conn.commit()
+
+
+def shard_checkpoints(conn, job):
+    """{(shard_start, shard_end): (next_offset, done)} of a backfill job."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT shard_start, shard_end, next_offset, done FROM ingestion_shard WHERE job = %s", (job,))
+        return {(lo, hi): (offset, done) for lo, hi, offset, done in cur.fetchall()}
+
+
+def save_shard_checkpoint(cur, job, shard, next_offset, rows_loaded, done):
+    """Record the progress of a shard on the caller's cursor (same transaction as its rows)."""
+    cur.execute("""
+        INSERT INTO ingestion_shard (job, shard_start, shard_end, next_offset, rows_loaded, done, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (job, shard_start, shard_end) DO UPDATE
+        SET next_offset = EXCLUDED.next_offset,
+            rows_loaded = ingestion_shard.rows_loaded + EXCLUDED.rows_loaded,
+            done = EXCLUDED.done,
+            updated_at = now()
+    """, (job, shard[0], shard[1], next_offset, rows_loaded, done))
+
+
+def reset_shard_checkpoints(conn, job):
+    """Forget the checkpoints of a backfill job: the next run starts over."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM ingestion_shard WHERE job = %s", (job,))
+    conn.commit()
@@ -0,0 +1,183 @@
+"""
+Synchronisation of the station catalogue with the Dati Lombardia API.
+The feed is COPYed into a staging table and merged with one set-based
+INSERT ... ON CONFLICT DO UPDATE that only touches rows whose columns changed,
+so a reload is a single round of statements, keeps the table (and its indexes)
+in place and reports what actually changed. Stations missing from the feed are
+counted but never deleted. The station data version is bumped on changes. When a
+sensor is added or moves to another province, pollutant or unit, the province
+rollup groups it left and entered are recomputed from the sensor rollups and the
+measurement data version (of the averages read from them) is bumped too.
+    python -m ingestion.stations
+    python -m ingestion.stations --base-url http://127.0.0.1:8765/resource   # replay server
+"""
+
+import argparse
+import time
+
+from components.logger import logger, setup_logging
+from database.rollup import rebuild_province_rollups
+from database.versions import bump_data_version
+from ingestion.socrata import BASE_URL, STATION_DATASET, SocrataClient, parse_timestamp
+from ingestion.writer import copy_rows
+
+
+STATION_COLUMNS = ["idsensore", "nometiposensore", "unitamisura", "idstazione", "nomestazione", "quota",
+                   "provincia", "comune", "storico", "datastart", "datastop", "utm_nord", "utm_est",
+                   "lat", "lng", "locationtxt"]
+
+STATION_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS station (
+        idsensore TEXT PRIMARY KEY,
+        nometiposensore TEXT,
+        unitamisura TEXT,
+        idstazione TEXT,
+        nomestazione TEXT,
+        quota TEXT,
+        provincia TEXT,
+        comune TEXT,
+        storico TEXT,
+        datastart TIMESTAMP,
+        datastop TIMESTAMP,
+        utm_nord TEXT,
+        utm_est TEXT,
+        lat NUMERIC,
+        lng NUMERIC,
+        locationtxt TEXT
+    );
+"""
+
+
+def station_tuples(records):
+    """API records (dicts) to station tuples; rows without idsensore are skipped."""
+    for r in records:
+        if not r.get("idsensore"):
+            continue
+        yield (r["idsensore"], r.get("nometiposensore"), r.get("unitamisura"), r.get("idstazione"),
+               r.get("nomestazione"), r.get("quota"), r.get("provincia"), r.get("comune"), r.get("storico"),
+               parse_timestamp(r.get("datastart")), parse_timestamp(r.get("datastop")),
+               r.get("utm_nord"), r.get("utm_est"), r.get("lat"), r.get("lng"),
+               str(r.get("location")))   # location as text, like the notebook load
+
+
+def _has_location(cur):
+    """Whether `station` has the PostGIS `location` column of the notebook schema."""
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'station' AND column_name = 'location' AND table_schema = current_schema()
+    """)
+    return cur.fetchone() is not None
+
+
+def sync_stations(conn, rows, bump=True):
+    """
+    Upsert station tuples: new sensors are inserted, existing ones updated only where
+    a column differs; nothing is deleted. When sensors changed province, pollutant or unit
+    (or were added), their province rollup groups are recomputed in the same transaction.
+    With `bump`, the data versions of what changed are bumped.
+    Returns a dict of counts (received, inserted, updated, unchanged, missing).
+    """
+    rows = list(rows)
+    columns = ", ".join(STATION_COLUMNS)
+    changed = [c for c in STATION_COLUMNS if c != "idsensore"]
+    try:
+        with conn.cursor() as cur:
+            cur.execute(STATION_SCHEMA_SQL)
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS station_stage (LIKE station) ON COMMIT DELETE ROWS")
+            copy_rows(cur, "station_stage", STATION_COLUMNS, rows)
+
+            target, source = columns, columns
+            updates = [f"{c} = EXCLUDED.{c}" for c in changed]
+            if _has_location(cur):
+                target += ", location"
+                source += ", ST_SetSRID(ST_MakePoint(lng, lat), 4326)"
+                updates.append("location = EXCLUDED.location")
+            # `previous` reads the station rows as they were before the upsert (same snapshot)
+            cur.execute(f"""
+                WITH previous AS (
+                    SELECT s.idsensore, s.nometiposensore, s.provincia, s.unitamisura
+                    FROM station s
+                    WHERE s.idsensore IN (SELECT idsensore FROM station_stage)
+                ),
+                upserted AS (
+                    INSERT INTO station ({target})
+                    SELECT DISTINCT ON (idsensore) {source}
+                    FROM station_stage
+                    ORDER BY idsensore
+                    ON CONFLICT (idsensore) DO UPDATE
+                    SET {', '.join(updates)}
+                    WHERE ({', '.join('station.' + c for c in changed)})
+                        IS DISTINCT FROM ({', '.join('EXCLUDED.' + c for c in changed)})
+                    RETURNING idsensore, (xmax = 0) AS inserted, nometiposensore, provincia, unitamisura
+                ),
+                regrouped AS (
+                    -- sensors entering or leaving a province rollup group: their old and new groups
+                    SELECT g.*
+                    FROM upserted u
+                    LEFT JOIN previous p USING (idsensore)
+                    CROSS JOIN LATERAL (VALUES
+                        (u.nometiposensore, u.provincia, COALESCE(u.unitamisura, '')),
+                        (p.nometiposensore, p.provincia, COALESCE(p.unitamisura, ''))
+                    ) g (nometiposensore, provincia, unitamisura)
+                    WHERE (u.nometiposensore, u.provincia, u.unitamisura)
+                        IS DISTINCT FROM (p.nometiposensore, p.provincia, p.unitamisura)
+                      AND g.nometiposensore IS NOT NULL AND g.provincia IS NOT NULL
+                )
+                SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted),
+                       (SELECT count(DISTINCT idsensore) FROM station_stage),
+                       (SELECT count(*) FROM station s
+                        WHERE NOT EXISTS (SELECT 1 FROM station_stage t WHERE t.idsensore = s.idsensore)),
+                       (SELECT array_agg(DISTINCT ARRAY[nometiposensore, provincia, unitamisura]) FROM regrouped)
+                FROM upserted
+            """)
+            inserted, updated, received, missing, groups = cur.fetchone()
+            # only a new province, pollutant or unit changes the province rollups, and only for these groups
+            rebuilt = bool(groups) and rebuild_province_rollups(conn, groups, commit=False)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    stats = {"received": received, "inserted": inserted, "updated": updated,
+             "unchanged": received - inserted - updated, "missing": missing}
+    if bump and (inserted or updated):
+        bump_data_version(conn, "station", *(["measurement"] if rebuilt else []))
+    return stats
+
+
+def ingest_stations(conn, client, dataset=STATION_DATASET, page_size=50000, bump=True):
+    """Fetch the whole station feed and sync it; returns the counts of sync_stations plus seconds."""
+    started = time.perf_counter()
+    records = [r for page in client.pages(dataset, order="idsensore", page_size=page_size) for r in page]
+    stats = sync_stations(conn, station_tuples(records), bump)
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Stations: {stats['received']} received, {stats['inserted']} inserted, "
+                f"{stats['updated']} updated, {stats['unchanged']} unchanged, "
+                f"{stats['missing']} not in the feed, in {stats['seconds']}s")
+    return stats
+
+
+def main(argv=None):
+    from server import pool
+
+    parser = argparse.ArgumentParser(description="Synchronise the station catalogue")
+    parser.add_argument("--base-url", default=BASE_URL, help="Socrata API base URL")
+    parser.add_argument("--dataset", default=STATION_DATASET, help="dataset identifier")
+    parser.add_argument("--no-bump", action="store_true", help="do not bump the station data version")
+    args = parser.parse_args(argv)
+
+    with pool.connection() as conn:
+        ingest_stations(conn, SocrataClient(args.base_url), args.dataset, bump=not args.no_bump)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
+
+
+"""
+# Example of usage:
+with pool.connection() as conn:
+    sync_stations(conn, station_tuples(records))
+    # {'received': 1021, 'inserted': 0, 'updated': 3, 'unchanged': 1018, 'missing': 0}
+"""
@@ -0,0 +1,151 @@
+"""
+Bulk writes into Postgres with COPY.
+Rows are serialised into an in-memory text buffer and copied into a temporary
+staging table, then merged into the target table with one INSERT ... SELECT,
+so a page of thousands of rows costs a few statements instead of one per row.
+"""
+
+import io
+
+from database.migrations import ensure_partitions
+from ingestion.socrata import parse_timestamp
+from ingestion.state import SCHEMA_SQL as STATE_SCHEMA_SQL, advance_high_water
+
+
+MEASUREMENT_COLUMNS = ["idsensore", "data", "valore", "stato", "idoperatore"]
+
+MEASUREMENT_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS measurement (
+        idsensore TEXT,
+        data TIMESTAMP,
+        valore NUMERIC,
+        stato TEXT,
+        idoperatore TEXT,
+        PRIMARY KEY (idsensore, data)
+    );
+"""
+
+
+def _copy_value(value):
+    """Text COPY representation of one value (NULL as \\N, special characters escaped)."""
+    if value is None:
+        return "\\N"
+    text = value.isoformat(sep=" ") if hasattr(value, "isoformat") else str(value)
+    return (text.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def copy_rows(cur, table, columns, rows):
+    """COPY tuples into `table` from an in-memory buffer; returns the number of rows."""
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+        count += 1
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return count
+
+
+def copy_frame(cur, table, columns, frame):
+    """COPY a DataFrame into `table` (CSV written by pandas, vectorised); empty strings load as NULL."""
+    buffer = io.StringIO()
+    frame[columns].to_csv(buffer, header=False, index=False, na_rep="")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer)
+    return len(frame)
+
+
+def measurement_tuples(records):
+    """API records (dicts) to measurement tuples; rows without sensor or timestamp are skipped."""
+    for r in records:
+        data = parse_timestamp(r.get("data"))
+        if not r.get("idsensore") or data is None:
+            continue
+        yield r["idsensore"], data, r.get("valore"), r.get("stato"), r.get("idoperatore")
+
+
+def create_measurement_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(MEASUREMENT_SCHEMA_SQL)
+        cur.execute(STATE_SCHEMA_SQL)
+    conn.commit()
+
+
+def write_measurements(conn, rows, state_name=None, checkpoint=None):
+    """
+    Load measurement tuples: COPY into a staging table, then insert the new ones
+    (rows already present are skipped, so overlapping pages are harmless).
+    With `state_name`, the job high-water mark advances in the same transaction;
+    `checkpoint(cur, inserted)` can record other progress in it (called even without rows).
+    Returns (rows inserted, min data, max data).
+    """
+    rows = list(rows)
+    if not rows and checkpoint is None:
+        return 0, None, None
+    lo = min((r[1] for r in rows), default=None)
+    hi = max((r[1] for r in rows), default=None)
+    if rows:
+        # monthly partitions for the page (no-op on an unpartitioned table)
+        ensure_partitions(conn, lo, hi)
+
+    try:
+        with conn.cursor() as cur:
+            inserted = 0
+            if rows:
+                inserted = _merge_measurements(cur, rows)
+                if state_name:
+                    advance_high_water(cur, state_name, hi, inserted)
+            if checkpoint is not None:
+                checkpoint(cur, inserted)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted, lo, hi
+
+
+def write_measurement_frame(conn, frame):
+    """
+    Load a DataFrame of measurements (MEASUREMENT_COLUMNS) like write_measurements,
+    serialising it with pandas instead of row by row: meant for bulk loads.
+    Returns the number of rows inserted.
+    """
+    if frame.empty:
+        return 0
+    ensure_partitions(conn, frame["data"].min().to_pydatetime(), frame["data"].max().to_pydatetime())
+    try:
+        with conn.cursor() as cur:
+            _create_stage(cur)
+            copy_frame(cur, "measurement_stage", MEASUREMENT_COLUMNS, frame)
+            inserted = _insert_from_stage(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted
+
+
+def _merge_measurements(cur, rows):
+    """COPY rows into the session's staging table and insert those not stored yet."""
+    _create_stage(cur)
+    copy_rows(cur, "measurement_stage", MEASUREMENT_COLUMNS, rows)
+    return _insert_from_stage(cur)
+
+
+def _create_stage(cur):
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS measurement_stage (
+            idsensore TEXT, data TIMESTAMP, valore NUMERIC, stato TEXT, idoperatore TEXT
+        ) ON COMMIT DELETE ROWS
+    """)
+
+
+def _insert_from_stage(cur):
+    cur.execute(f"""
+        INSERT INTO measurement ({', '.join(MEASUREMENT_COLUMNS)})
+        SELECT {', '.join(MEASUREMENT_COLUMNS)} FROM measurement_stage
+        ON CONFLICT (idsensore, data) DO NOTHING
+    """)
+    return cur.rowcount
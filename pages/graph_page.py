@@ -1,12 +1,13 @@
 import dash
 from dash import html, dcc, Output, Input, callback, no_update
 import plotly.graph_objs as go
-import plotly.express as px
 import pandas as pd
 from datetime import datetime, timedelta
-from components.fetch_pollutant import fetch_pollutant
+from components.fetch_pollutant import station_catalogue
 import requests
 from components.logger import logger
+from components.response_format import accept_header, read_dataframe
+from components.http_cache import http_get
 
 
 
@@ -15,55 +16,44 @@ dash.register_page(__name__, path="/trend", name="Trends")
 
 
 
-# Fetch initial data for dropdown menus
-df_all = fetch_pollutant()
-# Get sorted list of unique pollutant types if data is available
-pollutants = sorted(df_all["nometiposensore"].dropna().unique()) if not df_all.empty else []
-# Get sorted list of unique stations if data is available
-stations = sorted(df_all["nomestazione"].dropna().unique()) if not df_all.empty else []
+def get_idsensore(nometiposensore=None, nomestazione=None):
+    # Unique sensor IDs of a pollutant type and/or station name, from the catalogue indexes
+    return station_catalogue.sensor_ids(pollutant=nometiposensore, station=nomestazione)
 
-def get_idsensore(df, nometiposensore=None, nomestazione=None):
-    # Filter the dataframe based on pollutant type and/or station name if provided
-    filtered_df = df
 
-    if nometiposensore is not None:
-        filtered_df = filtered_df[filtered_df['nometiposensore'] == nometiposensore]
-
-    if nomestazione is not None:
-        filtered_df = filtered_df[filtered_df['nomestazione'] == nomestazione]
-
-    # Return list of unique sensor IDs after filtering
-    idsensori = filtered_df['idsensore'].unique()
-
-    return idsensori.tolist()
-
-
-def fetch_sensor_data_api(idsensore=None):
+def fetch_sensor_data_api(idsensore=None, start_date=None, end_date=None):
     """
     Fetch sensor measurement data from the API endpoint,
     returning a DataFrame with relevant columns.
+    All the sensors in `idsensore` (ID or list of IDs) are loaded in one request.
     """
+    # No sensor for the selection: nothing to load (and never the whole table)
+    if not idsensore:
+        return pd.DataFrame()
+
     try:
         url = "http://localhost:5001/api/measurements"
-        params = {}
-
-        # Add parameters if provided for sensor ID and date range
-        if idsensore:
-            params['idsensore'] = idsensore
-
-        # Call the API and check response status
-        response = requests.get(url, params=params)
+        # Only the columns the trend chart and summary use
+        params = {'fields': 'idsensore,data,valore,stato'}
+
+        # Sensor IDs (repeated parameter) and optional date range
+        params['idsensore'] = idsensore
+        if start_date:
+            params['start_date'] = start_date
+        if end_date:
+            params['end_date'] = end_date
+
+        # Call the API asking for a columnar/binary format and check response status
+        response = http_get(url, params=params, headers={"Accept": accept_header()})
         response.raise_for_status()
 
-        data = response.json()
+        # Decode straight into a DataFrame (no per-row dicts)
+        df = read_dataframe(response)
 
         # Return empty DataFrame if no data
-        if not data:
+        if df.empty:
             return pd.DataFrame()
 
-        # Create DataFrame from JSON data
-        df = pd.DataFrame(data)
-
         # Assign pollutant type column based on sensor ID (fallback)
         df['nometiposensore'] = df.get('idsensore', None)
 
@@ -79,7 +69,7 @@ def fetch_sensor_data_api(idsensore=None):
         logger.info(f"Filter: '{idsensore}' - Sensors data fetched successfully.")
 
         # Return selected columns
-        return df[['data', 'valore', 'nomestazione', 'nometiposensore', 'stato']]
+        return df[['data', 'valore', 'nomestazione', 'nometiposensore', 'stato', 'idsensore']]
 
     except Exception as e:
         logger.error(f"Error fetching sensor data from API: {e}")
@@ -89,7 +79,7 @@ def fetch_sensor_data_api(idsensore=None):
 # Get list of provinces from API for analysis
 def get_provinces():
     try:
-        response = requests.get("http://localhost:5001/api/provinces")
+        response = http_get("http://localhost:5001/api/provinces")
         response.raise_for_status()  # Raise error for bad HTTP responses
         data = response.json()
         
@@ -126,19 +116,18 @@ def fetch_data(pollutant, province=None, start_date=None, end_date=None):
     try:
         url = "http://localhost:5001/api/measurements_filters"
 
-        # Make GET request and check for errors
-        response = requests.get(url, params=params)
+        # Make GET request (columnar/binary response) and check for errors
+        response = http_get(url, params=params, headers={"Accept": accept_header()})
         response.raise_for_status()  
 
-        data = response.json()
+        df = read_dataframe(response)
 
         # Handle empty response
-        if not data:
+        if df.empty:
             logger.warning(f"NO DATA found for pollutant: '{pollutant}', province: '{province}', start_date: '{start_date}', end_date: '{end_date}' ")
             return pd.DataFrame()
 
-        # Convert to DataFrame and clean data
-        df = pd.DataFrame(data)
+        # Clean data
         df["data"] = pd.to_datetime(df["data"])
         df["valore"] = pd.to_numeric(df["valore"], errors="coerce")
         df = df.dropna()
@@ -158,15 +147,49 @@ def fetch_data(pollutant, province=None, start_date=None, end_date=None):
         return pd.DataFrame()
 
 
-# Fetch data for multiple pollutants combined into a single DataFrame
+# Fetch data for multiple pollutants combined into a single DataFrame (one request, one grouped query)
 def fetch_data_multiple(pollutants, province, start_date=None, end_date=None):
-    df_list = []
-    for pol in pollutants:
-        df = fetch_data(pol, province, start_date, end_date)
-        df["pollutant"] = pol
-        df_list.append(df)
-    # Concatenate all dataframes if any, else return empty
-    return pd.concat(df_list, ignore_index=True) if df_list else pd.DataFrame()
+    pollutants = [p for p in pollutants if p]
+    if not pollutants:
+        return pd.DataFrame()
+
+    # Repeated 'pollutant' parameter, one per selected pollutant
+    params = {"pollutant": pollutants}
+    if province:
+        params["provincia"] = province
+    if start_date:
+        params["start_date"] = start_date
+    if end_date:
+        params["end_date"] = end_date
+
+    try:
+        url = "http://localhost:5001/api/measurements_pollutants"
+        response = http_get(url, params=params, headers={"Accept": accept_header()})
+        response.raise_for_status()
+
+        df = read_dataframe(response)
+        if df.empty:
+            logger.warning(f"NO DATA found for pollutants: {pollutants}, province: '{province}', start_date: '{start_date}', end_date: '{end_date}' ")
+            return pd.DataFrame()
+
+        # Clean data, one series per pollutant
+        df = df.rename(columns={"nometiposensore": "pollutant"})
+        df["data"] = pd.to_datetime(df["data"])
+        df["valore"] = pd.to_numeric(df["valore"], errors="coerce")
+        df = df.dropna()
+        df = df.sort_values(["pollutant", "data"], ignore_index=True)
+        # Calculate 7-day rolling average for smoothing
+        df["smoothed"] = df.groupby("pollutant")["valore"].transform(lambda x: x.rolling(window=7, min_periods=1).mean())
+
+        logger.info(f"Fetched successfully -> pollutants: {pollutants}, province: '{province}', start_date: '{start_date}', end_date: '{end_date}'  ")
+        return df
+
+    except requests.RequestException as e:
+        logger.error(f"API call error: {e}")
+        return pd.DataFrame()
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return pd.DataFrame()
 
 
 # Options for data smoothing methods for visualization
@@ -178,6 +201,17 @@ def get_smoothing_options():
     ]
 
 
+# Add the "smoothed" column: rolling mean per pollutant for the 7/14-day options, raw values otherwise
+def smooth_series(df, smoothing="raw"):
+    if smoothing == "smoothed_7":
+        df["smoothed"] = df.groupby("pollutant")["valore"].transform(lambda x: x.rolling(7, min_periods=1).mean())
+    elif smoothing == "smoothed_14":
+        df["smoothed"] = df.groupby("pollutant")["valore"].transform(lambda x: x.rolling(14, min_periods=2).mean())
+    else:
+        df["smoothed"] = df["valore"]
+    return df
+
+
 # Create a line chart for a single pollutant in a province with optional smoothing
 def create_nox_chart(df, pollutant, province, smoothing="raw"):
     """Create NOx analysis chart"""
@@ -295,11 +329,14 @@ def create_trend_chart(df, pollutant, station):
         )
         return fig
 
-    # Use Plotly Express for quick line plot creation
+    # Use Plotly Express for quick line plot creation (one line per sensor if the station has several)
+    several_sensors = 'idsensore' in df.columns and df['idsensore'].nunique() > 1
+    import plotly.express as px  # loaded on first use, not at startup
     fig = px.line(
         df, 
         x='data', 
         y='valore',
+        color='idsensore' if several_sensors else None,
         title=f"{pollutant} Levels at {station}",
         labels={
             'data': 'Date',
@@ -332,7 +369,7 @@ def create_trend_chart(df, pollutant, station):
     
     # Style line and hover tooltip
     fig.update_traces(
-        line=dict(color="rgb(19, 129, 159)", width=2),
+        line=dict(width=2) if several_sensors else dict(color="rgb(19, 129, 159)", width=2),
         hovertemplate="<b>%{x}</b><br>" +
                      f"{pollutant}: %{{y:.2f}} μg/m³<br>" +
                      "<extra></extra>"
@@ -474,195 +511,201 @@ def create_summary_cards_per_pollutant(df, pollutants):
 
 
 ### LAYOUT -> TRENDS PAGE ###
-layout = html.Div([
-    html.Div(id="redirect-trend"),
-    # Page Header
-    html.Div([
-        html.H1("Air Quality Trends Analysis", style={
-            "textAlign": "center",
-            "color": "rgb(19, 129, 159)",
-            "marginBottom": "10px",
-            "fontSize": "32px"
-        }),
-        html.P("Analyze temporal patterns for each station in Lombardy region or compare the different pollutant with the specialized analysis", style={
-            "textAlign": "center",
-            "color": "#7f8c8d",
-            "fontSize": "16px",
-            "marginBottom": "30px"
-        })
-    ]),
-    
-    # Analysis Mode Selector
-    html.Div([
-        html.H3("Select Analysis Mode", style={"color": "#2c3e50", "marginBottom": "15px"}),
-        dcc.RadioItems(
-            id="analysis-mode",
-            options=[
-                {"label": " General Pollutant Analysis", "value": "general"},
-                {"label": " Specialized Analysis", "value": "nox"}
-            ],
-            value="general",
-            style={"fontSize": "16px"},
-            labelStyle={"margin": "10px", "display": "block"}
-        )
-    ], style={
-        "backgroundColor": "white",
-        "padding": "20px",
-        "borderRadius": "10px",
-        "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
-        "margin": "0 20px 20px 20px"
-    }),
+def layout(**kwargs):
+    """Built at every visit, from the station catalogue (loaded by the warm-up or on first use)."""
+    # Dropdown options from the shared station catalogue (empty if data is not available)
+    pollutants = station_catalogue.pollutants()
+    stations = station_catalogue.stations()
+
+    return html.Div([
+        html.Div(id="redirect-trend"),
+        # Page Header
+        html.Div([
+            html.H1("Air Quality Trends Analysis", style={
+                "textAlign": "center",
+                "color": "rgb(19, 129, 159)",
+                "marginBottom": "10px",
+                "fontSize": "32px"
+            }),
+            html.P("Analyze temporal patterns for each station in Lombardy region or compare the different pollutant with the specialized analysis", style={
+                "textAlign": "center",
+                "color": "#7f8c8d",
+                "fontSize": "16px",
+                "marginBottom": "30px"
+            })
+        ]),
     
-    # General Analysis Controls
-    html.Div(id="general-controls", children=[
+        # Analysis Mode Selector
         html.Div([
+            html.H3("Select Analysis Mode", style={"color": "#2c3e50", "marginBottom": "15px"}),
+            dcc.RadioItems(
+                id="analysis-mode",
+                options=[
+                    {"label": " General Pollutant Analysis", "value": "general"},
+                    {"label": " Specialized Analysis", "value": "nox"}
+                ],
+                value="general",
+                style={"fontSize": "16px"},
+                labelStyle={"margin": "10px", "display": "block"}
+            )
+        ], style={
+            "backgroundColor": "white",
+            "padding": "20px",
+            "borderRadius": "10px",
+            "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
+            "margin": "0 20px 20px 20px"
+        }),
+    
+        # General Analysis Controls
+        html.Div(id="general-controls", children=[
             html.Div([
-                html.Label("Select Pollutant:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.Dropdown(
-                    id="trend-pollutant-selector",
-                    options=[{"label": pol, "value": pol} for pol in pollutants],
-                    value=pollutants[0] if pollutants else None,
-                    clearable=False,
-                    style={"marginBottom": "20px"}
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
+                html.Div([
+                    html.Label("Select Pollutant:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.Dropdown(
+                        id="trend-pollutant-selector",
+                        options=[{"label": pol, "value": pol} for pol in pollutants],
+                        value=pollutants[0] if pollutants else None,
+                        clearable=False,
+                        style={"marginBottom": "20px"}
+                    )
+                ], style={"flex": "1", "marginRight": "20px"}),
             
-            html.Div([
-                html.Label("Select Station:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.Dropdown(
-                    id="trend-station-selector",
-                    options=[{"label": station, "value": station} for station in stations],
-                    value=stations[0] if stations else None,
-                    clearable=False,
-                    style={"marginBottom": "20px"}
-                )
-            ], style={"flex": "1"})
-        ], style={"display": "flex"})
-    ], style={
-        "backgroundColor": "white",
-        "padding": "20px",
-        "borderRadius": "10px",
-        "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
-        "margin": "0 20px 20px 20px"
-    }),
+                html.Div([
+                    html.Label("Select Station:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.Dropdown(
+                        id="trend-station-selector",
+                        options=[{"label": station, "value": station} for station in stations],
+                        value=stations[0] if stations else None,
+                        clearable=False,
+                        style={"marginBottom": "20px"}
+                    )
+                ], style={"flex": "1"})
+            ], style={"display": "flex"})
+        ], style={
+            "backgroundColor": "white",
+            "padding": "20px",
+            "borderRadius": "10px",
+            "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
+            "margin": "0 20px 20px 20px"
+        }),
     
-    # Specialized Analysis Controls
-    html.Div(id="nox-controls", children=[
-        html.Div([
-
+        # Specialized Analysis Controls
+        html.Div(id="nox-controls", children=[
             html.Div([
-                html.Label("Select Pollutants:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.Dropdown(
-                    id="specialized-pollutant-selector",
-                    options=[{"label": pol, "value": pol} for pol in pollutants],
-                    value=[],         # default list
-                    multi=True,            # consente selezione multipla
-                    clearable=False
-                )
-            ], style={"flex": "2", "marginRight": "15px"}),
 
-            html.Div([
-                html.Label("Select Province:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.Dropdown(
-                    id="specialized-province-selector",
-                    options=[{"label": "All", "value": "All"}] + [{"label": p, "value": p} for p in get_provinces()],
-                    value="All",  # default value
-                    clearable=False
-                )
-            ], style={"flex": "1", "marginRight": "15px"}),
+                html.Div([
+                    html.Label("Select Pollutants:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.Dropdown(
+                        id="specialized-pollutant-selector",
+                        options=[{"label": pol, "value": pol} for pol in pollutants],
+                        value=[],         # default list
+                        multi=True,            # consente selezione multipla
+                        clearable=False
+                    )
+                ], style={"flex": "2", "marginRight": "15px"}),
+
+                html.Div([
+                    html.Label("Select Province:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.Dropdown(
+                        id="specialized-province-selector",
+                        options=[{"label": "All", "value": "All"}] + [{"label": p, "value": p} for p in get_provinces()],
+                        value="All",  # default value
+                        clearable=False
+                    )
+                ], style={"flex": "1", "marginRight": "15px"}),
             
             
-            html.Div([
-                html.Label("Data Smoothing:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.Dropdown(
-                    id="specialized-smoothing",
-                    options=get_smoothing_options(),
-                    value="raw",
-                    clearable=False
-                )
-            ], style={"flex": "1", "marginRight": "15px"}),
-
-            html.Div([
-                html.Label("Date Range:", style={
-                    "fontWeight": "bold",
-                    "marginBottom": "8px",
-                    "display": "block",
-                    "color": "#2c3e50"
-                }),
-                dcc.DatePickerRange(
-                    id="nox-date-range",
-                    min_date_allowed=datetime(2020, 1, 1),
-                    max_date_allowed=datetime(2025, 12, 31),
-                    start_date=datetime(2024, 12, 1),
-                    end_date=datetime(2024, 12, 31),
-                    display_format="DD/MM/YYYY",
-                    style={"width": "100%"}
-                )
-            ], style={"flex": "1.5", "marginRight": "15px"}),
-
-        ], style={"display": "flex"})
-    ], style={
-        "backgroundColor": "white",
-        "padding": "20px",
-        "borderRadius": "10px",
-        "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
-        "margin": "0 20px 20px 20px",
-        "display": "none"
-    }),
+                html.Div([
+                    html.Label("Data Smoothing:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.Dropdown(
+                        id="specialized-smoothing",
+                        options=get_smoothing_options(),
+                        value="raw",
+                        clearable=False
+                    )
+                ], style={"flex": "1", "marginRight": "15px"}),
+
+                html.Div([
+                    html.Label("Date Range:", style={
+                        "fontWeight": "bold",
+                        "marginBottom": "8px",
+                        "display": "block",
+                        "color": "#2c3e50"
+                    }),
+                    dcc.DatePickerRange(
+                        id="nox-date-range",
+                        min_date_allowed=datetime(2020, 1, 1),
+                        max_date_allowed=datetime(2025, 12, 31),
+                        start_date=datetime(2024, 12, 1),
+                        end_date=datetime(2024, 12, 31),
+                        display_format="DD/MM/YYYY",
+                        style={"width": "100%"}
+                    )
+                ], style={"flex": "1.5", "marginRight": "15px"}),
+
+            ], style={"display": "flex"})
+        ], style={
+            "backgroundColor": "white",
+            "padding": "20px",
+            "borderRadius": "10px",
+            "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
+            "margin": "0 20px 20px 20px",
+            "display": "none"
+        }),
     
-    # Summary Cards
-    html.Div(id="summary-cards", style={"margin": "0 20px"}),
+        # Summary Cards
+        html.Div(id="summary-cards", style={"margin": "0 20px"}),
     
-    # Chart Container
-    html.Div([
+        # Chart Container
+        html.Div([
         
-        dcc.Graph(
-            id="trend-chart",
-            config={
-                'displayModeBar': True,
-                'modeBarButtonsToRemove': ['pan2d', 'lasso2d', 'select2d'],
-                'displaylogo': False
-            }
-        )
-    ], style={
-        "backgroundColor": "white",
-        "margin": "20px",
-        "borderRadius": "10px",
-        "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
-        "padding": "10px"
-    }),
+            dcc.Graph(
+                id="trend-chart",
+                config={
+                    'displayModeBar': True,
+                    'modeBarButtonsToRemove': ['pan2d', 'lasso2d', 'select2d'],
+                    'displaylogo': False
+                }
+            )
+        ], style={
+            "backgroundColor": "white",
+            "margin": "20px",
+            "borderRadius": "10px",
+            "boxShadow": "0 2px 8px rgba(0,0,0,0.1)",
+            "padding": "10px"
+        }),
     
-    # Footer Info
-], style={
-    "maxWidth": "1200px",
-    "margin": "auto",
-    "padding": "20px 0"
-})
+        # Footer Info
+    ], style={
+        "maxWidth": "1200px",
+        "margin": "auto",
+        "padding": "20px 0"
+    })
 
 
 
@@ -695,11 +738,8 @@ def update_station_options(selected_pollutant):
     if not selected_pollutant:
         return []
 
-    # Fetch data already filtered by pollutant
-    df_filtered = fetch_pollutant(pollutant=selected_pollutant)
-    
-    # Extract unique station names
-    available_stations = sorted(df_filtered["nomestazione"].dropna().unique())
+    # Station names of the pollutant, from the catalogue index (no API call)
+    available_stations = station_catalogue.stations(pollutant=selected_pollutant)
 
     return [{"label": station, "value": station} for station in available_stations]
 
@@ -776,7 +816,7 @@ def update_chart_and_summary(mode, pollutant, station, province, nox_pollutant,
             return empty_fig, empty_summary, no_update
 
         # Fetch sensor IDs for the selected pollutant and station
-        id_sensore = get_idsensore(df_all, pollutant, station)
+        id_sensore = get_idsensore(pollutant, station)
         # Fetch sensor data from API for these sensor IDs
         df_sensor = fetch_sensor_data_api(id_sensore)
 
@@ -817,12 +857,7 @@ def update_chart_and_summary(mode, pollutant, station, province, nox_pollutant,
             return fig, summary, no_update
 
         # Apply smoothing based on user selection
-        if smoothing == "smoothed_7":
-            df_nox["smoothed"] = df_nox.groupby("pollutant")["valore"].transform(lambda x: x.rolling(7, min_periods=1).mean())
-        elif smoothing == "smoothed_14":
-            df_nox["smoothed"] = df_nox.groupby("pollutant")["valore"].transform(lambda x: x.rolling(14, min_periods=2).mean())
-        else:
-            df_nox["smoothed"] = df_nox["valore"]
+        df_nox = smooth_series(df_nox, smoothing)
 
         # Create multi-pollutant NOx chart and summary cards
         fig = create_nox_chart_multi(df_nox, smoothing=smoothing, province=province)
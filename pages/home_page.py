@@ -8,12 +8,11 @@ import dash
 from dash import html, dcc, Input, Output, callback
 import dash_leaflet as dl
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, date
 import requests
-from components.fetch_pollutant import fetch_pollutant
-import psycopg2
+from components.fetch_pollutant import station_catalogue
+from components.http_cache import http_get
 from components.logger import logger
 
 dash.register_page(__name__, path="/", name="Home")
@@ -40,7 +39,7 @@ PROVINCE_COORDINATES = {
 # Get available provinces
 def get_provinces():
     try:
-        response = requests.get("http://localhost:5001/api/provinces")
+        response = http_get("http://localhost:5001/api/provinces")
         response.raise_for_status()
         data = response.json()
         
@@ -134,10 +133,11 @@ def get_map_center_and_zoom(filtered_df, province=None):
     # Default to Lombardia center
     return [45.5, 9.2], 8
 
-def create_filtered_map(pollutant_group=None, province=None):
+def create_filtered_map(pollutant_group=None, province=None, df_stations=None):
     """Create map with filtered stations and automatic centering"""
     try:
-        df_stations = fetch_pollutant()
+        if df_stations is None:
+            df_stations = station_catalogue.frame()
 
         if df_stations.empty:
             center, zoom = get_map_center_and_zoom(pd.DataFrame(), province)
@@ -210,361 +210,363 @@ def create_filtered_map(pollutant_group=None, province=None):
         )
 
 ### LAYOUT -> HOME PAGE ###
-layout = html.Div([
-    # Hero Section
-    html.Div([
+def layout(**kwargs):
+    """Built at every visit: the province options come from the API client cache (filled by the warm-up)."""
+    return html.Div([
+        # Hero Section
         html.Div([
-            html.Img(
-                src="/assets/logo.png", 
-                style={
-                    "height": "280px", 
-                    "width": "280px", 
-                    "marginBottom": "20px"
-                }
-            ),
-            html.H1(
-                "Welcome to GeoAir", 
-                style={
-                    "fontSize": "3.5rem", 
-                    "marginBottom": "20px",
-                    "color": "white",
-                    "textShadow": "3px 3px 10px rgba(0,0,0,0.8)",
-                    "margin": "0 auto 20px auto",
-                    "width": "fit-content"
-                }
-            ),
-            html.P(
-                "Discover air quality evolution in Lombardia with historical data analysis and trend visualization", 
-                style={
-                    "fontSize": "1.3rem",
-                    "color": "white",
-                    "textShadow": "2px 2px 8px rgba(0,0,0,0.8)",
-                    "maxWidth": "600px",
-                    "margin": "0 auto 30px auto",
-                    "lineHeight": "1.5",
-                    "textAlign": "center"
-                }
-            ),
             html.Div([
-                dcc.Link(
-                    "Explore Map",
-                    href="/map",
+                html.Img(
+                    src="/assets/logo.png", 
+                    style={
+                        "height": "280px", 
+                        "width": "280px", 
+                        "marginBottom": "20px"
+                    }
+                ),
+                html.H1(
+                    "Welcome to GeoAir", 
                     style={
-                        "padding": "12px 30px",
-                        "fontSize": "1.2rem",
+                        "fontSize": "3.5rem", 
+                        "marginBottom": "20px",
                         "color": "white",
-                        "backgroundColor": "rgba(255,255,255,0.2)",
-                        "textDecoration": "none",
-                        "borderRadius": "25px",
-                        "border": "2px solid white",
-                        "marginRight": "15px",
-                        "display": "inline-block",
-                        "transition": "all 0.3s ease"
+                        "textShadow": "3px 3px 10px rgba(0,0,0,0.8)",
+                        "margin": "0 auto 20px auto",
+                        "width": "fit-content"
                     }
                 ),
-                dcc.Link(
-                    "View Trends",
-                    href="/trend",
+                html.P(
+                    "Discover air quality evolution in Lombardia with historical data analysis and trend visualization", 
                     style={
-                        "padding": "12px 30px",
-                        "fontSize": "1.2rem",
-                        "color": "rgb(19, 129, 159)",
-                        "backgroundColor": "white",
-                        "textDecoration": "none",
-                        "borderRadius": "25px",
-                        "display": "inline-block",
-                        "transition": "all 0.3s ease"
+                        "fontSize": "1.3rem",
+                        "color": "white",
+                        "textShadow": "2px 2px 8px rgba(0,0,0,0.8)",
+                        "maxWidth": "600px",
+                        "margin": "0 auto 30px auto",
+                        "lineHeight": "1.5",
+                        "textAlign": "center"
                     }
-                )
+                ),
+                html.Div([
+                    dcc.Link(
+                        "Explore Map",
+                        href="/map",
+                        style={
+                            "padding": "12px 30px",
+                            "fontSize": "1.2rem",
+                            "color": "white",
+                            "backgroundColor": "rgba(255,255,255,0.2)",
+                            "textDecoration": "none",
+                            "borderRadius": "25px",
+                            "border": "2px solid white",
+                            "marginRight": "15px",
+                            "display": "inline-block",
+                            "transition": "all 0.3s ease"
+                        }
+                    ),
+                    dcc.Link(
+                        "View Trends",
+                        href="/trend",
+                        style={
+                            "padding": "12px 30px",
+                            "fontSize": "1.2rem",
+                            "color": "rgb(19, 129, 159)",
+                            "backgroundColor": "white",
+                            "textDecoration": "none",
+                            "borderRadius": "25px",
+                            "display": "inline-block",
+                            "transition": "all 0.3s ease"
+                        }
+                    )
+                ], style={
+                    "display": "flex",
+                    "justifyContent": "center",
+                    "alignItems": "center",
+                    "gap": "15px",
+                    "marginTop": "30px"
+                })
             ], style={
                 "display": "flex",
+                "flexDirection": "column",
                 "justifyContent": "center",
                 "alignItems": "center",
-                "gap": "15px",
-                "marginTop": "30px"
+                "padding": "100px 20px",
+                "maxWidth": "800px",
+                "margin": "0 auto"
             })
         ], style={
+            "background": "linear-gradient(rgba(0,0,0,0.3), rgba(0,0,0,0.5)), url('https://images.unsplash.com/photo-1506744038136-46273834b3fb')",
+            "backgroundSize": "cover",
+            "backgroundPosition": "center",
+            "color": "white",
+            "minHeight": "70vh",
             "display": "flex",
-            "flexDirection": "column",
-            "justifyContent": "center",
-            "alignItems": "center",
-            "padding": "100px 20px",
-            "maxWidth": "800px",
-            "margin": "0 auto"
-        })
-    ], style={
-        "background": "linear-gradient(rgba(0,0,0,0.3), rgba(0,0,0,0.5)), url('https://images.unsplash.com/photo-1506744038136-46273834b3fb')",
-        "backgroundSize": "cover",
-        "backgroundPosition": "center",
-        "color": "white",
-        "minHeight": "70vh",
-        "display": "flex",
-        "alignItems": "center"
-    }),
+            "alignItems": "center"
+        }),
     
-    # Interactive Dashboard Section
-    html.Div([
-        html.H2(
-            "Interactive Air Quality Dashboard", 
-            style={
-                "textAlign": "center", 
-                "color": "rgb(19, 129, 159)",
-                "marginBottom": "40px",
-                "fontSize": "2.5rem"
-            }
-        ),
-        
-        # Filters Section
+        # Interactive Dashboard Section
         html.Div([
-            html.Div([
-                html.Label("Pollutant Group:", style={"fontWeight": "bold", "marginBottom": "8px", "display": "block"}),
-                dcc.Dropdown(
-                    id="pollutant-group-dropdown",
-                    options=[
-                        {"label": "All Pollutants", "value": "All"},
-                        {"label": "Particulate Matter (PM)", "value": "Particulate Matter"},
-                        {"label": "Nitrogen Compounds (NOx)", "value": "Nitrogen Compounds"},
-                        {"label": "Sulfur and Carbon Compounds", "value": "Sulfur and Carbon Compounds"},
-                        {"label": "Heavy Metals", "value": "Heavy Metals"},
-                        {"label": "Others (Aromatic compounds and Ozone)", "value": "Others"}
-                    ],
-                    value="All",
-                    clearable=False,
-                    style={"fontSize": "14px"}
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
-            
-            html.Div([
-                html.Label("Province:", style={"fontWeight": "bold", "marginBottom": "8px", "display": "block"}),
-                dcc.Dropdown(
-                    id="province-dropdown",
-                    options=[{"label": "All Provinces", "value": "All"}] + 
-                            [{"label": p, "value": p} for p in get_provinces()],
-                    value="All",
-                    clearable=False,
-                    style={"fontSize": "14px"}
-                )
-            ], style={"flex": "1"})
-        ], style={
-            "display": "flex",
-            "backgroundColor": "white",
-            "padding": "25px",
-            "borderRadius": "10px",
-            "boxShadow": "0 4px 12px rgba(0,0,0,0.1)",
-            "marginBottom": "30px"
-        }),
+            html.H2(
+                "Interactive Air Quality Dashboard", 
+                style={
+                    "textAlign": "center", 
+                    "color": "rgb(19, 129, 159)",
+                    "marginBottom": "40px",
+                    "fontSize": "2.5rem"
+                }
+            ),
         
-        # Map and Histogram Row
-        html.Div([
-            # Map Column
+            # Filters Section
             html.Div([
-                html.H3("Station Locations", style={"color": "rgb(19, 129, 159)", "marginBottom": "15px"}),
-                html.Div(id="sensor-map"),
-                html.Div(id="station-info", style={
-                    "marginTop": "10px", 
-                    "color": "#666", 
-                    "fontSize": "14px",
-                    "padding": "10px",
-                    "backgroundColor": "#f8f9fa",
-                    "borderRadius": "5px",
-                    "borderLeft": "4px solid rgb(19, 129, 159)"
-                })
+                html.Div([
+                    html.Label("Pollutant Group:", style={"fontWeight": "bold", "marginBottom": "8px", "display": "block"}),
+                    dcc.Dropdown(
+                        id="pollutant-group-dropdown",
+                        options=[
+                            {"label": "All Pollutants", "value": "All"},
+                            {"label": "Particulate Matter (PM)", "value": "Particulate Matter"},
+                            {"label": "Nitrogen Compounds (NOx)", "value": "Nitrogen Compounds"},
+                            {"label": "Sulfur and Carbon Compounds", "value": "Sulfur and Carbon Compounds"},
+                            {"label": "Heavy Metals", "value": "Heavy Metals"},
+                            {"label": "Others (Aromatic compounds and Ozone)", "value": "Others"}
+                        ],
+                        value="All",
+                        clearable=False,
+                        style={"fontSize": "14px"}
+                    )
+                ], style={"flex": "1", "marginRight": "20px"}),
+            
+                html.Div([
+                    html.Label("Province:", style={"fontWeight": "bold", "marginBottom": "8px", "display": "block"}),
+                    dcc.Dropdown(
+                        id="province-dropdown",
+                        options=[{"label": "All Provinces", "value": "All"}] + 
+                                [{"label": p, "value": p} for p in get_provinces()],
+                        value="All",
+                        clearable=False,
+                        style={"fontSize": "14px"}
+                    )
+                ], style={"flex": "1"})
             ], style={
-                "flex": "1",
-                "marginRight": "20px",
+                "display": "flex",
                 "backgroundColor": "white",
-                "padding": "20px",
+                "padding": "25px",
                 "borderRadius": "10px",
-                "boxShadow": "0 4px 12px rgba(0,0,0,0.1)"
+                "boxShadow": "0 4px 12px rgba(0,0,0,0.1)",
+                "marginBottom": "30px"
             }),
-            
-            # Histogram Column
+        
+            # Map and Histogram Row
             html.Div([
-                html.H3("Sensor Distribution", style={"color": "rgb(19, 129, 159)", "marginBottom": "15px"}),
-                dcc.Graph(id="sensor-histogram", style={"height": "400px"})
-            ], style={
-                "flex": "1",
-                "backgroundColor": "white",
-                "padding": "20px",
-                "borderRadius": "10px",
-                "boxShadow": "0 4px 12px rgba(0,0,0,0.1)"
-            })
-        ], style={"display": "flex", "marginBottom": "40px"})
-    ], style={
-        "maxWidth": "1400px",
-        "margin": "0 auto",
-        "padding": "60px 20px"
-    }),
+                # Map Column
+                html.Div([
+                    html.H3("Station Locations", style={"color": "rgb(19, 129, 159)", "marginBottom": "15px"}),
+                    html.Div(id="sensor-map"),
+                    html.Div(id="station-info", style={
+                        "marginTop": "10px", 
+                        "color": "#666", 
+                        "fontSize": "14px",
+                        "padding": "10px",
+                        "backgroundColor": "#f8f9fa",
+                        "borderRadius": "5px",
+                        "borderLeft": "4px solid rgb(19, 129, 159)"
+                    })
+                ], style={
+                    "flex": "1",
+                    "marginRight": "20px",
+                    "backgroundColor": "white",
+                    "padding": "20px",
+                    "borderRadius": "10px",
+                    "boxShadow": "0 4px 12px rgba(0,0,0,0.1)"
+                }),
+            
+                # Histogram Column
+                html.Div([
+                    html.H3("Sensor Distribution", style={"color": "rgb(19, 129, 159)", "marginBottom": "15px"}),
+                    dcc.Graph(id="sensor-histogram", style={"height": "400px"})
+                ], style={
+                    "flex": "1",
+                    "backgroundColor": "white",
+                    "padding": "20px",
+                    "borderRadius": "10px",
+                    "boxShadow": "0 4px 12px rgba(0,0,0,0.1)"
+                })
+            ], style={"display": "flex", "marginBottom": "40px"})
+        ], style={
+            "maxWidth": "1400px",
+            "margin": "0 auto",
+            "padding": "60px 20px"
+        }),
 
-    # Updated Team Section for pages/home_page.py
-    # Replace the existing team section (around line 280-350) with this code
+        # Updated Team Section for pages/home_page.py
+        # Replace the existing team section (around line 280-350) with this code
 
-    # Team Section with Profile Pictures
-    html.Div([
-        html.H2(
-            "Meet Our Team", 
-            style={
-                "textAlign": "center", 
-                "color": "white",
-                "marginBottom": "50px",
-                "fontSize": "2.5rem"
-            }
-        ),
+        # Team Section with Profile Pictures
         html.Div([
-            # Team Member 1 - Gianluca Bettone
+            html.H2(
+                "Meet Our Team", 
+                style={
+                    "textAlign": "center", 
+                    "color": "white",
+                    "marginBottom": "50px",
+                    "fontSize": "2.5rem"
+                }
+            ),
             html.Div([
+                # Team Member 1 - Gianluca Bettone
                 html.Div([
-                    # Profile Picture or Initials
-                    html.Img(
-                        src="/assets/team/Gianluca.jpg",
-                        style={
-                            "width": "80px",
-                            "height": "80px",
-                            "borderRadius": "50%",
-                            "backgroundColor": "rgba(255,255,255,0.3)",
-                            "display": "flex",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                            "color": "white",
-                            "fontSize": "24px",
-                            "fontWeight": "bold",
-                            "border": "3px solid white",
-                            "marginBottom": "20px",
-                            "margin": "0 auto 20px auto"
-                        }
-                    ),
-                    html.H3("Gianluca Bettoni", style={"color": "white", "margin": "0"})
-                ], style={
-                    "backgroundColor": "rgba(255,255,255,0.1)",
-                    "padding": "30px",
-                    "borderRadius": "15px",
-                    "textAlign": "center",
-                    "height": "160px",
-                    "display": "flex",
-                    "flexDirection": "column",
-                    "justifyContent": "center"
-                })
-            ], style={"flex": "1", "margin": "0 15px"}),
+                    html.Div([
+                        # Profile Picture or Initials
+                        html.Img(
+                            src="/assets/team/Gianluca.jpg",
+                            style={
+                                "width": "80px",
+                                "height": "80px",
+                                "borderRadius": "50%",
+                                "backgroundColor": "rgba(255,255,255,0.3)",
+                                "display": "flex",
+                                "alignItems": "center",
+                                "justifyContent": "center",
+                                "color": "white",
+                                "fontSize": "24px",
+                                "fontWeight": "bold",
+                                "border": "3px solid white",
+                                "marginBottom": "20px",
+                                "margin": "0 auto 20px auto"
+                            }
+                        ),
+                        html.H3("Gianluca Bettoni", style={"color": "white", "margin": "0"})
+                    ], style={
+                        "backgroundColor": "rgba(255,255,255,0.1)",
+                        "padding": "30px",
+                        "borderRadius": "15px",
+                        "textAlign": "center",
+                        "height": "160px",
+                        "display": "flex",
+                        "flexDirection": "column",
+                        "justifyContent": "center"
+                    })
+                ], style={"flex": "1", "margin": "0 15px"}),
             
-            # Team Member 2 - Mobina Faraji
-            html.Div([
+                # Team Member 2 - Mobina Faraji
                 html.Div([
-                    # Profile Picture or Initials
-                    html.Img(
-                        src="/assets/team/Mobina.jpeg",
-                        style={
-                            "width": "80px",
-                            "height": "80px",
-                            "borderRadius": "50%",
-                            "backgroundColor": "rgba(255,255,255,0.3)",
-                            "display": "flex",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                            "color": "white",
-                            "fontSize": "24px",
-                            "fontWeight": "bold",
-                            "border": "3px solid white",
-                            "marginBottom": "20px",
-                            "margin": "0 auto 20px auto"
-                        }
-                    ),
-                    html.H3("Mobina Faraji", style={"color": "white", "margin": "0"})
-                ], style={
-                    "backgroundColor": "rgba(255,255,255,0.1)",
-                    "padding": "30px",
-                    "borderRadius": "15px",
-                    "textAlign": "center",
-                    "height": "160px",
-                    "display": "flex",
-                    "flexDirection": "column",
-                    "justifyContent": "center"
-                })
-            ], style={"flex": "1", "margin": "0 15px"}),
+                    html.Div([
+                        # Profile Picture or Initials
+                        html.Img(
+                            src="/assets/team/Mobina.jpeg",
+                            style={
+                                "width": "80px",
+                                "height": "80px",
+                                "borderRadius": "50%",
+                                "backgroundColor": "rgba(255,255,255,0.3)",
+                                "display": "flex",
+                                "alignItems": "center",
+                                "justifyContent": "center",
+                                "color": "white",
+                                "fontSize": "24px",
+                                "fontWeight": "bold",
+                                "border": "3px solid white",
+                                "marginBottom": "20px",
+                                "margin": "0 auto 20px auto"
+                            }
+                        ),
+                        html.H3("Mobina Faraji", style={"color": "white", "margin": "0"})
+                    ], style={
+                        "backgroundColor": "rgba(255,255,255,0.1)",
+                        "padding": "30px",
+                        "borderRadius": "15px",
+                        "textAlign": "center",
+                        "height": "160px",
+                        "display": "flex",
+                        "flexDirection": "column",
+                        "justifyContent": "center"
+                    })
+                ], style={"flex": "1", "margin": "0 15px"}),
             
-            # Team Member 3 - Alessia Ippolito
-            html.Div([
+                # Team Member 3 - Alessia Ippolito
                 html.Div([
-                    # Profile Picture or Initials
-                    html.Img(
-                        src="/assets/team/Alessia.JPG",
-                        style={
-                            "width": "80px",
-                            "height": "80px",
-                            "borderRadius": "50%",
-                            "backgroundColor": "rgba(255,255,255,0.3)",
-                            "display": "flex",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                            "color": "white",
-                            "fontSize": "24px",
-                            "fontWeight": "bold",
-                            "border": "3px solid white",
-                            "marginBottom": "20px",
-                            "margin": "0 auto 20px auto"
-                        }
-                    ),
-                    html.H3("Alessia Ippolito", style={"color": "white", "margin": "0"})
-                ], style={
-                    "backgroundColor": "rgba(255,255,255,0.1)",
-                    "padding": "30px",
-                    "borderRadius": "15px",
-                    "textAlign": "center",
-                    "height": "160px",
-                    "display": "flex",
-                    "flexDirection": "column",
-                    "justifyContent": "center"
-                })
-            ], style={"flex": "1", "margin": "0 15px"}),
+                    html.Div([
+                        # Profile Picture or Initials
+                        html.Img(
+                            src="/assets/team/Alessia.JPG",
+                            style={
+                                "width": "80px",
+                                "height": "80px",
+                                "borderRadius": "50%",
+                                "backgroundColor": "rgba(255,255,255,0.3)",
+                                "display": "flex",
+                                "alignItems": "center",
+                                "justifyContent": "center",
+                                "color": "white",
+                                "fontSize": "24px",
+                                "fontWeight": "bold",
+                                "border": "3px solid white",
+                                "marginBottom": "20px",
+                                "margin": "0 auto 20px auto"
+                            }
+                        ),
+                        html.H3("Alessia Ippolito", style={"color": "white", "margin": "0"})
+                    ], style={
+                        "backgroundColor": "rgba(255,255,255,0.1)",
+                        "padding": "30px",
+                        "borderRadius": "15px",
+                        "textAlign": "center",
+                        "height": "160px",
+                        "display": "flex",
+                        "flexDirection": "column",
+                        "justifyContent": "center"
+                    })
+                ], style={"flex": "1", "margin": "0 15px"}),
             
-            # Team Member 4 - Edoardo Pessina
-            html.Div([
+                # Team Member 4 - Edoardo Pessina
                 html.Div([
-                    # Profile Picture or Initials
-                    html.Img(
-                        src="/assets/team/Edoardo.jpeg",
-                        style={
-                            "width": "80px",
-                            "height": "80px",
-                            "borderRadius": "50%",
-                            "backgroundColor": "rgba(255,255,255,0.3)",
-                            "display": "flex",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                            "color": "white",
-                            "fontSize": "24px",
-                            "fontWeight": "bold",
-                            "border": "3px solid white",
-                            "marginBottom": "20px",
-                            "margin": "0 auto 20px auto"
-                        }
-                    ),
-                    html.H3("Edoardo Pessina", style={"color": "white", "margin": "0"})
-                ], style={
-                    "backgroundColor": "rgba(255,255,255,0.1)",
-                    "padding": "30px",
-                    "borderRadius": "15px",
-                    "textAlign": "center",
-                    "height": "160px",
-                    "display": "flex",
-                    "flexDirection": "column",
-                    "justifyContent": "center"
-                })
-            ], style={"flex": "1", "margin": "0 15px"})
+                    html.Div([
+                        # Profile Picture or Initials
+                        html.Img(
+                            src="/assets/team/Edoardo.jpeg",
+                            style={
+                                "width": "80px",
+                                "height": "80px",
+                                "borderRadius": "50%",
+                                "backgroundColor": "rgba(255,255,255,0.3)",
+                                "display": "flex",
+                                "alignItems": "center",
+                                "justifyContent": "center",
+                                "color": "white",
+                                "fontSize": "24px",
+                                "fontWeight": "bold",
+                                "border": "3px solid white",
+                                "marginBottom": "20px",
+                                "margin": "0 auto 20px auto"
+                            }
+                        ),
+                        html.H3("Edoardo Pessina", style={"color": "white", "margin": "0"})
+                    ], style={
+                        "backgroundColor": "rgba(255,255,255,0.1)",
+                        "padding": "30px",
+                        "borderRadius": "15px",
+                        "textAlign": "center",
+                        "height": "160px",
+                        "display": "flex",
+                        "flexDirection": "column",
+                        "justifyContent": "center"
+                    })
+                ], style={"flex": "1", "margin": "0 15px"})
+            ], style={
+                "display": "flex",
+                "maxWidth": "1200px",
+                "margin": "0 auto",
+                "flexWrap": "wrap",
+                "gap": "20px"
+            })
         ], style={
-            "display": "flex",
-            "maxWidth": "1200px",
-            "margin": "0 auto",
-            "flexWrap": "wrap",
-            "gap": "20px"
-        })
-    ], style={
-        "backgroundColor": "rgb(19, 129, 159)",
-        "padding": "80px 20px",
-        "marginTop": "40px"
-    }),
+            "backgroundColor": "rgb(19, 129, 159)",
+            "padding": "80px 20px",
+            "marginTop": "40px"
+        }),
 
 
-])
+    ])
 
 # Callback to update the dashboard components based on selected filters
 @callback(
@@ -575,11 +577,11 @@ layout = html.Div([
      Input("province-dropdown", "value")]          # Trigger on province selection change
 )
 def update_dashboard(pollutant_group, province):
-    # Create the updated map filtered and auto-centered based on filters
-    sensor_map = create_filtered_map(pollutant_group, province)
+    # Station data from the shared catalogue (in memory, refreshed in the background)
+    df_stations = station_catalogue.frame()
 
-    # Fetch station data from API or database
-    df_stations = fetch_pollutant()
+    # Create the updated map filtered and auto-centered based on filters
+    sensor_map = create_filtered_map(pollutant_group, province, df_stations)
 
     # === Station information section ===
     try:
@@ -626,6 +628,7 @@ def update_dashboard(pollutant_group, province):
             filtered = filtered[filtered["provincia"] == province]
 
         if not filtered.empty:
+            import plotly.express as px  # loaded on first use, not at startup
             # If multiple provinces present, show sensor distribution by province
             if len(filtered["provincia"].unique()) > 1:
                 counts = filtered["provincia"].value_counts()
@@ -1,162 +1,205 @@
 import dash
-import requests
+from components.http_cache import http_get
+import numpy as np
 import pandas as pd
 from components.logger import logger
 from dash import dcc
 from dash import html, Output, Input, State, no_update
 from components.dropdown_component import create_dropdown
-from components.fetch_pollutant import fetch_pollutant
-import plotly.express as px
+from components.fetch_pollutant import station_catalogue
+from components.province_geometry import geojson_url, provinces
+from components.choropleth import LIMIT_VALUES, MISSING_COLOR, choropleth
+from components.export_service import FORMATS, available_formats, exports
 from datetime import datetime
-import geopandas as gpd
 import dash_leaflet as dl
-from uuid import uuid4
 import os 
-import zipfile
-import io
+import hashlib
 
-province = gpd.read_file('maps/Lombardy_admin2.shp') #shapefile of Lombardy adimn 2 (provinces)
-province = province.to_crs(epsg=4326)  #apply the rigth CRS
+# Province shapes are simplified and cached by components/province_geometry.py: the browser downloads
+# them once per zoom level, callbacks only send the mean per province and the colour scale (`hideout` of the
+# GeoJSON layer, coloured by assets/province_map.js)
+MAP_ZOOM = 7
 
-dash.register_page(__name__, path="/map", name="Map")
+# Class breaks of the province colours (equal_interval, quantile, jenks or limits: WHO/EU thresholds)
+MAP_CLASSIFICATION = os.environ.get("GEOAIR_MAP_CLASSIFICATION", "equal_interval")
+MAP_CLASSES = 4
 
-# funcion to create the dataframe with pollutants for the dropdown
-df_all = fetch_pollutant()
-pollutants = sorted(df_all["nometiposensore"].dropna().unique()) if not df_all.empty else []
+dash.register_page(__name__, path="/map", name="Map")
 
 # layout of the map page
-layout = html.Div([
-    # Store component to manage session data login state
+def layout(**kwargs):
+    """Built at every visit, from the station catalogue (loaded by the warm-up or on first use)."""
+    # pollutants of the dropdown
+    pollutants = station_catalogue.pollutants()
+
+    return html.Div([
+        # Store component to manage session data login state
     
-    html.Div(id="redirect-map"),
-
-    # Page titles
-    html.H2("Air Quality Map", 
-            style={"textAlign": "center",
-                "color": "rgb(19, 129, 159)",
-                "fontSize": "32px",
-                "marginBottom": "10px", 
-                "marginTop": "40px"}),
-    html.H3("Average Pollutant Levels by Province", 
-            style={"textAlign": "center",
-            "color": "#7f8c8d",
-            "fontSize": "16px",
-            "marginBottom": "20px", 
-            "fontWeight": "normal"}),
-
-    # Output area for messages
-    html.Div(
-        id='graph-output',
-        style={
-            'textAlign': 'center',
-            'marginTop': '10px',
-            'marginBottom': '50px',
-            'color': 'red',
-            'fontWeight': 'bold'
-        }
-    ),
-
-    html.Div([
-        # Map container
+        html.Div(id="redirect-map"),
+
+        # Page titles
+        html.H2("Air Quality Map", 
+                style={"textAlign": "center",
+                    "color": "rgb(19, 129, 159)",
+                    "fontSize": "32px",
+                    "marginBottom": "10px", 
+                    "marginTop": "40px"}),
+        html.H3("Average Pollutant Levels by Province", 
+                style={"textAlign": "center",
+                "color": "#7f8c8d",
+                "fontSize": "16px",
+                "marginBottom": "20px", 
+                "fontWeight": "normal"}),
+
+        # Output area for messages
+        html.Div(
+            id='graph-output',
+            style={
+                'textAlign': 'center',
+                'marginTop': '10px',
+                'marginBottom': '50px',
+                'color': 'red',
+                'fontWeight': 'bold'
+            }
+        ),
+
         html.Div([
-            # Leaflet map
-            dl.Map(
-                id="leaflet-map",
-                center=[45.5, 9.2],
-                zoom=7,
-                children=[
-                    dl.TileLayer(id="base-layer"),
-                    dl.LayerGroup(id="layer-province")
-                ],
-                style={"width": "100%", "height": "600px"}
-            ),
-
-            # Download shapefile button
-            html.Button(
-                "Download Shapefile",
-                id="btn-download-shp",
+            # Map container
+            html.Div([
+                # Leaflet map
+                dl.Map(
+                    id="leaflet-map",
+                    center=[45.5, 9.2],
+                    zoom=MAP_ZOOM,
+                    children=[
+                        dl.TileLayer(id="base-layer"),
+                        dl.GeoJSON(
+                            id="layer-province",
+                            url=geojson_url(MAP_ZOOM),
+                            hideout={},
+                            style={"variable": "geoair.provinceStyle"},
+                            onEachFeature={"variable": "geoair.provinceTooltip"}
+                        )
+                    ],
+                    style={"width": "100%", "height": "600px"}
+                ),
+
+                # Export format selector
+                dcc.Dropdown(
+                    id="export-format",
+                    options=[{"label": FORMATS[fmt][0], "value": fmt} for fmt in available_formats()],
+                    value="shapefile",
+                    clearable=False,
+                    style={
+                        "position": "absolute",
+                        "bottom": "70px",
+                        "right": "20px",
+                        "width": "180px",
+                        "zIndex": 1000,
+                        "boxShadow": "0 2px 8px rgba(0,0,0,0.3)"
+                    }
+                ),
+
+                # Download button
+                html.Button(
+                    "Download",
+                    id="btn-download-shp",
+                    style={
+                        "position": "absolute",
+                        "bottom": "20px",
+                        "right": "20px",
+                        "zIndex": 1000,
+                        "color": "white",
+                        "height": "40px",
+                        "borderRadius": "8px",
+                        "padding": "10px 20px",
+                        "backgroundColor": "#007BFF",
+                        "border": "none",
+                        "cursor": "pointer",
+                        "fontWeight": "bold",
+                        "boxShadow": "0 2px 8px rgba(0,0,0,0.3)"
+                    }
+                ),
+                dcc.Download(id="download-shp"),
+                dcc.Store(id="export-job"), # id of the export running in the background
+                dcc.Interval(id="export-poll", interval=1000, disabled=True),
+                html.Div(
+                    id="export-status",
+                    style={
+                        "position": "absolute",
+                        "bottom": "25px",
+                        "right": "150px",
+                        "zIndex": 1000,
+                        "backgroundColor": "white",
+                        "padding": "5px 10px",
+                        "borderRadius": "8px"
+                    }
+                ),
+
+                # Pollutant dropdown selector
+                create_dropdown(pollutants, show_all=False),
+
+                # Date range picker
+                dcc.DatePickerRange(
+                    id="date-picker-range",
+                    min_date_allowed=datetime(2024, 1, 1),
+                    max_date_allowed=datetime(2025, 1, 1),
+                    start_date=datetime(2024, 12, 1),
+                    end_date=datetime(2024, 12, 31),
+                    display_format="DD/MM/YYYY",
+                    style={
+                        "position": "absolute",
+                        "top": "10px",
+                        "left": "100px",
+                        "zIndex": 800,
+                        "backgroundColor": "white",
+                        "display": "flex",
+                        "borderRadius": "8px",
+                        "boxShadow": "0 2px 8px rgba(0,0,0,0.3)",
+                        "marginTop": "10px",
+                        "cursor": "pointer",
+                    }
+                )
+            ], style={"position": "relative"}),
+
+            # Map legend container
+            html.Div(
+                id="map-legend",
                 style={
                     "position": "absolute",
                     "bottom": "20px",
-                    "right": "20px",
-                    "zIndex": 1000,
-                    "color": "white",
-                    "height": "40px",
-                    "borderRadius": "8px",
-                    "padding": "10px 20px",
-                    "backgroundColor": "#007BFF",
-                    "border": "none",
-                    "cursor": "pointer",
-                    "fontWeight": "bold",
-                    "boxShadow": "0 2px 8px rgba(0,0,0,0.3)"
-                }
-            ),
-            dcc.Download(id="download-shp"),
-
-            # Pollutant dropdown selector
-            create_dropdown(pollutants, show_all=False),
-
-            # Date range picker
-            dcc.DatePickerRange(
-                id="date-picker-range",
-                min_date_allowed=datetime(2024, 1, 1),
-                max_date_allowed=datetime(2025, 1, 1),
-                start_date=datetime(2024, 12, 1),
-                end_date=datetime(2024, 12, 31),
-                display_format="DD/MM/YYYY",
-                style={
-                    "position": "absolute",
-                    "top": "10px",
-                    "left": "100px",
-                    "zIndex": 800,
+                    "left": "20px",
+                    "width": "150px",
                     "backgroundColor": "white",
-                    "display": "flex",
-                    "borderRadius": "8px",
+                    "zIndex": 1000,
+                    "fontSize": "14px",
+                    "padding": "10px",
                     "boxShadow": "0 2px 8px rgba(0,0,0,0.3)",
-                    "marginTop": "10px",
-                    "cursor": "pointer",
+                    "borderRadius": "8px",
+                    "display": "none"
                 }
             )
-        ], style={"position": "relative"}),
-
-        # Map legend container
-        html.Div(
-            id="map-legend",
-            style={
-                "position": "absolute",
-                "bottom": "20px",
-                "left": "20px",
-                "width": "150px",
-                "backgroundColor": "white",
-                "zIndex": 1000,
-                "fontSize": "14px",
-                "padding": "10px",
-                "boxShadow": "0 2px 8px rgba(0,0,0,0.3)",
-                "borderRadius": "8px",
-                "display": "none"
-            }
-        )
+        ], style={
+            "position": "relative",
+            "borderRadius": "15px",
+            "overflow": "hidden",
+            "boxShadow": "0 2px 8px rgba(0,0,0,0.2)",
+            "marginBottom": "30px"
+        }),
+
+        # Histogram chart
+        html.Div([
+            dcc.Graph(
+                id="histogram",
+                style={"height": "400px"}
+            )
+        ])
     ], style={
-        "position": "relative",
-        "borderRadius": "15px",
-        "overflow": "hidden",
-        "boxShadow": "0 2px 8px rgba(0,0,0,0.2)",
-        "marginBottom": "30px"
-    }),
-
-    # Histogram chart
-    html.Div([
-        dcc.Graph(
-            id="histogram",
-            style={"height": "400px"}
-        )
-    ])
-], style={
-    "paddingLeft": "20px",
-    "paddingRight": "20px",
-    "maxWidth": "1200px",
-    "margin": "auto"
-})
+        "paddingLeft": "20px",
+        "paddingRight": "20px",
+        "maxWidth": "1200px",
+        "margin": "auto"
+    })
 
 
 
@@ -166,88 +209,63 @@ def fetch_avg_province_pollutant(pollutants, start_date=None, end_date=None):
     """
     Function to fetch pollutant data from the API, filters the data accordingly the time range.
     """
+    return fetch_avg_province_versioned(pollutants, start_date, end_date)[0]
+
+# Same, with the version of the data (validator of the API response, it changes with the data)
+def fetch_avg_province_versioned(pollutants, start_date=None, end_date=None):
     try:
         if pollutants == "Tutti" or pollutants is None:
-            return pd.DataFrame()  # Return empty DataFrame if no pollutant is selected
+            return pd.DataFrame(), None  # Return empty DataFrame if no pollutant is selected
         if not start_date or not end_date:
-            res = requests.get("http://localhost:5001/api/avg_province_time", # if time range not given makes the last 7 days average
-                               params={'pollutant': pollutants})
+            res = http_get("http://localhost:5001/api/avg_province_time", # if time range not given makes the last 7 days average
+                           params={'pollutant': pollutants})
         else:
-            res = requests.get("http://localhost:5001/api/avg_province_time", 
+            res = http_get("http://localhost:5001/api/avg_province_time", 
                            params = {'pollutant': pollutants,'start_date': start_date, 'end_date': end_date})
         df = pd.DataFrame(res.json())
-        return df
+        version = res.headers.get("ETag") or hashlib.sha1(res.content).hexdigest()
+        return df, version
     except Exception as e: # if there is an error in the API request, log the error and return an empty DataFrame
         logger.error(f"Error fetching data: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
 
 # Function to create the province layer with colors based on pollutant values and create the legend
-def create_province_layer_legend(df_pollutant):
+def create_province_layer_legend(df_pollutant, method=MAP_CLASSIFICATION, pollutant=None):
     """
-    Creates a Dash Leaflet FeatureGroup with colored provinces based on pollutant levels,
-    and generates a corresponding legend.
+    Colours the provinces based on pollutant levels and generates a corresponding legend.
 
     Parameters:
         df_pollutant (DataFrame): DataFrame with columns 'provincia' and 'mean' containing
                                   average pollutant levels per province.
+        method (str): class breaks of components/choropleth.py ("limits" needs `pollutant`;
+                      pollutants without limit values fall back to equal intervals)
+        pollutant (str): pollutant of the data
 
     Returns:
         Tuple:
-            - dl.FeatureGroup: Leaflet polygons colored by pollution values
+            - dict: `hideout` of the province GeoJSON layer, {"values": {sigla: mean}, "breaks": [k + 1 bounds],
+                    "colors": [k colours]} (a few hundred bytes)
             - list[html.Div]: HTML legend elements
             - GeoDataFrame: GeoDataFrame merged with pollution data and color mapping
     """
 
-    # Mapping province names (in shapefile) to abbreviations (used in database)
-    nome_to_sigla = {
-        "Milano": "MI", "Bergamo": "BG", "Brescia": "BS",
-        "Como": "CO", "Cremona": "CR", "Lecco": "LC",
-        "Lodi": "LO", "Mantua": "MN", "Monza and Brianza": "MB",
-        "Pavia": "PV", "Sondrio": "SO", "Varese": "VA"
-    }
-
-    # Add the province abbreviation to the shapefile
-    province["sigla"] = province["NAME_2"].map(nome_to_sigla)
-
-    # Join the shapefile with the pollutant data by province abbreviation
-    gdf = province.merge(df_pollutant, left_on="sigla", right_on="provincia", how="left")
+    # Join the province shapes (with their abbreviation) with the pollutant data: a new frame,
+    # the shared shapes are not modified
+    gdf = provinces().merge(df_pollutant, left_on="sigla", right_on="provincia", how="left")
 
-    # Determine the min and max pollution values
-    min_val = gdf["mean"].min()
-    max_val = gdf["mean"].max()
-
-    if pd.isna(min_val) or pd.isna(max_val):
+    means = gdf["mean"].to_numpy(dtype=float)
+    if np.isnan(means).all():
         # If values are missing or undefined, return an empty layer
         logger.warning("Pollution data missing or incomplete. Returning empty layers.")
-        return [], [], gdf
-
-    # Color function from green to yellow to red based on normalized pollution values
-    def get_color(val):
-        if pd.isna(val):
-            return "#cccccc"  # Gray for missing values
-        if max_val - min_val < 1e-6:
-            norm = 0.5  # If all values are identical, use middle of scale
-        else:
-            norm = (val - min_val) / (max_val - min_val)
-        if norm < 0.5:
-            # Green to yellow
-            r = int(255 * norm * 2)
-            g = 255
-        else:
-            # Yellow to red
-            r = 255
-            g = int(255 * (1 - norm) * 2)
-        b = 0
-        return f"#{r:02x}{g:02x}{b:02x}"
+        return {}, [], gdf
 
-    # Create legend intervals
-    legend_values = [min_val + i * (max_val - min_val) / 4 for i in range(5)]
-    legend_ranges = [(legend_values[i], legend_values[i + 1]) for i in range(4)]
-    legend_colors = [get_color((r[0] + r[1]) / 2) for r in legend_ranges]
+    if method == "limits" and pollutant not in LIMIT_VALUES:
+        method = "equal_interval"
+    scale = choropleth(means, method=method, k=MAP_CLASSES, pollutant=pollutant)
 
     # Build HTML legend elements
     legend_elements = [html.P("Pollution Level", style={"margin": "0 0 10px 0", "fontWeight": "bold"})]
-    for (min_r, max_r), color in zip(legend_ranges, legend_colors):
+    for color, label in zip(scale.colors + [MISSING_COLOR], scale.labels + ["No data"]):
         legend_elements.append(
             html.Div([
                 html.Div(style={
@@ -258,66 +276,27 @@ def create_province_layer_legend(df_pollutant):
                     "marginRight": "8px",
                     "display": "inline-block"
                 }),
-                html.Span(f"{min_r:.1f} - {max_r:.1f}", style={"verticalAlign": "top"})
+                html.Span(label, style={"verticalAlign": "top"})
             ], style={"display": "flex", "alignItems": "center", "margin": "3px 0"})
         )
 
-    # Add "No data" to the legend
-    legend_elements.append(
-        html.Div([
-            html.Div(style={
-                "width": "20px",
-                "height": "15px",
-                "backgroundColor": "#cccccc",
-                "border": "1px solid black",
-                "marginRight": "8px",
-                "display": "inline-block"
-            }),
-            html.Span("No data", style={"verticalAlign": "top"})
-        ], style={"display": "flex", "alignItems": "center", "margin": "3px 0"})
-    )
-
-    # Discrete color assignment for each province based on ranges
-    def get_color_discrete(val, ranges, colors):
-        if pd.isna(val):
-            return "#cccccc"
-        for (min_r, max_r), color in zip(ranges, colors):
-            if min_r <= val <= max_r:
-                return color
-        return colors[-1]
-
-    # Assign colors and tooltips to the GeoDataFrame
-    gdf["color"] = [get_color_discrete(val, legend_ranges, legend_colors) for val in gdf["mean"]]
-    gdf["tooltip"] = gdf.apply(
-        lambda row: f"{row['NAME_2']}: {row['mean']:.2f}" if pd.notna(row["mean"]) else f"{row['NAME_2']}: No data",
-        axis=1
-    )
-
-    # Create Leaflet polygons for each province
-    polygons = []
-    for _, row in gdf.iterrows():
-        geom = row["geometry"]
-        coords = []
-        if geom.geom_type == 'Polygon':
-            coords = [[[lat, lon] for lon, lat in geom.exterior.coords]]
-        elif geom.geom_type == 'MultiPolygon':
-            coords = [[[lat, lon] for lon, lat in poly.exterior.coords] for poly in geom.geoms]
-
-        polygon = dl.Polygon(
-            id=f"poly-{uuid4()}",
-            positions=coords,
-            fillColor=row["color"],
-            fillOpacity=0.7,
-            color="black",
-            weight=1,
-            children=[dl.Tooltip(children=row["tooltip"], permanent=False, sticky=True)]
-        )
-        polygons.append(polygon)
-    
+    # Colours and tooltips of the provinces (kept in the exported data)
+    names, siglas = gdf["NAME_2"].tolist(), gdf["sigla"].tolist()
+    gdf["color"] = scale.value_colors
+    gdf["tooltip"] = [f"{name}: {val:.2f}" if not np.isnan(val) else f"{name}: No data" for name, val in zip(names, means)]
+
+    # Values and colour scale of the province layer, by province abbreviation: the shapes stay in the
+    # browser, which colours them and formats the tooltips (assets/province_map.js)
+    hideout = {
+        "values": {sigla: round(float(val), 2) for sigla, val in zip(siglas, means) if not np.isnan(val)},
+        "breaks": [round(float(val), 4) for val in scale.breaks],
+        "colors": scale.colors
+    }
+
     logger.info("Province layer legend created successfully.")
 
-    # Return map layer, legend, and enriched GeoDataFrame
-    return dl.FeatureGroup(children=polygons), legend_elements, gdf
+    # Return layer colours, legend, and enriched GeoDataFrame
+    return hideout, legend_elements, gdf
 
 
 
@@ -326,7 +305,7 @@ def create_province_layer_legend(df_pollutant):
     [Output("histogram", "figure"),
      Output("histogram", "style"), # style to show/hide the histogram
      Output("graph-output", "children"), # message to show when no pollutant is selected
-     Output("layer-province", "children"), # layer of the map with the provinces
+     Output("layer-province", "hideout"), # values and colour scale of the province layer
      Output("map-legend", "children"), 
      Output("map-legend", "style"), # style of the legend show/hide
      Output("redirect-map", "children")], # redirect to login if not logged in
@@ -345,21 +324,21 @@ def update_all(selected_pollutant, start_date, end_date, session_data):
 
     # Check if the user is logged in, if not redirect to login page
     if not session_data or not session_data.get("logged_in"):
-        return {}, {'display': 'none'}, "Please login.", [], [], {"display": "none"}, dcc.Location(href="/login", id="redirect-now")
+        return {}, {'display': 'none'}, "Please login.", {}, [], {"display": "none"}, dcc.Location(href="/login", id="redirect-now")
     else:
         try:
             if selected_pollutant is None: # if no pollutant is selected, print a message and hide the histogram
                 legend_style = {"display": "none"}
-                return {}, {'display': 'none'}, "Please select a pollutant to view the map and the histogram below.", [], [], legend_style, no_update
+                return {}, {'display': 'none'}, "Please select a pollutant to view the map and the histogram below.", {}, [], legend_style, no_update
             
             # Fetch the average pollutant data for the selected pollutant and date range
             df = fetch_avg_province_pollutant(selected_pollutant, start_date, end_date)
             if df.empty: # if the dataframe is empty, print a message and hide the histogram
                 legend_style = {"display": "none"}
-                return {}, {'display': 'none'}, "No data available for the selected pollutant and date range.", [], [], legend_style, no_update
+                return {}, {'display': 'none'}, "No data available for the selected pollutant and date range.", {}, [], legend_style, no_update
             else:
                 # create the province layer and legend
-                layer, legend, _ = create_province_layer_legend(df)
+                layer, legend, _ = create_province_layer_legend(df, pollutant=selected_pollutant)
                 legend_style ={
                     "position": "absolute",         
                 "bottom": "20px",               
@@ -375,6 +354,7 @@ def update_all(selected_pollutant, start_date, end_date, session_data):
 
                 # Create the histogram figure using Plotly Express
                 unit = df["unitamisura"].iloc[0] if "unitamisura" in df.columns else ""
+                import plotly.express as px  # loaded on first use, not at startup
                 fig = px.bar(
                     df,
                     x="provincia",
@@ -392,55 +372,81 @@ def update_all(selected_pollutant, start_date, end_date, session_data):
                     'text': fig.layout.title.text,  # mantiene il testo attuale del titolo
                     'font': {'size': 24, 'family': 'Arial', 'color': 'black', 'weight': 'bold'}}
                 )
-                logger.info(f"Updating map layer with {len(layer.children)} polygons")
+                logger.info(f"Updating map layer values of {len(layer.get('values', {}))} provinces")
                 if not start_date or not end_date:
-                    return fig, {'display': 'block'}, "Showing the last 7 days average. Else insert a time range", layer.children, legend, legend_style, no_update
-                return fig, {'display': 'block'}, "", layer.children, legend, legend_style, no_update
+                    return fig, {'display': 'block'}, "Showing the last 7 days average. Else insert a time range", layer, legend, legend_style, no_update
+                return fig, {'display': 'block'}, "", layer, legend, legend_style, no_update
         
         except Exception as e: # if there is an error in the callback, print the error and hide the histogram
             legend_style = {"display": "none"}
-            return {}, {"display": "none"}, f"Errore: {str(e)}", [], [], legend_style, no_update
+            return {}, {"display": "none"}, f"Errore: {str(e)}", {}, [], legend_style, no_update
         
-# Callback to generate and download the shapefile of the map with the selected pollutant
+# Callback to switch the province shapes to the simplification level of the zoom (each level is downloaded once)
+@dash.callback(
+    Output("layer-province", "url"),
+    Input("leaflet-map", "zoom"),
+    State("layer-province", "url"),
+    prevent_initial_call=True
+)
+def update_province_detail(zoom, current_url):
+    url = geojson_url(zoom)
+    return no_update if url == current_url else url
+
+# Callback to export the map data with the selected pollutant (shapefile, GeoPackage, GeoParquet or GeoJSON):
+# downloaded directly when ready within a few seconds, otherwise built in the background and linked
 @dash.callback(
-    Output("download-shp", "data"), # output to download the shapefile
-    Input("btn-download-shp", "n_clicks"), # button to download the shapefile
-    [State("pollutant-selector", "value"),
+    [Output("download-shp", "data"), # output to download the export
+     Output("export-job", "data"), # export still running in the background
+     Output("export-poll", "disabled"),
+     Output("export-status", "children")],
+    Input("btn-download-shp", "n_clicks"), # button to download the export
+    [State("export-format", "value"),
+     State("pollutant-selector", "value"),
      State("date-picker-range", "start_date"),
      State("date-picker-range", "end_date")],
     prevent_initial_call=True, # prevent the callback from being called on page load
 )
-def genera_shapefile(n_clicks, selected_pollutant, start_date, end_date):
+def genera_export(n_clicks, export_format, selected_pollutant, start_date, end_date):
 
-    if not selected_pollutant: # if no pollutant is selected, do not generate the shapefile
-        return dash.no_update
+    if not selected_pollutant: # if no pollutant is selected, do not generate the export
+        return no_update, no_update, no_update, no_update
     try:
-        df = fetch_avg_province_pollutant(selected_pollutant, start_date, end_date)
-        if df.empty: # if the dataframe is empty, do not generate the shapefile
-            return dash.no_update
-        # create the province layer and legend
-        _, _, gdf = create_province_layer_legend(df)
-
-        temp_dir = "temp_shp" # temporary directory to store the shapefile
-        os.makedirs(temp_dir, exist_ok=True) # create the directory if it does not exist
-
-        gdf.to_file(os.path.join(temp_dir, "GeoAir_map.shp")) # save the GeoDataFrame to a shapefile
-
-        zip_buffer = io.BytesIO() # create a buffer to store the zip file
-        # Create a zip file in memory
-        with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for fname in os.listdir(temp_dir):
-                file_path = os.path.join(temp_dir, fname)
-                zipf.write(file_path, arcname=fname)
-        # Clean up the temporary directory
-        for fname in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, fname))
-        os.rmdir(temp_dir)
-
-        zip_buffer.seek(0) # reset the buffer position to the beginning
-        return dcc.send_bytes(zip_buffer.read(), filename="GeoAir_map.zip")
-
-    except Exception as e: # if there is an error in the shapefile generation, print the error and return no update
-        logger.error(f"Error in the shapefile download: {e}")
-        return dash.no_update
-
+        df, version = fetch_avg_province_versioned(selected_pollutant, start_date, end_date)
+        if df.empty: # if the dataframe is empty, do not generate the export
+            return no_update, None, True, "No data to export."
+
+        extension = FORMATS[export_format][1]
+        job = exports.submit(
+            ("provinces", selected_pollutant, start_date, end_date, version), export_format,
+            # the province shapes with the averages, colours and tooltips of the map
+            build=lambda: create_province_layer_legend(df, pollutant=selected_pollutant)[2],
+            filename=f"GeoAir_map.{extension}"
+        )
+        if not exports.wait(job):
+            return no_update, job.id, False, "Preparing the export..."
+        body = exports.result(job)
+        if body is None:
+            return no_update, None, True, f"Export failed: {job.error}"
+        return dcc.send_bytes(body, filename=job.filename), None, True, ""
+
+    except Exception as e: # if there is an error in the export, print the error and return no update
+        logger.error(f"Error in the export download: {e}")
+        return no_update, None, True, f"Export failed: {e}"
+
+# Callback to show the download link of an export built in the background
+@dash.callback(
+    [Output("export-status", "children", allow_duplicate=True),
+     Output("export-poll", "disabled", allow_duplicate=True)],
+    Input("export-poll", "n_intervals"),
+    State("export-job", "data"),
+    prevent_initial_call=True,
+)
+def poll_export(n_intervals, job_id):
+    job = exports.job(job_id) if job_id else None
+    if job is None:
+        return "", True
+    if job.status == "running":
+        return no_update, False
+    if job.status == "failed":
+        return f"Export failed: {job.error}", True
+    return html.A(f"Download {job.filename}", href=job.url), True
@@ -1,7 +1,18 @@
 from flask import Flask, jsonify, request
-import psycopg2
-import pandas as pd
+import os
 import warnings
+from urllib.parse import urlencode
+
+from database.pool import ConnectionPool, PoolTimeout
+from database import queries
+from database.rollup import rollups_available, to_timestamp
+from database.cache import ResultCache, create_backend
+from database.versions import DataVersions
+from database.analytics import create_analytics_backend
+from database.storage import create_storage
+from components.response_format import dataframe_response, streaming_response
+from components.http_cache import compress_response, conditional
+from components.metrics import REGISTRY, gauges, instrument
 
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -16,29 +27,178 @@ warnings.filterwarnings(
 
 app = Flask(__name__)
 
+# Shared connection pool: connections are reused across requests instead of opening one per call
+pool = ConnectionPool(
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    check_interval=float(os.environ.get("DB_POOL_CHECK_INTERVAL", 30)),
+    host="localhost",
+    database="lombardia_air_quality",
+    user="airdata_user",
+    password="user"
+)
+
+# Where the API reads its data: GEOAIR_STORAGE=postgres (default, through the pool above)
+# or embedded (a DuckDB file at GEOAIR_EMBEDDED_PATH, built by `python -m database.embedded`)
+storage = create_storage(os.environ.get("GEOAIR_STORAGE", "postgres"), pool)
+
+# Rows per batch when streaming large results from a server-side cursor
+STREAM_BATCH_SIZE = int(os.environ.get("GEOAIR_STREAM_BATCH", 10000))
+
+# Route aggregate endpoints to the rollup tables once they are built (GEOAIR_ROLLUPS=0 to disable)
+USE_ROLLUPS = os.environ.get("GEOAIR_ROLLUPS", "1") != "0"
+
+# Largest page a client can ask for with `limit=`
+MAX_PAGE_SIZE = int(os.environ.get("GEOAIR_MAX_PAGE_SIZE", 50000))
+
+# Result cache of the read endpoints, invalidated when ingestion bumps the data versions
+# (GEOAIR_CACHE=memory|sqlite|off; sqlite shares the cache between the API processes of a host)
+data_versions = DataVersions(storage, check_interval=float(os.environ.get("GEOAIR_VERSION_CHECK_INTERVAL", 5)))
+CACHE_TTLS = {
+    "provinces": 24 * 3600,
+    "stations": 3600,
+    "avg_province_time": 600,
+    "measurements_filters": 600,
+    "measurements_pollutants": 600,
+}
+result_cache = ResultCache(
+    create_backend(
+        os.environ.get("GEOAIR_CACHE", "memory"),
+        max_entries=int(os.environ.get("GEOAIR_CACHE_SIZE", 512)),
+        path=os.environ.get("GEOAIR_CACHE_PATH")
+    ),
+    versions=data_versions,
+    ttls=CACHE_TTLS
+)
+
+# HTTP caching policy per endpoint: clients may reuse a response for max-age seconds, then
+# revalidate it with its ETag (derived from the data versions) and get a bodiless 304 if unchanged
+CACHE_CONTROL = {
+    "provinces": "public, max-age=3600",
+    "stations": "public, max-age=300",
+    "measurements": "no-cache",
+    "measurements_filters": "public, max-age=60",
+    "measurements_pollutants": "public, max-age=60",
+    "avg_province_time": "public, max-age=60",
+}
+
+# Backend of the analytical endpoints (/api/measurements_filters, /api/avg_province_time):
+# GEOAIR_ANALYTICS=database (default: the storage above) or duckdb to answer them from the Parquet export
+# in GEOAIR_LAKE_PATH
+analytics = create_analytics_backend(
+    os.environ.get("GEOAIR_ANALYTICS", "database"),
+    storage,
+    use_rollups=USE_ROLLUPS
+)
+
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = int(os.environ.get("GEOAIR_COMPRESS_MIN_SIZE", 1024))
+
+# Prometheus metrics at /metrics: requests, latency and size per route, DB time and rows per route,
+# plus the pool and result cache read at scrape time; slow requests are logged (GEOAIR_SLOW_REQUEST_MS)
+instrument(app, "api")
+
+
+@REGISTRY.collector
+def storage_metrics():
+    return gauges("geoair_pool", "Storage connections", storage.stats())
+
+
+@REGISTRY.collector
+def result_cache_metrics():
+    stats = result_cache.stats()
+    endpoints = stats["endpoints"].items()
+    return [
+        ("geoair_result_cache_entries", "gauge", "Results held by the result cache", [({}, stats["entries"])]),
+        ("geoair_result_cache_hits_total", "counter", "Result cache hits",
+         [({"endpoint": name}, c["hits"]) for name, c in endpoints]),
+        ("geoair_result_cache_misses_total", "counter", "Result cache misses",
+         [({"endpoint": name}, c["misses"]) for name, c in endpoints]),
+        ("geoair_result_cache_hit_ratio", "gauge", "Share of lookups answered from the result cache",
+         [({"endpoint": name}, c["hit_ratio"]) for name, c in endpoints if c["hit_ratio"] is not None]),
+    ]
+
+
 def db_connection():
-    conn = psycopg2.connect(
-        host="localhost",
-        database="lombardia_air_quality",
-        user="airdata_user",
-        password="user"
-    )
-    return conn
+    """Borrow a storage connection: use as `with db_connection() as conn:` so it is always returned."""
+    return storage.connection()
+
+
+def page_arguments(allowed_fields, keys):
+    """
+    Parse the `fields`, `limit` and `cursor` query parameters of a paginated endpoint.
+    Raises ValueError on unknown fields, a bad limit or an invalid cursor.
+    """
+    fields = request.args.get('fields', default=None, type=str)
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    limit = request.args.get('limit', default=None, type=str)
+    if limit is not None:
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        limit = int(limit)
+
+    cursor = request.args.get('cursor', default=None, type=str)
+    after = queries.decode_cursor(cursor, keys) if cursor else None
+    return fields or None, after, limit
+
+
+def date_arguments():
+    """
+    The `start_date` and `end_date` query parameters as 'YYYY-MM-DD HH:MM:SS' (None when absent).
+    Raises ValueError on a value that is not a date, before it reaches the SQL.
+    """
+    dates = []
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name, default=None, type=str)
+        try:
+            parsed = to_timestamp(value)
+        except (ValueError, OverflowError):
+            raise ValueError(f"Invalid {name} '{value}': expected a date such as 2024-12-01")
+        dates.append(parsed.isoformat(sep=' ') if parsed else None)
+    return dates
+
+
+def with_next_cursor(response, next_cursor):
+    """Advertise the next page in the X-Next-Cursor and Link headers (body formats stay unchanged)."""
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+@app.after_request
+def finalize_response(response):
+    # Endpoints without a caching policy (login, monitoring) must not be stored
+    response.headers.setdefault("Cache-Control", "no-store")
+    return compress_response(response, request, COMPRESS_MIN_SIZE)
+
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    # All connections busy: tell the client to retry instead of queueing forever
+    return jsonify({'error': str(e)}), 503
 
 
 def check_user_exists(username):
-    conn = db_connection()
-    cursor = conn.cursor()
-    query = "SELECT * FROM users WHERE username = %s"
-    cursor.execute(query, (username,))
-    result = cursor.fetchone()
-    cursor.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = "SELECT * FROM users WHERE username = %s"
+        cursor.execute(query, (username,))
+        result = cursor.fetchone()
+        cursor.close()
     return 1 if result else 0
 
 # Login
 @app.route('/api/login', methods=['POST'])
 def login():
-    conn = db_connection()
     data = request.get_json()
     username_or_email = data.get('username')
     password = data.get('password')
@@ -46,11 +206,12 @@ def login():
     if not username_or_email or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    cursor = conn.cursor()
-    query = "SELECT username, email, password FROM users WHERE username = %s OR email = %s"
-    cursor.execute(query, (username_or_email, username_or_email))
-    user = cursor.fetchone()
-    cursor.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = "SELECT username, email, password FROM users WHERE username = %s OR email = %s"
+        cursor.execute(query, (username_or_email, username_or_email))
+        user = cursor.fetchone()
+        cursor.close()
 
     if not user:
         # Username/email not found
@@ -73,7 +234,6 @@ def login():
 
 @app.route('/api/signin', methods=['POST'])
 def signin():
-    conn = db_connection()
     data = request.get_json()
     username = data.get('username')
     email = data.get('email')
@@ -82,26 +242,27 @@ def signin():
     if not username or not email or not password:
         return jsonify({"message": "All fields are required"}), 400
 
-    cursor = conn.cursor()
-    query = "SELECT 1 FROM users WHERE username = %s OR email = %s"
-    cursor.execute(query, (username, email))
-    if cursor.fetchone():
-        cursor.close()
-        return jsonify({"message": "Username or email already exists"}), 409
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = "SELECT 1 FROM users WHERE username = %s OR email = %s"
+        cursor.execute(query, (username, email))
+        if cursor.fetchone():
+            cursor.close()
+            return jsonify({"message": "Username or email already exists"}), 409
 
 
-    # Store password in plain text
-    query = "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)"
-    cursor.execute(query, (username, email, password))
+        # Store password in plain text
+        query = "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)"
+        cursor.execute(query, (username, email, password))
 
-    # Password hashing for storage (commented out)
-    # hashed_password = generate_password_hash(password)
-    # query = "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)"
-    # cursor.execute(query, (username, email, hashed_password))
+        # Password hashing for storage (commented out)
+        # hashed_password = generate_password_hash(password)
+        # query = "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)"
+        # cursor.execute(query, (username, email, hashed_password))
 
 
-    conn.commit()
-    cursor.close()
+        conn.commit()
+        cursor.close()
 
     return jsonify({"message": "Signup successful"}), 200
 
@@ -109,75 +270,110 @@ def signin():
 
     
 @app.route('/api/provinces', methods=['GET'])
+@conditional(data_versions, ("station",), CACHE_CONTROL["provinces"])
 def get_provinces():
     """
     Fetch distinct provinces from the database.
     This endpoint returns a list of distinct provinces from the station table sorted in alphabetical order.
     """
+    def load():
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(queries.PROVINCES_QUERY)
+            provinces = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+        return provinces
+
     try:
-        conn = db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT provincia FROM station ORDER BY provincia")
-        provinces = [row[0] for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
+        provinces = result_cache.get_or_compute("provinces", {}, load, datasets=("station",))
         return jsonify(provinces)
+    except PoolTimeout:
+        raise  # answered 503 by handle_pool_timeout
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/stations', methods=['GET'])
+@conditional(data_versions, ("station",), CACHE_CONTROL["stations"])
 def get_stations():
     pollutant = request.args.get('pollutant', default=None, type=str)  # load parameter
-    
     try:
-        conn = db_connection()
-        
-        if pollutant:
-            query = """
-                SELECT nomestazione, lat, lng, nometiposensore, idsensore, provincia
-                FROM station
-                WHERE lat IS NOT NULL AND lng IS NOT NULL
-                AND nometiposensore = %s;
-            """
-            df = pd.read_sql_query(query, conn, params=(pollutant,))
-        else:
-            query = """
-                SELECT nomestazione, lat, lng, nometiposensore, idsensore, provincia
-                FROM station
-                WHERE lat IS NOT NULL AND lng IS NOT NULL;
-            """
-            df = pd.read_sql_query(query, conn)
-        
-        conn.close()
+        fields, after, limit = page_arguments(queries.STATION_FIELDS, queries.STATION_KEYS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def load():
+        query, params = queries.stations_query(pollutant, fields, after, limit)
+        with db_connection() as conn:
+            df = storage.read_sql(conn, query, params)
+        return queries.split_page(df, limit, queries.STATION_KEYS, fields)
+
+    try:
+        df, next_cursor = result_cache.get_or_compute(
+            "stations",
+            {"pollutant": pollutant, "fields": fields, "cursor": request.args.get('cursor'), "limit": limit},
+            load, datasets=("station",)
+        )
         data = df.to_dict(orient='records')
-        return jsonify(data)
+        return with_next_cursor(jsonify(data), next_cursor)
+    except PoolTimeout:
+        raise  # answered 503 by handle_pool_timeout
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 
 @app.route('/api/measurements', methods=['GET'])
+@conditional(data_versions, ("measurement",), CACHE_CONTROL["measurements"])
 def get_measurements():
-    idsensore = request.args.get('idsensore', default=None, type=str)
+    # One or more sensors: ?idsensore=A&idsensore=B
+    idsensore = [s for s in request.args.getlist('idsensore') if s]
+    stream = request.args.get('stream', default=None, type=str)
+    # align=1: one row per timestamp, one column per sensor
+    align = request.args.get('align', default=None, type=str) not in (None, '', '0')
+    try:
+        fields, after, limit = page_arguments(queries.MEASUREMENT_FIELDS, queries.MEASUREMENT_KEYS)
+        start_date, end_date = date_arguments()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if align and (not idsensore or stream or limit is not None or after is not None):
+        return jsonify({'error': "align needs 'idsensore' and cannot be paginated or streamed"}), 400
+    if align:
+        fields = None  # the aligned table has its own columns (data + one per sensor)
 
     try:
-        conn = db_connection()
+        query, params = queries.measurements_query(idsensore, fields, after, limit, start_date, end_date)
 
-        base_query = "SELECT idsensore, data, valore, stato, idoperatore FROM measurement WHERE stato = 'VA' "
-        params = []
+        if limit is None and (not idsensore or stream):
+            # Unbounded result: stream batches from a server-side cursor instead of loading everything
+            batches, release = storage.stream(query, params, STREAM_BATCH_SIZE)
+            try:
+                if fields:
+                    # drop the keyset columns added for a `cursor` without `limit`
+                    batches = (batch[fields] for batch in batches)
+                response = streaming_response(batches, request)
+            except Exception:
+                release()
+                raise
+            # the connection is released when the response is closed, even if the client disconnects
+            response.call_on_close(release)
+            return response
 
-        if idsensore:
-            base_query += " AND idsensore = %s"
-            params.append(idsensore)
+        with db_connection() as conn:
+            df = storage.read_sql(conn, query, params)
 
-        base_query += " ORDER BY data ASC"
+        # With `limit` the look-ahead row tells whether there is a next page
+        df, next_cursor = queries.split_page(df, limit, queries.MEASUREMENT_KEYS, fields)
 
-        df = pd.read_sql_query(base_query, conn, params=tuple(params))
-        conn.close()
+        if align:
+            df = queries.align_series(df)
 
-        data = df.to_dict(orient='records')
-        return jsonify(data)
+        # JSON records by default, columnar JSON / Arrow / Parquet on request
+        return with_next_cursor(dataframe_response(df, request), next_cursor)
+
+    except PoolTimeout:
+
+        raise  # answered 503 by handle_pool_timeout
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -185,102 +381,114 @@ def get_measurements():
 
 
 @app.route('/api/measurements_filters', methods=['GET'])
+@conditional(data_versions, analytics.datasets, CACHE_CONTROL["measurements_filters"])
 def get_measurements_filters():
     # Get query parameters from URL
     provincia = request.args.get('provincia', type=str)
     pollutant = request.args.get('pollutant', type=str)
-    start_date = request.args.get('start_date', type=str)
-    end_date = request.args.get('end_date', type=str)
+    try:
+        start_date, end_date = date_arguments()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    def load():
+        # Postgres (on the hourly rollup when available) or the Parquet export, depending on the backend
+        return analytics.measurements_filters(provincia, pollutant, start_date, end_date)
 
     try:
-        conn = db_connection()
-        params = []
-
-        # Build SELECT and GROUP BY clauses dynamically depending on presence of 'provincia'
-        if provincia:
-            # Include province in SELECT and group by it
-            select_clause = "SELECT m.data, AVG(m.valore) AS valore, s.provincia"
-            group_by_clause = "GROUP BY m.data, s.provincia"
-        else:
-            # Exclude province if not specified in input
-            select_clause = "SELECT m.data, AVG(m.valore) AS valore"
-            group_by_clause = "GROUP BY m.data"
-
-        # Base SQL query with JOIN between measurement and station
-        base_query = f"""
-            {select_clause}
-            FROM measurement m
-            JOIN station s ON m.idsensore = s.idsensore
-            WHERE m.stato = 'VA'
-        """
-
-        # Add optional filters dynamically
-        if provincia:
-            base_query += " AND s.provincia = %s"
-            params.append(provincia)
-
-        if pollutant:
-            base_query += " AND s.nometiposensore = %s"
-            params.append(pollutant)
-
-        if start_date:
-            base_query += " AND m.data >= %s"
-            params.append(start_date)
-
-        if end_date:
-            base_query += " AND m.data <= %s"
-            params.append(end_date)
-
-        # Finalize the query with GROUP BY and ORDER BY
-        base_query += f" {group_by_clause} ORDER BY m.data"
-
-        # Execute query and convert to JSON
-        df = pd.read_sql_query(base_query, conn, params=params)
-        conn.close()
-
-        return jsonify(df.to_dict(orient='records'))
-
+        df = result_cache.get_or_compute(
+            "measurements_filters",
+            {"provincia": provincia, "pollutant": pollutant, "start_date": start_date, "end_date": end_date},
+            load, datasets=analytics.datasets
+        )
+        return dataframe_response(df, request)
+
+    except PoolTimeout:
+        raise  # answered 503 by handle_pool_timeout
     except Exception as e:
         # Return error message in case of failure
         return jsonify({'error': str(e)}), 500
 
 
+# Endpoint to get the series of several pollutants at once (one grouped query instead of one request each)
+@app.route('/api/measurements_pollutants', methods=['GET'])
+@conditional(data_versions, ("station", "measurement"), CACHE_CONTROL["measurements_pollutants"])
+def get_measurements_pollutants():
+    # Repeated parameter: ?pollutant=A&pollutant=B
+    pollutants = sorted({p for p in request.args.getlist('pollutant') if p})
+    provincia = request.args.get('provincia', type=str)
+    if not pollutants:
+        return jsonify({'error': "At least one 'pollutant' is required"}), 400
+    try:
+        start_date, end_date = date_arguments()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def load():
+        with db_connection() as conn:
+            query, params = queries.measurements_pollutants_query(
+                pollutants, provincia, start_date, end_date,
+                use_rollups=USE_ROLLUPS and rollups_available(conn)
+            )
+            return storage.read_sql(conn, query, params)
+
+    try:
+        df = result_cache.get_or_compute(
+            "measurements_pollutants",
+            {"pollutant": pollutants, "provincia": provincia, "start_date": start_date, "end_date": end_date},
+            load
+        )
+        return dataframe_response(df, request)
+
+    except PoolTimeout:
+
+        raise  # answered 503 by handle_pool_timeout
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 
-    
 
 # Endpoint to get average pollutant values by province and time in map page   
 @app.route('/api/avg_province_time', methods=['GET'])
+@conditional(data_versions, analytics.datasets, CACHE_CONTROL["avg_province_time"])
 def get_data_by_time():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
     pollutant = request.args.get('pollutant', default='Ossidi di Azoto')
+    try:
+        start_date, end_date = date_arguments()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def load():
+        # No time range: average of the last 7 days of available data
+        return analytics.avg_province(pollutant, start_date, end_date).to_dict(orient='records')
 
     try:
-        conn = db_connection()
-        if not start_date or not end_date:
-            query = """
-                SELECT s.unitamisura, s.provincia, AVG(m.valore) as mean
-                FROM measurement as m JOIN station as s ON m.idsensore = s.idsensore
-                WHERE s.nometiposensore = %s AND m.data >= (SELECT MAX(data) FROM measurement) - INTERVAL '7 days' 
-                AND m.stato = 'VA'
-                GROUP BY s.provincia, s.unitamisura;
-                """
-            df = pd.read_sql_query(query, conn, params=(pollutant,))    
-        else:
-            query = """
-                SELECT s.unitamisura, s.provincia, AVG(m.valore) as mean
-                FROM measurement as m JOIN station as s ON m.idsensore = s.idsensore
-                WHERE s.nometiposensore = %s AND m.data >= %s AND m.data <= %s
-                AND m.stato = 'VA'
-                GROUP BY s.provincia, s.unitamisura;
-            """
-            df = pd.read_sql_query(query, conn, params=(pollutant, start_date, end_date))
-        conn.close()
-        return jsonify(df.to_dict(orient='records'))
+        records = result_cache.get_or_compute(
+            "avg_province_time",
+            {"pollutant": pollutant, "start_date": start_date, "end_date": end_date},
+            load, datasets=analytics.datasets
+        )
+        return jsonify(records)
+    except PoolTimeout:
+        raise  # answered 503 by handle_pool_timeout
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
 
+# Endpoint to monitor the database connection pool (connections in use, waiting requests, checkout latency)
+@app.route('/api/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(storage.stats())
+
+
+# Endpoint to monitor the result cache (hits and misses per endpoint, cached entries, data versions)
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    stats = result_cache.stats()
+    stats["data_versions"] = {name: v.version for name, v in data_versions.current().items()}
+    return jsonify(stats)
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)